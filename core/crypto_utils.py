@@ -1,10 +1,37 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import hmac
 import os
-from cryptography.fernet import Fernet  # type: ignore
+import re
+import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken  # type: ignore
 
 _KEY_ENV = "TRACKING_APP_SECRET_KEY"
+# Comma-separated keys that were current before a rotation; used for decryption only
+_OLD_KEYS_ENV = "TRACKING_APP_PREVIOUS_KEYS"
+
+# Ciphertexts are stored as "k:<key id>:<fernet token>" so the key that wrote a
+# value is known without trial decryption. Unprefixed tokens are legacy.
+_VERSION_PREFIX = "k:"
+
+# Fernet objects are cached per key; building one per value dominated list decryption
+_CIPHERS: dict[bytes, Fernet] = {}
+_MULTI: dict[Tuple[bytes, ...], MultiFernet] = {}
+_CIPHER_LOCK = threading.Lock()
+
+# Words shorter than this are not indexed (too many matches, too guessable)
+MIN_TOKEN_LEN = 2
+_WORD_RE = re.compile(r"\w+")
+
+# Lists shorter than this are processed inline; thread start-up is not worth it
+PARALLEL_THRESHOLD = 2000
+_CHUNK = 1000
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
 
 
 def _get_key() -> bytes:
@@ -18,15 +45,124 @@ def _get_key() -> bytes:
     return base64.urlsafe_b64encode(b"tracking-app-demo-key-32bytes!!")
 
 
+def _get_keys() -> List[bytes]:
+    """Current key first, then previous keys (for decrypting older values)."""
+    keys = [_get_key()]
+    for k in (os.environ.get(_OLD_KEYS_ENV) or "").split(","):
+        k = k.strip()
+        if k and k.encode("utf-8") not in keys:
+            keys.append(k.encode("utf-8"))
+    return keys
+
+
+def key_id(key: Optional[bytes] = None) -> str:
+    """Short, non-secret fingerprint identifying a key in stored ciphertexts."""
+    return hashlib.sha256(key if key is not None else _get_key()).hexdigest()[:8]
+
+
+def _fernet(key: bytes) -> Fernet:
+    f = _CIPHERS.get(key)
+    if f is None:
+        with _CIPHER_LOCK:
+            f = _CIPHERS.get(key)
+            if f is None:
+                f = Fernet(key)
+                _CIPHERS[key] = f
+    return f
+
+
 def _cipher() -> Fernet:
-    return Fernet(_get_key())
+    return _fernet(_get_key())
+
+
+def _multi() -> MultiFernet:
+    """MultiFernet over current + previous keys (encrypts with the current one)."""
+    keys = tuple(_get_keys())
+    m = _MULTI.get(keys)
+    if m is None:
+        fernets = []
+        for k in keys:
+            try:
+                fernets.append(_fernet(k))
+            except Exception:
+                continue
+        m = MultiFernet(fernets)
+        with _CIPHER_LOCK:
+            _MULTI[keys] = m
+    return m
+
+
+def _split(value: str) -> Tuple[Optional[str], str]:
+    """Return (key id or None for legacy tokens, bare fernet token)."""
+    if value.startswith(_VERSION_PREFIX):
+        kid, sep, token = value[len(_VERSION_PREFIX):].partition(":")
+        if sep:
+            return kid, token
+    return None, value
+
+
+def looks_encrypted(value: Optional[str]) -> bool:
+    """True for versioned values and bare Fernet tokens (which start with version byte 0x80)."""
+    if not value:
+        return False
+    kid, token = _split(value)
+    return kid is not None or token.startswith("gAAAAA")
+
+
+def needs_rotation(value: Optional[str]) -> bool:
+    """True if a stored value was not written with the current key (or is not encrypted)."""
+    if not value:
+        return False
+    kid, _ = _split(value)
+    return kid != key_id()
+
+
+def _decrypt_token(kid: Optional[str], token: str) -> str:
+    if kid is not None:
+        for k in _get_keys():
+            if key_id(k) == kid:
+                return _fernet(k).decrypt(token.encode("utf-8")).decode("utf-8")
+    return _multi().decrypt(token.encode("utf-8")).decode("utf-8")
+
+
+def rotate_value(value: Optional[str]) -> Optional[str]:
+    """Re-encrypt a stored value with the current key.
+
+    Returns the new stored value, or None if nothing needs to change or the
+    value is a token that none of the configured keys can open (left as is
+    rather than double-encrypted). Plaintext legacy values get encrypted.
+    """
+    if not value or not needs_rotation(value):
+        return None
+    kid, token = _split(value)
+    try:
+        if kid is None:
+            new_token = _multi().rotate(token.encode("utf-8")).decode("utf-8")
+        else:
+            new_token = _cipher().encrypt(_decrypt_token(kid, token).encode("utf-8")).decode("utf-8")
+    except InvalidToken:
+        if looks_encrypted(value):
+            return None
+        new_token = _cipher().encrypt(value.encode("utf-8")).decode("utf-8")
+    return f"{_VERSION_PREFIX}{key_id()}:{new_token}"
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _CIPHER_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 2)),
+                                               thread_name_prefix="crypto")
+    return _EXECUTOR
 
 
 def encrypt_str(value: str | None) -> str:
     if not value:
         return ""
     try:
-        return _cipher().encrypt(value.encode("utf-8")).decode("utf-8")
+        token = _cipher().encrypt(value.encode("utf-8")).decode("utf-8")
+        return f"{_VERSION_PREFIX}{key_id()}:{token}"
     except Exception:
         return value
 
@@ -35,6 +171,68 @@ def decrypt_str(value: str | None) -> str:
     if not value:
         return ""
     try:
-        return _cipher().decrypt(value.encode("utf-8")).decode("utf-8")
+        kid, token = _split(value)
+        return _decrypt_token(kid, token)
     except Exception:
         return value or ""
+
+
+def _map(fn, values: List[Optional[str]]) -> List[str]:
+    if len(values) < PARALLEL_THRESHOLD:
+        return [fn(v) for v in values]
+    chunks = [values[i:i + _CHUNK] for i in range(0, len(values), _CHUNK)]
+    out: List[str] = []
+    for part in _executor().map(lambda c: [fn(v) for v in c], chunks):
+        out.extend(part)
+    return out
+
+
+def encrypt_many(values: Iterable[Optional[str]]) -> List[str]:
+    """Encrypt a list of strings, fanning out across a thread pool for large lists."""
+    return _map(encrypt_str, list(values))
+
+
+def decrypt_many(values: Iterable[Optional[str]]) -> List[str]:
+    """Decrypt a list of tokens (same semantics as decrypt_str), in parallel for large lists."""
+    return _map(decrypt_str, list(values))
+
+
+def _index_key() -> bytes:
+    # Separate from the encryption key so index hashes reveal nothing about it
+    return hashlib.sha256(b"tracking-app-blind-index:" + _get_key()).digest()
+
+
+def normalize_words(text: Optional[str]) -> List[str]:
+    """Case-folded, accent-stripped words of ``text`` (unique, in order)."""
+    if not text or not isinstance(text, str):
+        return []
+    t = unicodedata.normalize("NFKD", text.casefold())
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    words = [w for w in _WORD_RE.findall(t) if len(w) >= MIN_TOKEN_LEN]
+    return list(dict.fromkeys(words))
+
+
+def blind_tokens(text: Optional[str]) -> List[str]:
+    """HMAC tokens for the words of ``text``; equal words give equal tokens under one key."""
+    key = _index_key()
+    return [hmac.new(key, w.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+            for w in normalize_words(text)]
+
+
+def _signing_key(key: bytes) -> bytes:
+    return hashlib.sha256(b"tracking-app-audit-signing:" + key).digest()
+
+
+def sign(message: bytes) -> Tuple[str, str]:
+    """HMAC-SHA256 signature of ``message`` with the current key; returns (key id, hex signature)."""
+    key = _get_key()
+    return key_id(key), hmac.new(_signing_key(key), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(message: bytes, kid: str, signature: str) -> bool:
+    """Check a signature made by :func:`sign` with the current or a previous key."""
+    for key in _get_keys():
+        if key_id(key) == kid:
+            expected = hmac.new(_signing_key(key), message, hashlib.sha256).hexdigest()
+            return hmac.compare_digest(expected, signature or "")
+    return False
@@ -0,0 +1,96 @@
+"""Circuit breaker guarding FX network access.
+
+When the rate API is unreachable, every cache miss would otherwise wait for
+its own timeouts, so an analytics loop over a year of transactions can hang
+for minutes. After ``FAILURE_THRESHOLD`` consecutive failed fetches the
+breaker opens and lookups fail fast (cache-only) for ``COOL_DOWN_SECONDS``.
+It then goes half-open and lets exactly one probe request through: success
+closes the breaker, failure re-opens it for another cool-down.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+FAILURE_THRESHOLD = 3
+COOL_DOWN_SECONDS = 60.0
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, cool_down: float = COOL_DOWN_SECONDS):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cool_down = float(cool_down)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._last_error = ''
+        self._lock = threading.Lock()
+
+    def _state_locked(self, now: float) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if now - self._opened_at >= self.cool_down:
+            return HALF_OPEN
+        return OPEN
+
+    def allow_request(self) -> bool:
+        """Return True if a network call may be attempted now.
+
+        In the half-open state only the first caller gets True (the probe);
+        everyone else fails fast until the probe reports back.
+        """
+        with self._lock:
+            state = self._state_locked(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+            self._last_error = ''
+
+    def record_failure(self, error: str = '') -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error or '')
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def reset(self) -> None:
+        self.record_success()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked(time.monotonic())
+
+    def status(self) -> Dict[str, object]:
+        """Snapshot for display (Settings window) and diagnostics."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state_locked(now)
+            retry_in = 0.0
+            if state == OPEN and self._opened_at is not None:
+                retry_in = max(0.0, self.cool_down - (now - self._opened_at))
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': round(retry_in, 1),
+                'last_error': self._last_error,
+            }
+
+
+# Shared breaker for all FX fetches (db.rates and core.fx_rates)
+BREAKER = CircuitBreaker()
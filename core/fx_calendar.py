@@ -0,0 +1,125 @@
+"""Per-currency-pair index of FX publication dates.
+
+Frankfurter (ECB reference rates) publishes nothing on weekends and TARGET
+holidays; asking for such a date returns the previous publication. This
+module keeps, per currency pair, a sorted list of dates known to carry a
+rate and resolves a requested date to the nearest prior published date with
+a binary search. Resolved mappings are memoized so repeat lookups for
+non-publishing dates never leave the process.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+_DATES: dict[tuple[str, str], list[str]] = {}  # (FROM, TO) -> sorted ISO dates
+_RESOLVED: dict[tuple[str, str, str], str] = {}  # (FROM, TO, requested) -> published
+_LOCK = threading.Lock()
+
+# A weekend gap is at most Sat+Sun; anything longer needs a confirmed holiday.
+_MAX_WEEKEND_GAP = 2
+
+
+def _pair(from_ccy: str, to_ccy: str) -> tuple[str, str]:
+    return ((from_ccy or '').upper(), (to_ccy or '').upper())
+
+
+def _parse(date_str: str) -> Optional[date]:
+    try:
+        return date.fromisoformat((date_str or '').strip()[:10])
+    except Exception:
+        return None
+
+
+def _only_weekend_between(prior: str, requested: str) -> bool:
+    """True if every day in (prior, requested] falls on a Saturday or Sunday."""
+    p, r = _parse(prior), _parse(requested)
+    if p is None or r is None or r <= p or (r - p).days > _MAX_WEEKEND_GAP:
+        return False
+    d = p + timedelta(days=1)
+    while d <= r:
+        if d.weekday() < 5:
+            return False
+        d += timedelta(days=1)
+    return True
+
+
+def is_loaded(from_ccy: str, to_ccy: str) -> bool:
+    return _pair(from_ccy, to_ccy) in _DATES
+
+
+def load(from_ccy: str, to_ccy: str, dates: Iterable[str]) -> None:
+    """Seed the index for a pair (typically from the persisted fx_cache rows)."""
+    clean = sorted({(d or '').strip()[:10] for d in dates if _parse(d)})
+    with _LOCK:
+        _DATES[_pair(from_ccy, to_ccy)] = clean
+
+
+def add(date_str: str, from_ccy: str, to_ccy: str) -> None:
+    """Record that ``date_str`` has a rate for the pair (no-op until the pair is loaded)."""
+    d = (date_str or '').strip()[:10]
+    if not _parse(d):
+        return
+    with _LOCK:
+        dates = _DATES.get(_pair(from_ccy, to_ccy))
+        if dates is None:
+            return
+        i = bisect.bisect_left(dates, d)
+        if i == len(dates) or dates[i] != d:
+            dates.insert(i, d)
+
+
+def record_publication(requested: str, published: str, from_ccy: str, to_ccy: str) -> None:
+    """Remember that a request for ``requested`` was answered with ``published``.
+
+    Used when the API reports an earlier publication date (holidays), which
+    the weekend rule alone could not infer.
+    """
+    req = (requested or '').strip()[:10]
+    pub = (published or '').strip()[:10]
+    if not _parse(req) or not _parse(pub) or pub > req:
+        return
+    add(pub, from_ccy, to_ccy)
+    if pub != req:
+        f, t = _pair(from_ccy, to_ccy)
+        with _LOCK:
+            _RESOLVED[(f, t, req)] = pub
+
+
+def resolve(date_str: str, from_ccy: str, to_ccy: str) -> Optional[str]:
+    """Return the published date whose rate applies to ``date_str``.
+
+    Returns ``date_str`` itself when it is a known publication date, the
+    nearest prior publication when the gap is a weekend or a previously
+    observed holiday, and ``None`` when the index cannot decide (the caller
+    should then consult the network).
+    """
+    d = (date_str or '').strip()[:10]
+    if not _parse(d):
+        return None
+    f, t = _pair(from_ccy, to_ccy)
+    with _LOCK:
+        hit = _RESOLVED.get((f, t, d))
+        if hit:
+            return hit
+        dates = _DATES.get((f, t))
+        if not dates:
+            return None
+        i = bisect.bisect_right(dates, d)
+        if i == 0:
+            return None
+        prior = dates[i - 1]
+        if prior == d:
+            return d
+        if _only_weekend_between(prior, d):
+            _RESOLVED[(f, t, d)] = prior
+            return prior
+    return None
+
+
+def clear() -> None:
+    with _LOCK:
+        _DATES.clear()
+        _RESOLVED.clear()
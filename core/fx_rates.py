@@ -2,9 +2,45 @@ from __future__ import annotations
 
 from datetime import datetime
 from typing import Optional
+import urllib.error
 import urllib.request
 import json
 import core.fx_cache as fx_cache
+import core.fx_calendar as fx_calendar
+import core.fx_breaker as fx_breaker
+
+FRANKFURTER_HOST = "api.frankfurter.app"
+_TIMEOUT = 5.0
+
+
+def fetch_frankfurter(date_str: str | None, from_ccy: str, to_ccy: str) -> Optional[dict]:
+    """GET a Frankfurter quote, guarded by the shared FX circuit breaker.
+
+    Tries https then http. Returns the decoded JSON body, or None when the
+    breaker is open, the API answered with an error, or it was unreachable.
+    """
+    if not fx_breaker.BREAKER.allow_request():
+        return None
+    path = f"/{date_str}?from={from_ccy}&to={to_ccy}" if date_str else f"/latest?from={from_ccy}&to={to_ccy}"
+    last_error: Exception | None = None
+    for scheme in ("https", "http"):
+        url = f"{scheme}://{FRANKFURTER_HOST}{path}"
+        try:
+            req = urllib.request.Request(url, headers={"User-Agent": "TrackingApp/1.0"})
+            with urllib.request.urlopen(req, timeout=_TIMEOUT) as resp:
+                data = json.loads(resp.read().decode("utf-8"))
+            fx_breaker.BREAKER.record_success()
+            return data
+        except urllib.error.HTTPError as e:
+            if e.code < 500:
+                # The service answered (e.g. unknown currency); the network is fine
+                fx_breaker.BREAKER.record_success()
+                return None
+            last_error = e
+        except Exception as e:
+            last_error = e
+    fx_breaker.BREAKER.record_failure(str(last_error or ''))
+    return None
 
 
 def get_or_fetch_rate(date_str: str | None) -> Optional[float]:
@@ -38,12 +74,10 @@ def get_or_fetch_rate(date_str: str | None) -> Optional[float]:
     except Exception:
         cached_db = None
 
-    # fetch from frankfurter
-    url = f"https://api.frankfurter.app/{date_str}?from=USD&to=TRY"
+    # fetch from frankfurter (fails fast while the breaker is open)
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "TrackingApp/1.0"})
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
+        data = fetch_frankfurter(date_str, 'USD', 'TRY')
+        if data:
             rates = data.get("rates") or {}
             v = rates.get("TRY")
             if v:
@@ -57,6 +91,11 @@ def get_or_fetch_rate(date_str: str | None) -> Optional[float]:
                 try:
                     import db as db
                     db.set_cached_rate(date_str, 'USD', 'TRY', fv)
+                    pub = data.get("date")
+                    if pub:
+                        if pub != date_str:
+                            db.set_cached_rate(pub, 'USD', 'TRY', fv)
+                        fx_calendar.record_publication(date_str, pub, 'USD', 'TRY')
                 except Exception:
                     pass
                 return fv
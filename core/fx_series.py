@@ -0,0 +1,325 @@
+"""Compact, memory-mapped daily FX series.
+
+Instead of ``"date|FROM|TO"`` dict keys or one SQLite lookup per amount,
+each currency gets one daily series of its rate to the base currency: a
+float64 array indexed by day offset from the series start, stored as a small
+binary file and memory-mapped at startup. Any cross rate is the ratio of two
+series, a single lookup is O(1) and arrays of dates convert in one vectorized
+operation.
+
+File layout (``data/fx_series/<BASE>/<CCY>.f64``): a 16-byte header
+(``b'FXS1'``, uint32 start ordinal, uint64 length) followed by little-endian
+float64 values; NaN marks days without a known rate. Short publication gaps
+(weekends, holidays) are forward-filled when the series is built from
+``fx_cache``.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - numpy is optional at runtime
+    np = None  # type: ignore
+
+try:
+    from db.connection import DATA_DIR
+except Exception:
+    DATA_DIR = Path('.') / 'data'
+
+SERIES_DIR = DATA_DIR / 'fx_series'
+_MAGIC = b'FXS1'
+_HEADER = struct.Struct('<4sIQ')
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# ECB gaps are at most Good Friday .. Easter Monday (4 days)
+MAX_FILL_DAYS = 4
+
+_SERIES: Dict[str, Tuple[int, object]] = {}  # CCY -> (start ordinal, memmap)
+_BASE: Optional[str] = None
+_LOAD_ATTEMPTED = False
+_LOCK = threading.Lock()
+_REBUILD_PENDING = False
+_REBUILD_RUNNING = False
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _resolve_base(base: Optional[str]) -> str:
+    if base:
+        return base.upper()
+    from db.settings import get_base_currency
+    return (get_base_currency() or 'USD').upper()
+
+
+def _ordinal(date_str: str) -> Optional[int]:
+    try:
+        return date.fromisoformat((date_str or '').strip()[:10]).toordinal()
+    except Exception:
+        return None
+
+
+def _write_series(path: Path, start: int, values) -> None:
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as fh:
+        fh.write(_HEADER.pack(_MAGIC, start, len(values)))
+        fh.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+    os.replace(tmp, path)
+
+
+def _open_series(path: Path) -> Optional[Tuple[int, object]]:
+    with open(path, 'rb') as fh:
+        magic, start, count = _HEADER.unpack(fh.read(_HEADER.size))
+    if magic != _MAGIC or count == 0:
+        return None
+    arr = np.memmap(path, dtype='<f8', mode='r', offset=_HEADER.size, shape=(count,))
+    return start, arr
+
+
+def load(base: Optional[str] = None) -> int:
+    """Memory-map every series for ``base``. Returns the number of currencies loaded."""
+    global _BASE, _LOAD_ATTEMPTED
+    if np is None:
+        return 0
+    base = _resolve_base(base)
+    series = {}
+    d = SERIES_DIR / base
+    if d.exists():
+        for p in d.glob('*.f64'):
+            try:
+                s = _open_series(p)
+            except Exception:
+                s = None
+            if s:
+                series[p.stem.upper()] = s
+    with _LOCK:
+        _SERIES.clear()
+        _SERIES.update(series)
+        _BASE = base
+        _LOAD_ATTEMPTED = True
+    return len(series)
+
+
+def _points(cur, base: str, ccy: Optional[str] = None, lo: Optional[int] = None,
+            hi: Optional[int] = None) -> Dict[str, Dict[int, float]]:
+    """``{CCY: {ordinal: rate to base}}`` from ``fx_cache``, optionally one currency and day range."""
+    sql = ('SELECT date, from_ccy, to_ccy, rate FROM fx_cache '
+           'WHERE (to_ccy=? OR from_ccy=?) AND rate > 0')
+    params: list = [base, base]
+    if ccy is not None:
+        sql += ' AND (from_ccy=? OR to_ccy=?)'
+        params += [ccy, ccy]
+    if lo is not None and hi is not None:
+        sql += ' AND date BETWEEN ? AND ?'
+        params += [date.fromordinal(lo).isoformat(), date.fromordinal(hi).isoformat()]
+    points: Dict[str, Dict[int, float]] = {}
+    cur.execute(sql, params)
+    for d, f, t, r in cur.fetchall():
+        o = _ordinal(d)
+        if o is None or f == t:
+            continue
+        if t == base:
+            points.setdefault(f, {})[o] = float(r)
+        else:
+            # inverse quote only fills days without a direct CCY->base rate
+            points.setdefault(t, {}).setdefault(o, 1.0 / float(r))
+    return points
+
+
+def build(base: Optional[str] = None, max_fill_days: int = MAX_FILL_DAYS) -> Dict[str, int]:
+    """Rebuild the series files from ``fx_cache`` rows against ``base`` and remap them."""
+    if np is None:
+        return {}
+    from db.connection import get_cursor
+    base = _resolve_base(base)
+    with get_cursor() as (conn, cur):
+        points = _points(cur, base)
+
+    out_dir = SERIES_DIR / base
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with _LOCK:
+        # Drop our maps first; Windows refuses to replace a mapped file
+        _SERIES.clear()
+    stats = {}
+    for ccy, pts in points.items():
+        start, end = min(pts), max(pts)
+        vals = np.full(end - start + 1, np.nan)
+        idx = np.fromiter(pts.keys(), dtype=np.int64, count=len(pts)) - start
+        vals[idx] = np.fromiter(pts.values(), dtype=np.float64, count=len(pts))
+        _forward_fill(vals, max_fill_days)
+        _write_series(out_dir / f'{ccy}.f64', start, vals)
+        stats[ccy] = len(pts)
+    load(base)
+    return stats
+
+
+def refresh_day(date_str: str, from_ccy: str, to_ccy: str) -> None:
+    """Bring the series in line with a changed ``fx_cache`` rate for one day.
+
+    Only quotes against the base currency feed a series (cross rates are
+    derived, so there is nothing to patch). The day and the gap days it
+    forward-fills are re-read from ``fx_cache`` and written into the mapped
+    file in place; a day outside the series falls back to ``invalidate``.
+    """
+    f, t = (from_ccy or '').upper(), (to_ccy or '').upper()
+    if np is None or _BASE is None or _BASE not in (f, t) or f == t:
+        return
+    ccy = f if t == _BASE else t
+    if not _patch_day(ccy, _ordinal(date_str)):
+        invalidate(ccy)
+
+
+def _patch_day(ccy: str, o: Optional[int]) -> bool:
+    from db.connection import get_cursor
+    with _LOCK:
+        s, base = _SERIES.get(ccy), _BASE
+    if s is None or o is None or base is None or not s[0] <= o < s[0] + len(s[1]):
+        return False
+    start, arr = s
+    lo, hi = o - MAX_FILL_DAYS, min(o + MAX_FILL_DAYS, start + len(arr) - 1)
+    with get_cursor() as (conn, cur):
+        pts = _points(cur, base, ccy, lo, hi).get(ccy, {})
+    window = np.full(hi - lo + 1, np.nan)
+    for day, r in pts.items():
+        window[day - lo] = r
+    _forward_fill(window, MAX_FILL_DAYS)
+    # Days before ``o`` do not depend on it; the ones after may be gap fills carrying it
+    path = SERIES_DIR / base / f'{ccy}.f64'
+    with _LOCK:
+        if _SERIES.get(ccy) is not s:
+            return False
+        try:
+            with open(path, 'r+b') as fh:
+                fh.seek(_HEADER.size + (o - start) * 8)
+                fh.write(np.ascontiguousarray(window[o - lo:], dtype='<f8').tobytes())
+        except OSError:
+            return False
+    return True
+
+
+def invalidate(*ccys: str) -> None:
+    """Stop answering from the series of ``ccys`` and rebuild the series in the background.
+
+    Used when a changed ``fx_cache`` rate cannot be patched in place
+    (``refresh_day``); lookups for those currencies fall back to ``fx_cache``
+    until the rebuild remaps fresh files. Invalidations during a rebuild
+    queue one more.
+    """
+    global _REBUILD_PENDING, _REBUILD_RUNNING
+    with _LOCK:
+        for ccy in ccys:
+            _SERIES.pop((ccy or '').upper(), None)
+        _REBUILD_PENDING = True
+        if _REBUILD_RUNNING:
+            return
+        _REBUILD_RUNNING = True
+    threading.Thread(target=_rebuild_pending, daemon=True).start()
+
+
+def _rebuild_pending() -> None:
+    global _REBUILD_PENDING, _REBUILD_RUNNING
+    while True:
+        with _LOCK:
+            if not _REBUILD_PENDING:
+                _REBUILD_RUNNING = False
+                return
+            _REBUILD_PENDING = False
+        try:
+            build(_BASE)
+        except Exception:
+            pass
+
+
+def _forward_fill(vals, limit: int) -> None:
+    """Carry the last known rate into gaps of at most ``limit`` days (in place)."""
+    known = ~np.isnan(vals)
+    pos = np.where(known, np.arange(len(vals)), -1)
+    np.maximum.accumulate(pos, out=pos)
+    gap = np.arange(len(vals)) - pos
+    fill = (~known) & (pos >= 0) & (gap <= limit)
+    vals[fill] = vals[pos[fill]]
+
+
+def _ensure_loaded() -> bool:
+    if np is None:
+        return False
+    if not _LOAD_ATTEMPTED:
+        try:
+            load()
+        except Exception:
+            return False
+    return bool(_SERIES)
+
+
+def _to_base(ccy: str, ordinal: int) -> Optional[float]:
+    if ccy == _BASE:
+        return 1.0
+    s = _SERIES.get(ccy)
+    if s is None:
+        return None
+    i = ordinal - s[0]
+    if i < 0 or i >= len(s[1]):
+        return None
+    v = float(s[1][i])
+    return v if v == v and v > 0 else None  # NaN check
+
+
+def rate(date_str: str, from_ccy: str, to_ccy: str) -> Optional[float]:
+    """O(1) rate lookup; ``None`` when the series does not cover the date/pair."""
+    f, t = (from_ccy or '').upper(), (to_ccy or '').upper()
+    if not f or not t:
+        return None
+    if f == t:
+        return 1.0
+    if not _ensure_loaded():
+        return None
+    o = _ordinal(date_str)
+    if o is None:
+        return None
+    a, b = _to_base(f, o), _to_base(t, o)
+    if a is None or b is None:
+        return None
+    return a / b
+
+
+def _series_values(ccy: str, ordinals):
+    out = np.full(ordinals.shape, np.nan)
+    if ccy == _BASE:
+        out[:] = 1.0
+        return out
+    s = _SERIES.get(ccy)
+    if s is None:
+        return out
+    idx = ordinals - s[0]
+    ok = (idx >= 0) & (idx < len(s[1]))
+    out[ok] = s[1][idx[ok]]
+    return out
+
+
+def rates(dates: Iterable, from_ccy: str, to_ccy: str):
+    """Vectorized lookup: array of rates for ISO date strings or datetime64 values (NaN if unknown)."""
+    if np is None:
+        raise RuntimeError('numpy is required for vectorized FX lookups')
+    days = np.asarray(dates, dtype='datetime64[D]')
+    f, t = (from_ccy or '').upper(), (to_ccy or '').upper()
+    if f == t:
+        return np.ones(days.shape)
+    _ensure_loaded()
+    ordinals = days.astype(np.int64) + _EPOCH_ORDINAL
+    return _series_values(f, ordinals) / _series_values(t, ordinals)
+
+
+def convert_many(dates: Iterable, amounts: Iterable, from_ccy: str, to_ccy: str):
+    """Vectorized ``amount * rate(date)``; NaN where no rate is known."""
+    return np.asarray(amounts, dtype=np.float64) * rates(dates, from_ccy, to_ccy)
+
+
+def loaded_currencies() -> Dict[str, Tuple[str, int]]:
+    """CCY -> (first date, number of days) for the mapped series."""
+    return {c: (date.fromordinal(s[0]).isoformat(), len(s[1])) for c, s in _SERIES.items()}
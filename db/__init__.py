@@ -50,22 +50,40 @@ else:
     
 # Audit and crypto helpers
 try:
-	from .audit import write_audit,get_audit_distinct,get_audit_logs
+	from .audit import write_audit,get_audit_distinct,get_audit_logs,flush_audit
 except Exception:
 	write_audit = None
 	get_audit_distinct = None
 	get_audit_logs = None
+	flush_audit = None
 else:
-	__all__.extend(["write_audit", "get_audit_distinct", "get_audit_logs"])
+	__all__.extend(["write_audit", "get_audit_distinct", "get_audit_logs", "flush_audit"])
 
+try:
+	from .audit_archive import archive_audit_logs
+except Exception:
+	archive_audit_logs = None
+else:
+	__all__.append("archive_audit_logs")
 
 try:
-	from .crypto import encrypt_str, decrypt_str  # type: ignore
+	from .audit_chain import verify_audit_chain
+except Exception:
+	verify_audit_chain = None
+else:
+	__all__.append("verify_audit_chain")
+
+
+try:
+	from .crypto import encrypt_str, decrypt_str, encrypt_many, decrypt_many, LazyDecryptRow  # type: ignore
 except Exception:
 	encrypt_str = None  # type: ignore
 	decrypt_str = None  # type: ignore
+	encrypt_many = None  # type: ignore
+	decrypt_many = None  # type: ignore
+	LazyDecryptRow = dict  # type: ignore
 else:
-	__all__.extend(["encrypt_str", "decrypt_str"])
+	__all__.extend(["encrypt_str", "decrypt_str", "encrypt_many", "decrypt_many", "LazyDecryptRow"])
 
 try:
     from .auth import (_pbkdf2_hash,
@@ -74,7 +92,8 @@ try:
                        verify_user,
                        set_current_user,
                        get_current_user,
-                       require_admin)
+                       require_admin,
+                       calibrate_hash_params)
 except Exception:
     users_exist = None # type: ignore
     create_user = None  # type: ignore
@@ -82,12 +101,17 @@ except Exception:
     set_current_user = None  # type: ignore
     get_current_user = None  # type: ignore
     require_admin = None  # type: ignore
+    calibrate_hash_params = None  # type: ignore
 else:
-    __all__.extend(["users_exist", "create_user", "verify_user", "set_current_user", "get_current_user", "require_admin"])
+    __all__.extend(["users_exist", "create_user", "verify_user", "set_current_user", "get_current_user", "require_admin", "calibrate_hash_params"])
 
 try:
-    from .sales_dao import (list_sales,add_sale,
+    from .sales_dao import (list_sales,add_sale,add_sales,
+                            query_sales,
+                            get_sale,
+                            get_sale_years,
                             overwrite_sales,
+                            sync_sales,
                             get_distinct_sale_platforms,
                             undelete_sales_by_ids,
                             undelete_sales_by_indices,
@@ -96,14 +120,34 @@ try:
 except Exception:
     list_sales = None  # type: ignore
     add_sale = None  # type: ignore
+    add_sales = None  # type: ignore
+    query_sales = None  # type: ignore
+    get_sale = None  # type: ignore
+    get_sale_years = None  # type: ignore
     overwrite_sales = None  # type: ignore
+    sync_sales = None  # type: ignore
     get_distinct_sale_platforms = None  # type: ignore
     undelete_sales_by_ids = None  # type: ignore
     undelete_sales_by_indices = None  # type: ignore
     mark_sale_deleted = None  # type: ignore
     update_sale = None  # type: ignore
 else:
-    __all__.extend(["list_sales","add_sale","overwrite_sales","get_distinct_sale_platforms","undelete_sales_by_ids","undelete_sales_by_indices","mark_sale_deleted","update_sale"])
+    __all__.extend(["list_sales","add_sale","add_sales","query_sales","get_sale","get_sale_years","overwrite_sales","sync_sales","get_distinct_sale_platforms","undelete_sales_by_ids","undelete_sales_by_indices","mark_sale_deleted","update_sale"])
+
+try:
+    from .sale_orders_dao import (create_sale_order,
+                                  find_sale_line,
+                                  find_sale_lines,
+                                  expand_product_ids,
+                                  compact_sales_into_orders)
+except Exception:
+    create_sale_order = None  # type: ignore
+    find_sale_line = None  # type: ignore
+    find_sale_lines = None  # type: ignore
+    expand_product_ids = None  # type: ignore
+    compact_sales_into_orders = None  # type: ignore
+else:
+    __all__.extend(["create_sale_order","find_sale_line","find_sale_lines","expand_product_ids","compact_sales_into_orders"])
 
 try: 
     from .schema import init_db_schema,add_column_if_missing
@@ -144,7 +188,11 @@ else:
     
 try:
     from .returns_dao import (list_returns,
+                              list_returns_for_sale,
+                              backfill_return_ledger,
+                              ensure_return_ledger,
                               insert_return,
+                              insert_returns,
                               _compute_refund_base,
                               update_return,
                               delete_return,
@@ -152,6 +200,10 @@ try:
                               get_distinct_return_reasons)
 except Exception:
     insert_return = None  # type: ignore
+    list_returns_for_sale = None  # type: ignore
+    backfill_return_ledger = None  # type: ignore
+    ensure_return_ledger = None  # type: ignore
+    insert_returns = None  # type: ignore
     get_returns = None  # type: ignore
     _compute_refund_base = None  # type: ignore
     update_return = None  # type: ignore
@@ -159,7 +211,7 @@ except Exception:
     undelete_return = None  # type: ignore
     get_distinct_return_reasons = None  # type: ignore
 else:
-    __all__.extend(["insert_return", "get_returns", "_compute_refund_base", "update_return", "delete_return", "undelete_return", "get_distinct_return_reasons"])
+    __all__.extend(["insert_return", "insert_returns", "list_returns_for_sale", "backfill_return_ledger", "ensure_return_ledger", "get_returns", "_compute_refund_base", "update_return", "delete_return", "undelete_return", "get_distinct_return_reasons"])
 
 
 try:
@@ -174,27 +226,84 @@ else:
     __all__.extend(["get_cached_rate", "set_cached_rate", "convert_amount", "_get_rate_generic", "get_rate_to_base"])
 
 try:
-    from .product_codes_dao import get_product_code, set_product_code, get_cat_code_for_category, generate_product_ids, get_all_product_codes, update_next_serial, delete_product_code
-    __all__.extend(["get_product_code","set_product_code","get_cat_code_for_category","generate_product_ids","get_all_product_codes","update_next_serial","delete_product_code"])
+    from .fx_loader import load_fx_file
+except Exception:
+    load_fx_file = None  # type: ignore
+else:
+    __all__.append("load_fx_file")
+
+try:
+    from .returns_import import import_returns_csv
+except Exception:
+    import_returns_csv = None  # type: ignore
+else:
+    __all__.append("import_returns_csv")
+
+try:
+    from .key_rotation import rotate_encryption_keys
+except Exception:
+    rotate_encryption_keys = None  # type: ignore
+else:
+    __all__.append("rotate_encryption_keys")
+
+try:
+    from .note_index import search_note_ids, rebuild_note_index, ensure_note_index, remove_note
+except Exception:
+    search_note_ids = None  # type: ignore
+    remove_note = None  # type: ignore
+    rebuild_note_index = None  # type: ignore
+    ensure_note_index = None  # type: ignore
+else:
+    __all__.extend(["search_note_ids", "rebuild_note_index", "ensure_note_index", "remove_note"])
+
+try:
+    from .text_search import search, search_matches, rebuild_search_index, ensure_search_index
+except Exception:
+    search = None  # type: ignore
+    search_matches = None  # type: ignore
+    rebuild_search_index = None  # type: ignore
+    ensure_search_index = None  # type: ignore
+else:
+    __all__.extend(["search", "search_matches", "rebuild_search_index", "ensure_search_index"])
+
+try:
+    from .product_codes_dao import get_product_code, set_product_code, get_cat_code_for_category, generate_product_ids, reserve_product_serials, get_all_product_codes, update_next_serial, delete_product_code
+    __all__.extend(["get_product_code","set_product_code","get_cat_code_for_category","generate_product_ids","reserve_product_serials","get_all_product_codes","update_next_serial","delete_product_code"])
 except Exception as e:
     get_product_code = None  # type: ignore
     set_product_code = None  # type: ignore
     get_cat_code_for_category = None  # type: ignore
     generate_product_ids = None  # type: ignore
+    reserve_product_serials = None  # type: ignore
     get_all_product_codes = None  # type: ignore
     update_next_serial = None  # type: ignore
     delete_product_code = None  # type: ignore
 
 try:
-    from .inventory_dao import get_inventory,rebuild_inventory_from_imports,update_inventory
+    from .inventory_dao import get_inventory,get_inventory_item,rebuild_inventory,rebuild_inventory_from_imports
 except Exception:   
     get_inventory = None  # type: ignore
+    get_inventory_item = None  # type: ignore
+    rebuild_inventory = None  # type: ignore
     rebuild_inventory_from_imports = None  # type: ignore
-    update_inventory = None  # type: ignore
 else:
     __all__.append("get_inventory")
+    __all__.append("get_inventory_item")
+    __all__.append("rebuild_inventory")
     __all__.append("rebuild_inventory_from_imports")
-    __all__.append("update_inventory")
+
+try:
+    from .inventory_snapshots import (take_inventory_snapshot,
+                                      ensure_periodic_snapshots,
+                                      get_inventory_as_of,
+                                      list_inventory_snapshots)
+except Exception:
+    take_inventory_snapshot = None  # type: ignore
+    ensure_periodic_snapshots = None  # type: ignore
+    get_inventory_as_of = None  # type: ignore
+    list_inventory_snapshots = None  # type: ignore
+else:
+    __all__.extend(["take_inventory_snapshot", "ensure_periodic_snapshots", "get_inventory_as_of", "list_inventory_snapshots"])
 
 try:
     from .imports_dao import (add_import,
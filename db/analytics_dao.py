@@ -3,6 +3,25 @@ from typing import Dict
 from .settings import get_default_sale_currency,get_base_currency,get_default_import_currency
 from .rates import convert_amount
 
+# A return's product as allocations know it: units sold on an order line are
+# allocated under the line's first product ID.
+_RETURN_PRODUCT_ID = ('COALESCE((SELECT s.product_id FROM sales s WHERE s.id = returns.sale_id), '
+                      'returns.product_id) AS product_id')
+# Units a return covers and the exact cost of the allocations it reversed
+# (return_allocations ledger, one indexed lookup per return)
+_RETURN_LEDGER_COLUMNS = ('COALESCE(returns.quantity, 1) AS quantity, '
+                          '(SELECT SUM(ra.quantity * ra.unit_cost) FROM return_allocations ra '
+                          'WHERE ra.return_id = returns.id) AS ledger_cost')
+
+
+def _ensure_return_ledger() -> None:
+    # returns recorded before the ledger existed get linked on first use
+    try:
+        from .returns_dao import ensure_return_ledger
+        ensure_return_ledger()
+    except Exception:
+        pass
+
 
 def get_profit_analysis_by_sale(include_expenses: bool = False):
     # Compute aggregated sale profit. For include_expenses=True we prefer the
@@ -117,7 +136,7 @@ def get_profit_analysis_by_sale(include_expenses: bool = False):
     # Apply returns adjustments so per-sale profit analysis reflects refunds/restocks
     try:
         with get_cursor() as (conn3, cur3):
-            cur3.execute("SELECT product_id, refund_amount, refund_currency, return_date, COALESCE(refund_amount_base,0) as refund_amount_base, COALESCE(restock,0) as restock FROM returns WHERE (deleted IS NULL OR deleted = 0)")
+            cur3.execute(f"SELECT {_RETURN_PRODUCT_ID}, refund_amount, refund_currency, return_date, COALESCE(refund_amount_base,0) as refund_amount_base, COALESCE(restock,0) as restock, COALESCE(quantity,1) as quantity FROM returns WHERE (deleted IS NULL OR deleted = 0)")
             returns = cur3.fetchall()
             if returns:
                 # Build quick index for rows by product_id
@@ -150,10 +169,10 @@ def get_profit_analysis_by_sale(include_expenses: bool = False):
                         continue
                     # Reduce revenue so reports reflect refund
                     target['total_revenue'] = round(float(target.get('total_revenue', 0.0)) - float(refund_amt or 0.0), 2)
-                    # Decrease quantity by 1 (a returned unit)
+                    # Decrease quantity by the returned units
                     try:
                         orig_qty = float(target.get('total_quantity', 0.0))
-                        target['total_quantity'] = orig_qty - 1.0
+                        target['total_quantity'] = orig_qty - float(rr['quantity'] or 1.0)
                     except Exception:
                         target['total_quantity'] = 0.0
                     if target['total_quantity'] < 0:
@@ -308,41 +327,26 @@ def get_monthly_sales_profit(year: int):
         has_returns = False
 
     if has_returns:
+        _ensure_return_ledger()
         try:
             with get_cursor() as (conn2, cur2):
-                cur2.execute('''
-                    SELECT return_date, strftime('%Y-%m', return_date) as ym, product_id,
+                cur2.execute(f'''
+                    SELECT return_date, strftime('%Y-%m', return_date) as ym, {_RETURN_PRODUCT_ID},
                            COALESCE(refund_amount_base, 0) as refund_amount_base,
-                           COALESCE(restock, 0) as restock
+                           COALESCE(restock, 0) as restock,
+                           {_RETURN_LEDGER_COLUMNS}
                     FROM returns
                     WHERE strftime('%Y', return_date) = ?
                 ''', (str(year),))
                 for rr in cur2.fetchall():
                     ym = rr['ym']
-                    pid = rr['product_id']
                     refund_amt = float(rr['refund_amount_base'] or 0.0)
                     restock_flag = 1 if int(rr['restock'] or 0) else 0
                     bucket = result.setdefault(ym, {'revenue': 0.0, 'cogs': 0.0, 'gross_profit': 0.0, 'items_sold': 0.0})
                     bucket['revenue'] -= refund_amt
-                    bucket['items_sold'] -= 1.0
-                    if restock_flag and pid:
-                        try:
-                            with get_cursor() as (conn2b, cur2b):
-                                cur2b.execute('''
-                                    SELECT 
-                                        SUM(COALESCE(sba.quantity_from_batch,0)) AS tq,
-                                        SUM(COALESCE(NULLIF(sba.unit_cost,0), ib.unit_cost_base, ib.unit_cost_orig, ib.unit_cost, 0) * COALESCE(sba.quantity_from_batch,0)) AS tc
-                                    FROM sale_batch_allocations sba
-                                    LEFT JOIN import_batches ib ON sba.batch_id = ib.id
-                                    WHERE sba.product_id = ?
-                                ''', (pid,))
-                                rowc = cur2b.fetchone()
-                                tq = float(rowc['tq'] or 0.0) if rowc else 0.0
-                                tc = float(rowc['tc'] or 0.0) if rowc else 0.0
-                                per_unit = (tc / tq) if tq > 0 else 0.0
-                                bucket['cogs'] -= per_unit
-                        except Exception:
-                            pass
+                    bucket['items_sold'] -= float(rr['quantity'] or 1.0)
+                    if restock_flag:
+                        bucket['cogs'] -= float(rr['ledger_cost'] or 0.0)
         except Exception:
             pass
     for k, v in result.items():
@@ -428,40 +432,25 @@ def get_yearly_sales_profit():
         has_returns = False
 
     if has_returns:
+        _ensure_return_ledger()
         try:
             with get_cursor() as (conn2, cur2):
-                cur2.execute('''
-                    SELECT return_date, strftime('%Y', return_date) as y, product_id,
+                cur2.execute(f'''
+                    SELECT return_date, strftime('%Y', return_date) as y, {_RETURN_PRODUCT_ID},
                            COALESCE(refund_amount_base, 0) as refund_amount_base,
-                           COALESCE(restock, 0) as restock
+                           COALESCE(restock, 0) as restock,
+                           {_RETURN_LEDGER_COLUMNS}
                     FROM returns
                 ''')
                 for rr in cur2.fetchall():
                     y = rr['y']
-                    pid = rr['product_id']
                     refund_amt = float(rr['refund_amount_base'] or 0.0)
                     restock_flag = 1 if int(rr['restock'] or 0) else 0
                     bucket = base_res.setdefault(y, {'revenue': 0.0, 'cogs': 0.0, 'gross_profit': 0.0, 'items_sold': 0.0})
                     bucket['revenue'] -= refund_amt
-                    bucket['items_sold'] -= 1.0
-                    if restock_flag and pid:
-                        try:
-                            with get_cursor() as (conn3, cur3):
-                                cur3.execute('''
-                                    SELECT 
-                                        SUM(COALESCE(sba.quantity_from_batch,0)) AS tq,
-                                        SUM(COALESCE(NULLIF(sba.unit_cost,0), ib.unit_cost_base, ib.unit_cost_orig, ib.unit_cost, 0) * COALESCE(sba.quantity_from_batch,0)) AS tc
-                                    FROM sale_batch_allocations sba
-                                    LEFT JOIN import_batches ib ON sba.batch_id = ib.id
-                                    WHERE sba.product_id = ?
-                                ''', (pid,))
-                                rowc = cur3.fetchone()
-                                tq = float(rowc['tq'] or 0.0) if rowc else 0.0
-                                tc = float(rowc['tc'] or 0.0) if rowc else 0.0
-                                per_unit = (tc / tq) if tq > 0 else 0.0
-                                bucket['cogs'] -= per_unit
-                        except Exception:
-                            pass
+                    bucket['items_sold'] -= float(rr['quantity'] or 1.0)
+                    if restock_flag:
+                        bucket['cogs'] -= float(rr['ledger_cost'] or 0.0)
         except Exception:
             pass
     else:
@@ -509,39 +498,23 @@ def get_yearly_return_impact():
         has_returns = False
 
     if has_returns:
+        _ensure_return_ledger()
         try:
             with get_cursor() as (conn2, cur2):
-                cur2.execute('''
-                    SELECT strftime('%Y', return_date) as y, product_id,
+                cur2.execute(f'''
+                    SELECT strftime('%Y', return_date) as y, {_RETURN_PRODUCT_ID},
                            COALESCE(refund_amount_base, 0) as refund_amount_base,
-                           COALESCE(restock, 0) as restock
+                           COALESCE(restock, 0) as restock,
+                           {_RETURN_LEDGER_COLUMNS}
                     FROM returns
                 ''')
                 for rr in cur2.fetchall():
                     y = rr['y']
                     bucket = out.setdefault(y, {'returns_refunds': 0.0, 'returns_cogs_reversed': 0.0, 'items_returned': 0.0})
                     bucket['returns_refunds'] += float(rr['refund_amount_base'] or 0.0)
-                    bucket['items_returned'] += 1.0
+                    bucket['items_returned'] += float(rr['quantity'] or 1.0)
                     if int(rr['restock'] or 0):
-                        pid = rr['product_id']
-                        if pid:
-                            try:
-                                with get_cursor() as (conn3, cur3):
-                                    cur3.execute('''
-                                        SELECT 
-                                            SUM(COALESCE(sba.quantity_from_batch,0)) AS tq,
-                                            SUM(COALESCE(NULLIF(sba.unit_cost,0), ib.unit_cost_orig, ib.unit_cost, 0) * COALESCE(sba.quantity_from_batch,0)) AS tc
-                                        FROM sale_batch_allocations sba
-                                        LEFT JOIN import_batches ib ON sba.batch_id = ib.id
-                                        WHERE sba.product_id = ?
-                                    ''', (pid,))
-                                    rowc = cur3.fetchone()
-                                    tq = float(rowc['tq'] or 0.0) if rowc else 0.0
-                                    tc = float(rowc['tc'] or 0.0) if rowc else 0.0
-                                    per_unit = (tc / tq) if tq > 0 else 0.0
-                                    bucket['returns_cogs_reversed'] += per_unit
-                            except Exception:
-                                pass
+                        bucket['returns_cogs_reversed'] += float(rr['ledger_cost'] or 0.0)
         except Exception:
             return out
         return out
@@ -558,12 +531,14 @@ def get_monthly_return_impact(year: int):
     This is DB-only and does not attempt to read legacy CSV files.
     """
     out = {}
+    _ensure_return_ledger()
     try:
         with get_cursor() as (conn, cur):
-            cur.execute('''
-            SELECT strftime('%Y-%m', return_date) as ym, product_id,
+            cur.execute(f'''
+            SELECT strftime('%Y-%m', return_date) as ym, {_RETURN_PRODUCT_ID},
                    COALESCE(refund_amount_base, 0) as refund_amount_base,
-                   COALESCE(restock, 0) as restock
+                   COALESCE(restock, 0) as restock,
+                   {_RETURN_LEDGER_COLUMNS}
             FROM returns
             WHERE strftime('%Y', return_date) = ?
         ''', (str(year),))
@@ -571,27 +546,9 @@ def get_monthly_return_impact(year: int):
                 ym = rr['ym']
                 bucket = out.setdefault(ym, {'returns_refunds': 0.0, 'returns_cogs_reversed': 0.0, 'items_returned': 0.0})
                 bucket['returns_refunds'] += float(rr['refund_amount_base'] or 0.0)
-                bucket['items_returned'] += 1.0
+                bucket['items_returned'] += float(rr['quantity'] or 1.0)
                 if int(rr['restock'] or 0):
-                    pid = rr['product_id']
-                    if pid:
-                        try:
-                            with get_cursor() as (conn2, cur2):
-                                cur2.execute('''
-                                    SELECT 
-                                        SUM(COALESCE(sba.quantity_from_batch,0)) AS tq,
-                                        SUM(COALESCE(NULLIF(sba.unit_cost,0), ib.unit_cost_orig, ib.unit_cost, 0) * COALESCE(sba.quantity_from_batch,0)) AS tc
-                                    FROM sale_batch_allocations sba
-                                    LEFT JOIN import_batches ib ON sba.batch_id = ib.id
-                                    WHERE sba.product_id = ?
-                                ''', (pid,))
-                                rowc = cur2.fetchone()
-                                tq = float(rowc['tq'] or 0.0) if rowc else 0.0
-                                tc = float(rowc['tc'] or 0.0) if rowc else 0.0
-                                per_unit = (tc / tq) if tq > 0 else 0.0
-                                bucket['returns_cogs_reversed'] += per_unit
-                        except Exception:
-                            pass
+                    bucket['returns_cogs_reversed'] += float(rr['ledger_cost'] or 0.0)
         
     except Exception:
         pass
@@ -757,78 +714,23 @@ def get_batch_utilization_report():
         ORDER BY ib.batch_date DESC
     ''')
         rows = [dict(r) for r in cur.fetchall()]
-    # Apply returns adjustments per batch: if a returned product maps to a batch allocation,
-    # subtract refund_amount_base from that batch's revenue and profit. If restock is true,
-    # increment remaining_quantity and reduce allocated_quantity accordingly (reporting only).
+    # Apply returns adjustments per batch: each return's ledger rows name the exact
+    # batches and units it reversed, so subtract their sale value from that batch's
+    # revenue. Restocked units are already back in import_batches.remaining_quantity
+    # (insert_return persists the restock), so quantities are not adjusted here.
+    _ensure_return_ledger()
     try:
         with get_cursor() as (conn2, cur2):
-            # Fetch returns with refund_amount_base and product_id/restock
-            # Only consider non-deleted returns
-            cur2.execute("SELECT id, product_id, refund_amount_base, restock, sale_date FROM returns WHERE (deleted IS NULL OR deleted = 0)")
-            returns = cur2.fetchall()
-            # Build a map of batch adjustments keyed by batch_id
-            batch_adj = {}
-            for ret in returns:
-                try:
-                    rid = ret['id'] if isinstance(ret, dict) else ret[0]
-                    pid = ret['product_id'] if isinstance(ret, dict) else ret[1]
-                    refund_base = float(ret['refund_amount_base'] or 0.0) if isinstance(ret, dict) else float(ret[2] or 0.0)
-                    restock = int(ret['restock'] if isinstance(ret, dict) else ret[3] or 0)
-                except Exception:
-                    # row might be sqlite3.Row
-                    try:
-                        pid = ret['product_id']
-                        refund_base = float(ret['refund_amount_base'] or 0.0)
-                        restock = int(ret['restock'] or 0)
-                    except Exception:
-                        continue
-                if not pid:
-                    continue
-                # Prefer allocations matching the original sale_date when available (credit the exact batch)
-                sale_date = None
-                try:
-                    sale_date = ret['sale_date'] if isinstance(ret, dict) else ret[4]
-                except Exception:
-                    sale_date = None
-                if sale_date:
-                    cur2.execute('''
-                        SELECT batch_id, quantity_from_batch, unit_cost, unit_sale_price
-                        FROM sale_batch_allocations
-                        WHERE product_id = ? AND sale_date = ? AND (deleted IS NULL OR deleted = 0)
-                        ORDER BY id DESC
-                    ''', (pid, sale_date))
-                else:
-                    # Fallback: allocations for this product ordered by id DESC (latest allocations first)
-                    cur2.execute('''
-                        SELECT batch_id, quantity_from_batch, unit_cost, unit_sale_price
-                        FROM sale_batch_allocations
-                        WHERE product_id = ? AND (deleted IS NULL OR deleted = 0) ORDER BY id DESC
-                    ''', (pid,))
-                allocs = cur2.fetchall()
-                remaining_refund = refund_base
-                remaining_units = 1.0  # assume 1 unit returned per return row; extend if returns store quantity
-                for a in allocs:
-                    batch_id = a['batch_id'] if isinstance(a, dict) else a[0]
-                    qty_from_batch = float(a['quantity_from_batch'] if isinstance(a, dict) else a[1] or 0.0)
-                    unit_cost = float(a['unit_cost'] if isinstance(a, dict) else a[2] or 0.0)
-                    unit_sale = float(a['unit_sale_price'] if isinstance(a, dict) else a[3] or 0.0)
-                    if batch_id is None:
-                        continue
-                    # Attribute one unit (or as much as available) to this batch
-                    used_units = min(remaining_units, qty_from_batch)
-                    if used_units <= 0:
-                        continue
-                    # Prepare batch adjustment entry
-                    b = batch_adj.setdefault(batch_id, {'rev_delta': 0.0, 'profit_delta': 0.0, 'remaining_delta': 0.0, 'allocated_delta': 0.0})
-                    # Subtract proportional revenue (use per-unit sale price)
-                    rev_delta = used_units * unit_sale * -1.0
-                    b['rev_delta'] += rev_delta
-                    # If restock, add units back to remaining_quantity and remove from allocated
-                    if restock:
-                        # For restocked returns we assume import_batches has already been updated when the return
-                        # was recorded (insert_return persists the restock). Do not apply remaining/allocated
-                        # deltas again here to avoid double-counting. We still subtract revenue via rev_delta.
-                        break
+            cur2.execute('''
+                SELECT ra.batch_id, SUM(ra.quantity * COALESCE(ra.unit_sale_price, 0)) AS rev
+                FROM return_allocations ra
+                JOIN returns r ON r.id = ra.return_id
+                WHERE (r.deleted IS NULL OR r.deleted = 0) AND ra.batch_id IS NOT NULL
+                GROUP BY ra.batch_id
+            ''')
+            batch_adj = {r['batch_id']: {'rev_delta': -float(r['rev'] or 0.0), 'remaining_delta': 0.0,
+                                         'allocated_delta': 0.0}
+                         for r in cur2.fetchall()}
             # Apply adjustments to rows list — recompute cost & profit from adjusted revenue and allocated quantities
             for i, row in enumerate(rows):
                 bid = row.get('id')
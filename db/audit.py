@@ -1,39 +1,208 @@
+import argparse
+import atexit
 import logging
-from typing import List, Optional, Dict
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Tuple
 from .connection import get_conn,get_cursor
 from .auth import _CURRENT_USER
+from .audit_chain import register_chain_function
+from .utils import fts_match_query
 
 # Configure logging for this module
 logger = logging.getLogger(__name__)
 
+# row_hash chains to the newest row; computed in the same statement so it runs under the write lock
+_INSERT_SQL = (
+    "INSERT INTO audit_log (ts, user, action, entity, ref_id, details, row_hash) "
+    "SELECT ?1, ?2, ?3, ?4, ?5, ?6, audit_chain_hash("
+    "(SELECT row_hash FROM audit_log ORDER BY id DESC LIMIT 1), ?1, ?2, ?3, ?4, ?5, ?6)"
+)
 
-def write_audit(action: str, entity: str, ref_id: Optional[str] = None, details: str = "", cur = None) -> None:
+# Buffered writes: flush every BATCH_SIZE entries or FLUSH_INTERVAL_MS, whichever comes first
+BATCH_SIZE = 500
+FLUSH_INTERVAL_MS = 200
+ASYNC_AUDIT = True
+
+AuditEntry = Tuple[str, Optional[str], str, str, str, str]
+
+
+def _now_ts() -> str:
+    # Same format and clock (UTC) as the column's CURRENT_TIMESTAMP default
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class AuditSink:
+    """In-memory queue drained by a background thread with batched ``executemany``.
+
+    Entries are timestamped when queued, so batching does not change ``ts``.
+    ``flush()`` blocks until everything queued so far is written.
+    """
+
+    _FLUSH = object()
+
+    def __init__(self, batch_size: int = BATCH_SIZE, interval_ms: int = FLUSH_INTERVAL_MS):
+        self.batch_size = max(1, int(batch_size))
+        self.interval = max(1, int(interval_ms)) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+
+    def put(self, entry: AuditEntry) -> None:
+        self._ensure_thread()
+        self._queue.put(entry)
+
+    def flush(self) -> None:
+        if self._queue.unfinished_tasks == 0:
+            return
+        self._ensure_thread()
+        self._queue.put(self._FLUSH)
+        self._queue.join()
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            first = q.get()
+            batch, taken = [], 1
+            if first is not self._FLUSH:
+                batch.append(first)
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = q.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if item is self._FLUSH:
+                        break
+                    batch.append(item)
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in range(taken):
+                    q.task_done()
+
+    @staticmethod
+    def _write(batch: List[AuditEntry]) -> None:
+        try:
+            with get_cursor() as (conn, cur):
+                register_chain_function(conn)
+                cur.executemany(_INSERT_SQL, batch)
+        except Exception as e:
+            logger.error("Failed to write %d audit log entries: %s", len(batch), e)
+
+
+_SINK = AuditSink()
+
+
+def flush_audit() -> None:
+    """Write all buffered audit entries now (called on shutdown and before reads)."""
+    try:
+        _SINK.flush()
+    except Exception as e:
+        logger.error("Failed to flush audit log: %s", e)
+
+
+atexit.register(flush_audit)
+
+
+def write_audit(action: str, entity: str, ref_id: Optional[str] = None, details: str = "", cur = None,
+                sync: bool = False) -> None:
     """
     Write an audit log entry.
 
+    With ``cur`` the entry is inserted inside the caller's transaction (it
+    commits or rolls back with the business change). Otherwise it is queued
+    for the background writer unless ``sync`` is set or buffering is off.
+
     Args:
         action (str): The action performed.
         entity (str): The entity on which the action was performed.
         ref_id (Optional[str]): Optional reference ID related to the entity.
         details (str): Additional details about the action.
+        cur: Optional cursor of an open transaction.
+        sync (bool): Write immediately on a new connection instead of buffering.
     """
     ref_id = str(ref_id) if ref_id else ""
+    entry = (_now_ts(), _CURRENT_USER.get("username"), action, entity, ref_id, details)
     try:
         if cur:
-            cur.execute(
-                "INSERT INTO audit_log (user, action, entity, ref_id, details) VALUES (?, ?, ?, ?, ?)",
-                (_CURRENT_USER.get("username"), action, entity, ref_id, details),
-            )
+            register_chain_function(cur.connection)
+            cur.execute(_INSERT_SQL, entry)
+        elif ASYNC_AUDIT and not sync:
+            _SINK.put(entry)
         else:
             with get_cursor() as (conn, cur):
-                cur.execute(
-                    "INSERT INTO audit_log (user, action, entity, ref_id, details) VALUES (?, ?, ?, ?, ?)",
-                    (_CURRENT_USER.get("username"), action, entity, ref_id, details),
-                )
+                register_chain_function(conn)
+                cur.execute(_INSERT_SQL, entry)
     except Exception as e:
         logger.error("Failed to write audit log: %s", e)
 
 
+_FTS_READY_KEY = 'audit_fts_ready'
+
+
+def audit_fts_available() -> bool:
+    """True if the FTS5 index exists and has been backfilled."""
+    try:
+        with get_cursor() as (conn, cur):
+            cur.execute("SELECT 1 FROM sqlite_master WHERE name='audit_fts'")
+            if not cur.fetchone():
+                return False
+            cur.execute('SELECT value FROM settings WHERE key=?', (_FTS_READY_KEY,))
+            row = cur.fetchone()
+        return bool(row and row[0] == '1')
+    except Exception:
+        return False
+
+
+def rebuild_audit_fts() -> int:
+    """Backfill (or rebuild) the audit FTS index from audit_log; returns rows indexed.
+
+    Raises RuntimeError when SQLite has no FTS5.
+    """
+    flush_audit()
+    with get_cursor() as (conn, cur):
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name='audit_fts'")
+        if not cur.fetchone():
+            raise RuntimeError('FTS5 is not available in this SQLite build')
+        cur.execute("INSERT INTO audit_fts(audit_fts) VALUES ('rebuild')")
+        cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)', (_FTS_READY_KEY, '1'))
+        cur.execute('SELECT COUNT(*) FROM audit_log')
+        return cur.fetchone()[0]
+
+
+def _needs_archive(start_date: Optional[str]) -> bool:
+    try:
+        from .audit_archive import archive_boundary, archive_path
+        boundary = archive_boundary()
+    except Exception:
+        return False
+    if not boundary or (start_date and start_date.strip()[:10] >= boundary):
+        return False
+    return archive_path().exists()
+
+
+def _next_day(date_str: str) -> str:
+    try:
+        return (datetime.strptime(date_str.strip()[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    except ValueError:
+        return date_str
+
+
 def get_audit_logs(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -42,9 +211,24 @@ def get_audit_logs(
     entity: Optional[str] = None,
     q: Optional[str] = None,
     limit: int = 1000,
+    before_ts: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_ts: Optional[str] = None,
+    after_id: Optional[int] = None,
+    order: str = 'time',
 ) -> List[Dict]:
     """
-    Fetch audit logs with optional filtering.
+    Fetch audit logs with optional filtering, newest first.
+
+    Filters compare ``ts`` directly (no functions on the column) so the
+    ``audit_log`` indexes apply. Pages are keyset-based: pass the ``ts``
+    and ``id`` of the last row you have as ``before_ts``/``before_id`` to get
+    the next (older) page, or of the first row as ``after_ts``/``after_id``
+    to get entries newer than it.
+
+    ``q`` uses the FTS5 index when available (word-prefix matching) and
+    falls back to ``LIKE`` otherwise. With ``order='rank'`` and a ``q`` the
+    best matches come first (bm25) and the keyset cursors are not used.
 
     Args:
         start_date (Optional[str]): Filter logs from this date (YYYY-MM-DD).
@@ -54,6 +238,9 @@ def get_audit_logs(
         entity (Optional[str]): Filter by entity.
         q (Optional[str]): Search term in details or ref_id.
         limit (int): Max number of records to return.
+        before_ts, before_id: Keyset cursor; only rows older than it.
+        after_ts, after_id: Keyset cursor; only rows newer than it.
+        order (str): 'time' (newest first) or 'rank' (relevance to ``q``).
 
     Returns:
         List[Dict]: List of audit log entries as dictionaries.
@@ -62,36 +249,79 @@ def get_audit_logs(
     params = []
 
     if start_date:
-        where.append("date(ts) >= date(?)")
-        params.append(start_date)
+        where.append("a.ts >= ?")
+        params.append(start_date.strip()[:10])
     if end_date:
-        where.append("date(ts) <= date(?)")
-        params.append(end_date)
+        where.append("a.ts < ?")
+        params.append(_next_day(end_date))
     if user:
-        where.append("user = ?")
+        where.append("a.user = ?")
         params.append(user)
     if action:
-        where.append("action = ?")
+        where.append("a.action = ?")
         params.append(action)
     if entity:
-        where.append("entity = ?")
+        where.append("a.entity = ?")
         params.append(entity)
-    if q:
-        where.append("(details LIKE ? OR ref_id LIKE ?)")
-        like = f"%{q}%"
+    # Archived entries live in audit_archive.db; only attach it when the range reaches back there
+    with_archive = _needs_archive(start_date)
+    match = fts_match_query(q) if q and audit_fts_available() else None
+    ranked = bool(match) and order == 'rank' and not with_archive
+    like = f"%{q}%"
+    if q and not match:
+        where.append("(a.details LIKE ? OR a.ref_id LIKE ?)")
         params.extend([like, like])
+    elif match and with_archive:
+        # the FTS index only covers the hot table
+        where.append("((a.archived = 0 AND a.id IN (SELECT rowid FROM main.audit_fts WHERE audit_fts MATCH ?))"
+                     " OR (a.archived = 1 AND (a.details LIKE ? OR a.ref_id LIKE ?)))")
+        params.extend([match, like, like])
+    elif match and not ranked:
+        where.append("a.id IN (SELECT rowid FROM audit_fts WHERE audit_fts MATCH ?)")
+        params.append(match)
+    if not ranked:
+        if before_ts is not None:
+            if before_id is not None:
+                where.append("(a.ts < ? OR (a.ts = ? AND a.id < ?))")
+                params.extend([before_ts, before_ts, before_id])
+            else:
+                where.append("a.ts < ?")
+                params.append(before_ts)
+        elif before_id is not None:
+            where.append("a.id < ?")
+            params.append(before_id)
+        if after_ts is not None:
+            if after_id is not None:
+                where.append("(a.ts > ? OR (a.ts = ? AND a.id > ?))")
+                params.extend([after_ts, after_ts, after_id])
+            else:
+                where.append("a.ts > ?")
+                params.append(after_ts)
+        elif after_id is not None:
+            where.append("a.id > ?")
+            params.append(after_id)
 
-    sql = "SELECT id, ts, user, action, entity, ref_id, details FROM audit_log"
+    source = "audit_log_all" if with_archive else "audit_log"
+    sql = f"SELECT a.id, a.ts, a.user, a.action, a.entity, a.ref_id, a.details FROM {source} a"
+    if ranked:
+        sql += " JOIN audit_fts f ON f.rowid = a.id"
+        where.insert(0, "audit_fts MATCH ?")
+        params.insert(0, match)
     if where:
         sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY datetime(ts) DESC LIMIT ?"
+    sql += " ORDER BY f.rank, a.ts DESC, a.id DESC LIMIT ?" if ranked else " ORDER BY a.ts DESC, a.id DESC LIMIT ?"
     params.append(limit)
 
+    # Read our own buffered writes
+    flush_audit()
+
     try:
         with get_cursor() as (conn, cur):
-            conn.row_factory = lambda cursor, row: {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+            if with_archive:
+                from .audit_archive import attach_archive
+                attach_archive(cur, start_date)
             cur.execute(sql, params)
-            rows = cur.fetchall()
+            rows = [dict(r) for r in cur.fetchall()]
         return rows
     except Exception as e:
         logger.error("Failed to fetch audit logs: %s", e)
@@ -114,6 +344,7 @@ def get_audit_distinct(field: str) -> List[str]:
         return []
 
     sql = f"SELECT DISTINCT {field} FROM audit_log WHERE {field} IS NOT NULL AND {field} <> '' ORDER BY {field}"
+    flush_audit()
 
     try:
         with get_cursor() as (conn, cur):
@@ -123,3 +354,21 @@ def get_audit_distinct(field: str) -> List[str]:
     except Exception as e:
         logger.error("Failed to fetch distinct values for %s: %s", field, e)
         return []
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Audit log maintenance.')
+    ap.add_argument('--rebuild-fts', action='store_true', help='backfill/rebuild the full-text search index')
+    args = ap.parse_args(argv)
+
+    from .connection import init_db
+    init_db().close()
+    if args.rebuild_fts:
+        print(f"Indexed {rebuild_audit_fts()} audit entries")
+    else:
+        ap.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
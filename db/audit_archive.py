@@ -0,0 +1,189 @@
+"""audit_archive.py - move old audit entries into a cold-storage database.
+
+``audit_log`` would otherwise grow forever inside ``app.db``. Entries older
+than the retention period (``audit_retention_months`` setting) are moved, in
+chunked transactions, into ``audit_archive.db`` next to the main database.
+Rows keep their ids (and chain hashes), so keyset cursors stay valid across
+both files. Only rows the hash-chain verification has already covered are
+moved, so archiving never hides unverified entries.
+
+The archive is only ATTACHed when a query reaches back past the archive
+boundary (``audit_archived_before`` setting); ``get_audit_logs`` then reads
+the ``audit_log_all`` temp view, a UNION ALL of the hot and archived rows.
+
+CLI::
+
+    python -m db.audit_archive --months 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from . import connection
+from .connection import get_cursor
+
+ARCHIVE_FILENAME = 'audit_archive.db'
+_RETENTION_KEY = 'audit_retention_months'
+_BOUNDARY_KEY = 'audit_archived_before'
+_COLUMNS = 'id, ts, user, action, entity, ref_id, details, row_hash'
+
+
+def archive_path() -> Path:
+    return Path(connection.DB_PATH).parent / ARCHIVE_FILENAME
+
+
+def _months_ago(months: int, today: Optional[date] = None) -> str:
+    d = today or date.today()
+    y, m = divmod(d.year * 12 + (d.month - 1) - months, 12)
+    # clamp the day for shorter months (e.g. 31 March - 1 month)
+    for day in (d.day, 30, 29, 28):
+        try:
+            return date(y, m + 1, day).isoformat()
+        except ValueError:
+            continue
+    return date(y, m + 1, 28).isoformat()
+
+
+def _ensure_archive_schema(cur) -> None:
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS arch.audit_log (
+        id INTEGER PRIMARY KEY,
+        ts TEXT,
+        user TEXT,
+        action TEXT,
+        entity TEXT,
+        ref_id TEXT,
+        details TEXT,
+        row_hash TEXT
+    )
+    ''')
+    cur.execute('PRAGMA arch.table_info(audit_log)')
+    if 'row_hash' not in [r['name'] for r in cur.fetchall()]:
+        cur.execute('ALTER TABLE arch.audit_log ADD COLUMN row_hash TEXT')
+    cur.execute('CREATE INDEX IF NOT EXISTS arch.idx_audit_ts ON audit_log(ts)')
+
+
+def archive_boundary(cur=None) -> Optional[str]:
+    """Date before which entries may live in the archive (None if never archived)."""
+    if cur is None:
+        with get_cursor() as (conn, c):
+            return archive_boundary(c)
+    cur.execute('SELECT value FROM settings WHERE key=?', (_BOUNDARY_KEY,))
+    row = cur.fetchone()
+    return row[0] if row and row[0] else None
+
+
+def attach_archive(cur, start_date: Optional[str] = None) -> bool:
+    """ATTACH the archive and create the ``audit_log_all`` view if the range needs it.
+
+    Returns True if queries on this connection should use ``audit_log_all``.
+    """
+    boundary = archive_boundary(cur)
+    if not boundary or (start_date and start_date[:10] >= boundary):
+        return False
+    path = archive_path()
+    if not path.exists():
+        return False
+    cur.execute('ATTACH DATABASE ? AS arch', (str(path),))
+    cur.execute(f'''
+    CREATE TEMP VIEW IF NOT EXISTS audit_log_all AS
+        SELECT {_COLUMNS}, 0 AS archived FROM main.audit_log
+        UNION ALL
+        SELECT {_COLUMNS}, 1 AS archived FROM arch.audit_log
+    ''')
+    return True
+
+
+def get_retention_months() -> int:
+    with get_cursor() as (conn, cur):
+        cur.execute('SELECT value FROM settings WHERE key=?', (_RETENTION_KEY,))
+        row = cur.fetchone()
+    try:
+        return max(0, int(row[0])) if row and row[0] else 0
+    except ValueError:
+        return 0
+
+
+def archive_audit_logs(months: Optional[int] = None, chunk_size: int = 5000,
+                       progress: Optional[Callable[[int], None]] = None) -> Dict[str, object]:
+    """Move audit entries older than ``months`` months into the archive database.
+
+    Args:
+        months: Retention period; defaults to the ``audit_retention_months``
+            setting. 0 disables archiving.
+        chunk_size: Rows moved per transaction.
+        progress: Optional ``callback(rows_moved)`` after each chunk.
+
+    Returns:
+        Dict with ``moved``, ``cutoff`` and ``seconds``.
+
+    Raises:
+        RuntimeError: if the audit hash chain fails verification.
+    """
+    from .audit import flush_audit, write_audit
+    from .audit_chain import verify_audit_chain
+    months = get_retention_months() if months is None else int(months)
+    if months <= 0:
+        return {'moved': 0, 'cutoff': None, 'seconds': 0.0}
+    cutoff = _months_ago(months)
+    t0 = time.perf_counter()
+    moved = 0
+    flush_audit()
+    check = verify_audit_chain()
+    if not check['ok']:
+        raise RuntimeError(f"Audit chain broken at id {check['broken_at']}: {check['reason']}; not archiving")
+    verified_to = check['last_id']
+    with get_cursor() as (conn, cur):
+        # the newest row stays: new entries chain onto its hash
+        cur.execute('SELECT MAX(id) FROM main.audit_log')
+        verified_to = min(verified_to, (cur.fetchone()[0] or 0) - 1)
+        cur.execute('ATTACH DATABASE ? AS arch', (str(archive_path()),))
+        _ensure_archive_schema(cur)
+        conn.commit()
+        while True:
+            cur.execute('SELECT id FROM main.audit_log WHERE ts < ? AND id <= ? ORDER BY ts, id LIMIT ?',
+                        (cutoff, verified_to, chunk_size))
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                break
+            marks = ','.join('?' * len(ids))
+            # copy + delete commit together (SQLite commits attached databases atomically)
+            cur.execute(f'INSERT OR IGNORE INTO arch.audit_log({_COLUMNS}) '
+                        f'SELECT {_COLUMNS} FROM main.audit_log WHERE id IN ({marks})', ids)
+            cur.execute(f'DELETE FROM main.audit_log WHERE id IN ({marks})', ids)
+            boundary = archive_boundary(cur)
+            if not boundary or cutoff > boundary:
+                cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)', (_BOUNDARY_KEY, cutoff))
+            conn.commit()
+            moved += len(ids)
+            if progress:
+                progress(moved)
+    if moved:
+        write_audit('archive', 'audit_log', cutoff, f"Moved {moved} entries older than {cutoff} to {ARCHIVE_FILENAME}")
+    return {'moved': moved, 'cutoff': cutoff, 'seconds': round(time.perf_counter() - t0, 3)}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Move old audit entries into audit_archive.db.')
+    ap.add_argument('--months', type=int, default=None,
+                    help='keep this many months in app.db (default: audit_retention_months setting)')
+    ap.add_argument('--chunk-size', type=int, default=5000)
+    args = ap.parse_args(argv)
+
+    connection.init_db().close()
+    stats = archive_audit_logs(args.months, chunk_size=args.chunk_size,
+                               progress=lambda n: print(f'{n} entries moved...'))
+    if stats['cutoff'] is None:
+        print('Archiving is disabled (set --months or the audit_retention_months setting)')
+    else:
+        print(f"Moved {stats['moved']} entries older than {stats['cutoff']} in {stats['seconds']}s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
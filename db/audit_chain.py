@@ -0,0 +1,183 @@
+"""audit_chain.py - tamper evidence for the audit log.
+
+Every ``audit_log`` row stores ``row_hash = sha256(previous row_hash +
+row fields)``, computed inside the INSERT itself (a SQL function registered
+on the writing connection) so concurrent writers cannot fork the chain.
+Editing, deleting or reordering a row breaks every hash after it.
+
+Verification is incremental: each run starts from the newest checkpoint in
+``audit_checkpoints`` (last verified id + hash, HMAC-signed with a key
+derived from the app secret), re-hashes only the rows after it and records
+new checkpoints as it goes, so a run costs O(new rows).
+
+Rows written before the chain existed have no hash; the chain starts at the
+first hashed row.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .connection import get_cursor
+
+_SEP = '\x1f'
+CHAIN_FUNCTION = 'audit_chain_hash'
+# Write a checkpoint every this many verified rows (and at the end of a run)
+CHECKPOINT_EVERY = 50_000
+_verify_lock = threading.Lock()
+
+
+def chain_hash(prev_hash, ts, user, action, entity, ref_id, details) -> str:
+    fields = (prev_hash, ts, user, action, entity, ref_id, details)
+    data = _SEP.join('' if v is None else str(v) for v in fields)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def register_chain_function(conn) -> None:
+    """Make ``audit_chain_hash(...)`` available to INSERTs on ``conn``."""
+    conn.create_function(CHAIN_FUNCTION, 7, chain_hash, deterministic=True)
+
+
+def _checkpoint_message(last_id: int, last_hash: str, verified_rows: int) -> bytes:
+    return f'audit-checkpoint:{last_id}:{last_hash}:{verified_rows}'.encode('utf-8')
+
+
+def _sign(last_id: int, last_hash: str, verified_rows: int) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        from core.crypto_utils import sign
+        return sign(_checkpoint_message(last_id, last_hash, verified_rows))
+    except Exception:
+        return None, None
+
+
+def _signature_ok(row) -> bool:
+    if not row['signature']:
+        return False
+    try:
+        from core.crypto_utils import verify_signature
+    except Exception:
+        return False
+    return verify_signature(_checkpoint_message(row['last_id'], row['last_hash'], row['verified_rows']),
+                            row['key_id'], row['signature'])
+
+
+def last_checkpoint(cur=None):
+    if cur is None:
+        with get_cursor() as (conn, c):
+            return last_checkpoint(c)
+    cur.execute('SELECT id, last_id, last_hash, verified_rows, created_at, key_id, signature '
+                'FROM audit_checkpoints ORDER BY id DESC LIMIT 1')
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def _save_checkpoint(cur, last_id: int, last_hash: str, verified_rows: int) -> None:
+    kid, sig = _sign(last_id, last_hash, verified_rows)
+    cur.execute('INSERT INTO audit_checkpoints(last_id, last_hash, verified_rows, key_id, signature) '
+                'VALUES (?,?,?,?,?)', (last_id, last_hash, verified_rows, kid, sig))
+
+
+def _archived_row(cur, row_id: int):
+    """Row ``row_id`` of the archive database, if it was archived (older than the boundary)."""
+    from .audit_archive import archive_boundary, attach_archive
+    boundary = archive_boundary(cur)
+    if not boundary or not attach_archive(cur):
+        return None
+    cur.execute('SELECT ts, row_hash FROM arch.audit_log WHERE id=?', (row_id,))
+    row = cur.fetchone()
+    if row is None or not row['ts'] or row['ts'] >= boundary:
+        return None
+    return row
+
+
+def verify_audit_chain(chunk_size: int = 5000,
+                       progress: Optional[Callable[[int, int], None]] = None,
+                       cancel: Optional[threading.Event] = None,
+                       full: bool = False) -> Dict[str, object]:
+    """Verify rows added since the last checkpoint.
+
+    Args:
+        chunk_size: Rows read per query.
+        progress: Optional ``callback(rows_verified, last_id)`` after each chunk.
+        cancel: Optional event; stops after the current chunk (progress so far
+            is checkpointed).
+        full: Ignore checkpoints and re-verify the hot table from its first row
+            (O(all rows); use for audits, the incremental run covers new rows).
+
+    Returns:
+        Dict with ``ok``, ``verified`` (rows checked this run), ``last_id``,
+        ``broken_at`` (first bad row id, or None), ``reason``, ``unsealed``
+        (legacy rows without a hash) and ``seconds``.
+    """
+    from .audit import flush_audit
+    flush_audit()
+    t0 = time.perf_counter()
+    out: Dict[str, object] = {'ok': True, 'verified': 0, 'last_id': 0, 'broken_at': None,
+                              'reason': '', 'unsealed': 0, 'seconds': 0.0}
+
+    def _fail(row_id, reason):
+        out.update(ok=False, broken_at=row_id, reason=reason,
+                   seconds=round(time.perf_counter() - t0, 3))
+        return out
+
+    with _verify_lock, get_cursor() as (conn, cur):
+        cp = None if full else last_checkpoint(cur)
+        if cp:
+            if not _signature_ok(cp):
+                return _fail(cp['last_id'], 'checkpoint signature is invalid')
+            cur.execute('SELECT row_hash FROM audit_log WHERE id=?', (cp['last_id'],))
+            row = cur.fetchone()
+            if row is None:
+                # only an archived row may be gone from the hot table
+                row = _archived_row(cur, cp['last_id'])
+                if row is None:
+                    return _fail(cp['last_id'], 'checkpointed row missing')
+            if row['row_hash'] != cp['last_hash']:
+                return _fail(cp['last_id'], 'checkpointed row was modified')
+            last_id, prev, total = cp['last_id'], cp['last_hash'], cp['verified_rows']
+        else:
+            last_id, prev, total = 0, None, 0
+            cur.execute("SELECT 1 FROM settings WHERE key='audit_archived_before'")
+            if full and cur.fetchone():
+                # older rows live in the archive: anchor on the oldest hot row's stored hash
+                cur.execute('SELECT id, row_hash FROM audit_log WHERE row_hash IS NOT NULL ORDER BY id LIMIT 1')
+                first = cur.fetchone()
+                if first:
+                    last_id, prev = first['id'], first['row_hash']
+        since_cp = 0
+        while True:
+            cur.execute('SELECT id, ts, user, action, entity, ref_id, details, row_hash FROM audit_log '
+                        'WHERE id > ? ORDER BY id LIMIT ?', (last_id, chunk_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            for r in rows:
+                if r['row_hash'] is None:
+                    if prev is None:
+                        out['unsealed'] += 1
+                        last_id = r['id']
+                        continue
+                    return _fail(r['id'], 'row hash missing')
+                expected = chain_hash(prev, r['ts'], r['user'], r['action'], r['entity'], r['ref_id'], r['details'])
+                if expected != r['row_hash']:
+                    return _fail(r['id'], 'row hash mismatch (edited, deleted or reordered)')
+                prev, last_id = r['row_hash'], r['id']
+                out['verified'] += 1
+                since_cp += 1
+            if since_cp >= CHECKPOINT_EVERY and prev is not None:
+                _save_checkpoint(cur, last_id, prev, total + out['verified'])
+                conn.commit()
+                since_cp = 0
+            if progress:
+                progress(out['verified'], last_id)
+            if cancel is not None and cancel.is_set():
+                break
+        if since_cp and prev is not None:
+            _save_checkpoint(cur, last_id, prev, total + out['verified'])
+            conn.commit()
+    out['last_id'] = last_id
+    out['seconds'] = round(time.perf_counter() - t0, 3)
+    return out
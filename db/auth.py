@@ -2,17 +2,101 @@ from .connection import get_conn, get_cursor
 import os
 import hashlib
 import hmac
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, Tuple
 
 # ------------------------ SECURITY: USERS & AUTH ------------------------
 _CURRENT_USER: Dict[str, Optional[str]] = {"username": None, "role": None}
 
+# Hash parameters are stored per user as "pbkdf2_sha256$<iterations>" or
+# "scrypt$<n>$<r>$<p>". Rows created before this column existed used
+# PBKDF2 with 120k iterations.
+LEGACY_HASH_PARAMS = 'pbkdf2_sha256$120000'
+DEFAULT_HASH_PARAMS = 'scrypt$16384$8$1'
+_HASH_PARAMS_SETTING = 'password_hash_params'
+
 
 def _pbkdf2_hash(password: str, salt: bytes, iterations: int = 120_000) -> bytes:
     """Return PBKDF2-HMAC-SHA256 hash of a password."""
     return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
 
 
+def _scrypt_hash(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    """Return scrypt hash of a password (32-byte key, like PBKDF2-SHA256)."""
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + (1 << 20), dklen=32)
+
+
+def _parse_params(params: Optional[str]) -> Tuple[str, Tuple[int, ...]]:
+    scheme, *args = (params or LEGACY_HASH_PARAMS).split('$')
+    return scheme, tuple(int(a) for a in args)
+
+
+def hash_password(password: str, salt: bytes, params: Optional[str] = None) -> bytes:
+    """Hash ``password`` with the scheme and parameters encoded in ``params``."""
+    scheme, args = _parse_params(params)
+    if scheme == 'pbkdf2_sha256':
+        return _pbkdf2_hash(password, salt, *args)
+    if scheme == 'scrypt':
+        return _scrypt_hash(password, salt, *args)
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+
+def current_hash_params() -> str:
+    """Parameters for new hashes: the calibrated setting, else the default.
+
+    Falls back to PBKDF2 when this Python's OpenSSL lacks scrypt.
+    """
+    params = None
+    try:
+        from .settings import get_setting
+        params = get_setting(_HASH_PARAMS_SETTING, None)
+    except Exception:
+        pass
+    params = params or DEFAULT_HASH_PARAMS
+    if params.startswith('scrypt') and not hasattr(hashlib, 'scrypt'):
+        return LEGACY_HASH_PARAMS
+    return params
+
+
+def calibrate_hash_params(target_ms: float = 250.0, scheme: str = 'scrypt') -> Dict[str, Any]:
+    """Pick parameters whose hash takes about ``target_ms`` on this machine.
+
+    scrypt keeps r=8, p=1 and doubles N (memory grows with it); PBKDF2 scales
+    the iteration count linearly from a timed sample. Never goes below the
+    legacy/default strength.
+
+    Returns:
+        Dict with ``params`` and measured ``ms``.
+    """
+    salt = os.urandom(16)
+
+    def _time(params: str) -> float:
+        t0 = time.perf_counter()
+        hash_password('calibration-password', salt, params)
+        return (time.perf_counter() - t0) * 1000.0
+
+    if scheme == 'scrypt' and hasattr(hashlib, 'scrypt'):
+        n = 1 << 14
+        ms = _time(f'scrypt${n}$8$1')
+        # stop at N=2^20 (1 GiB of memory)
+        while ms * 2 <= target_ms and n < (1 << 20):
+            n <<= 1
+            ms = _time(f'scrypt${n}$8$1')
+        params = f'scrypt${n}$8$1'
+    else:
+        sample = 50_000
+        ms = _time(f'pbkdf2_sha256${sample}')
+        iterations = max(120_000, int(sample * target_ms / max(ms, 0.001)) // 1000 * 1000)
+        params = f'pbkdf2_sha256${iterations}'
+        ms = _time(params)
+    return {'params': params, 'ms': round(ms, 1)}
+
+
+def needs_rehash(params: Optional[str]) -> bool:
+    return (params or LEGACY_HASH_PARAMS) != current_hash_params()
+
+
 def create_user(username: str, password: str, role: str = 'user') -> bool:
     """Create a new user with hashed password and unique salt."""
     username, role = username.strip(), role.strip() or 'user'
@@ -20,13 +104,14 @@ def create_user(username: str, password: str, role: str = 'user') -> bool:
         return False
 
     salt = os.urandom(16)
-    pwd_hash = _pbkdf2_hash(password, salt)
+    params = current_hash_params()
+    pwd_hash = hash_password(password, salt, params)
 
     try:
         with get_cursor() as (conn, cur):
             cur.execute(
-                'INSERT INTO users (username, password_hash, salt, role) VALUES (?,?,?,?)',
-                (username, pwd_hash, salt, role)
+                'INSERT INTO users (username, password_hash, salt, role, hash_params) VALUES (?,?,?,?,?)',
+                (username, pwd_hash, salt, role, params)
             )
             conn.commit()
             return True
@@ -44,11 +129,16 @@ def users_exist() -> bool:
 
 
 def verify_user(username: str, password: str) -> bool:
-    """Verify a user's password and set _CURRENT_USER if valid."""
+    """Verify a user's password and set _CURRENT_USER if valid.
+
+    Deliberately slow (it runs the password hash); call it off the UI thread.
+    A successful login with outdated hash parameters re-hashes the password
+    with the current ones.
+    """
     username = username.strip()
     with get_cursor() as (conn, cur):
         cur.execute(
-            'SELECT username, password_hash, salt, role FROM users WHERE username=?',
+            'SELECT username, password_hash, salt, role, hash_params FROM users WHERE username=?',
             (username,)
         )
         row = cur.fetchone()
@@ -56,10 +146,27 @@ def verify_user(username: str, password: str) -> bool:
     if not row:
         return False
 
-    test_hash = _pbkdf2_hash(password, row['salt'])
+    try:
+        test_hash = hash_password(password, row['salt'], row['hash_params'])
+    except Exception as e:
+        print(f"[ERROR] Failed to hash password: {e}")
+        return False
     if not hmac.compare_digest(row['password_hash'], test_hash):
         return False
 
+    if needs_rehash(row['hash_params']):
+        try:
+            params = current_hash_params()
+            salt = os.urandom(16)
+            new_hash = hash_password(password, salt, params)
+            with get_cursor() as (conn, cur):
+                cur.execute('UPDATE users SET password_hash=?, salt=?, hash_params=? WHERE username=?',
+                            (new_hash, salt, params, row['username']))
+                conn.commit()
+        except Exception as e:
+            # login still succeeds; the upgrade is retried next time
+            print(f"[ERROR] Failed to upgrade password hash: {e}")
+
     _CURRENT_USER['username'] = row['username']
     _CURRENT_USER['role'] = row['role'] or 'user'
     return True
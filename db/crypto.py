@@ -2,7 +2,7 @@
 
 try:
     # Optional encryption helpers (now sibling package instead of relative)
-    from core.crypto_utils import encrypt_str, decrypt_str  # type: ignore
+    from core.crypto_utils import encrypt_str, decrypt_str, encrypt_many, decrypt_many  # type: ignore
     print("[DEBUG] Using encrypt_str from core.crypto_utils:", encrypt_str)
 except Exception as e:  # pragma: no cover - fallback if module missing
     print(f"[DEBUG] Failed to import encrypt_str from core.crypto_utils: {e}")
@@ -10,4 +10,82 @@ except Exception as e:  # pragma: no cover - fallback if module missing
         return x
     def decrypt_str(x):
         return x
-print("[DEBUG] Final encrypt_str is:", encrypt_str)
\ No newline at end of file
+    def encrypt_many(xs):
+        return list(xs)
+    def decrypt_many(xs):
+        return list(xs)
+print("[DEBUG] Final encrypt_str is:", encrypt_str)
+
+class LazyDecryptRow(dict):
+    """Row dict whose encrypted fields are decrypted on first access.
+
+    List DAOs return these so screens that never read ``notes`` don't pay
+    for decrypting every row. ``r['notes']``, ``r.get('notes')``, ``items()``,
+    ``values()``, ``dict(r)`` and ``copy()`` all see plaintext; the result is
+    memoized in the row.
+    """
+
+    __slots__ = ('_pending',)
+
+    def __init__(self, data=(), encrypted_fields=('notes',)):
+        super().__init__(data)
+        self._pending = {f for f in encrypted_fields if dict.__contains__(self, f)}
+
+    def _resolve(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            dict.__setitem__(self, key, decrypt_str(dict.__getitem__(self, key)))
+
+    def _resolve_all(self):
+        for k in list(self._pending):
+            self._resolve(k)
+
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def pop(self, key, *default):
+        self._resolve(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self._resolve(key)
+        return dict.setdefault(self, key, default)
+
+    def __iter__(self):
+        # Defined in Python so dict(row)/{**row} go through __getitem__
+        return dict.__iter__(self)
+
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._resolve_all()
+        return dict(dict.items(self))
+
+    def __eq__(self, other):
+        self._resolve_all()
+        return dict.__eq__(self, other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self):
+        self._resolve_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
@@ -17,7 +17,7 @@ def _row_to_dict(row, cols):
 def get_next_customer_id():
     try:
         with get_cursor() as (conn, cur):
-            cur.execute("SELECT customer_id FROM customers ORDER BY id DESC LIMIT 1")
+            cur.execute("SELECT customer_id FROM customers ORDER BY rowid DESC LIMIT 1")
             row = cur.fetchone()
         # normalize result retrieval
         if not row:
@@ -54,7 +54,7 @@ def read_customers():
     cols = ['customer_id', 'name', 'email', 'phone', 'address', 'notes', 'created_date']
     try:
         with get_cursor() as (conn, cur):
-            cur.execute('SELECT customer_id, name, email, phone, address, notes, created_date FROM customers ORDER BY id DESC')
+            cur.execute('SELECT customer_id, name, email, phone, address, notes, created_date FROM customers ORDER BY rowid DESC')
             rows = cur.fetchall()
         out = []
         for r in rows:
@@ -64,22 +64,20 @@ def read_customers():
         return []
 
 
+_CUSTOMER_COLUMNS = ('name', 'email', 'phone', 'address', 'notes', 'created_date')
+
+
 def write_customers(customers):
+    """Make the customers table match ``customers``, writing only what changed.
+
+    Returns the ``table_sync.sync_table`` report (row counts, audit entries, seconds).
+    """
+    from .table_sync import sync_table
     try:
-        with get_cursor() as (conn, cur):
-            # Replace all customers with provided list
-            cur.execute('DELETE FROM customers')
-            for c in (customers or []):
-                cur.execute('''
-                    INSERT INTO customers(customer_id, name, email, phone, address, notes, created_date)
-                    VALUES (?,?,?,?,?,?,?)
-                ''', (
-                    c.get('customer_id'), c.get('name'), c.get('email'),
-                    c.get('phone'), c.get('address'), c.get('notes'), c.get('created_date')
-                ))
-            conn.commit()
+        return sync_table('customers', 'customer_id', _CUSTOMER_COLUMNS, customers or [],
+                          audit_entity='customer')
     except Exception:
-        pass
+        return None
 
 
 def find_customer_by_name(name):
@@ -99,36 +97,45 @@ def find_customer_by_name(name):
         return []
 
 
+def _read_customer(cur, customer_id):
+    cols = ['customer_id', 'name', 'email', 'phone', 'address', 'notes', 'created_date']
+    cur.execute('SELECT customer_id, name, email, phone, address, notes, created_date FROM customers WHERE customer_id=?',
+                (customer_id,))
+    return _row_to_dict(cur.fetchone(), cols)
+
+
 def edit_customer(customer_id, name='', email='', phone='', address='', notes=''):
-    customers = read_customers()
+    from .table_sync import sync_table
     target_id = (customer_id or '').strip()
     if not target_id:
         return False
-    for i, customer in enumerate(customers):
-        if (customer.get('customer_id') or '').strip() == target_id:
-            customers[i].update({
-                'name': name.strip() if name else customer.get('name', ''),
-                'email': email.strip() if email else customer.get('email', ''),
-                'phone': phone.strip() if phone else customer.get('phone', ''),
-                'address': address.strip() if address else customer.get('address', ''),
-                'notes': notes.strip() if notes else customer.get('notes', ''),
-            })
-            write_customers(customers)
-            return True
-    return False
+    with get_cursor() as (conn, cur):
+        customer = _read_customer(cur, target_id)
+        if not customer:
+            return False
+        customer.update({
+            'name': name.strip() if name else customer.get('name', ''),
+            'email': email.strip() if email else customer.get('email', ''),
+            'phone': phone.strip() if phone else customer.get('phone', ''),
+            'address': address.strip() if address else customer.get('address', ''),
+            'notes': notes.strip() if notes else customer.get('notes', ''),
+        })
+        sync_table('customers', 'customer_id', _CUSTOMER_COLUMNS, [customer],
+                   scope_keys=[target_id], audit_entity='customer', cur=cur)
+        conn.commit()
+    return True
 
 
 def delete_customer(customer_id):
-    customers = read_customers()
+    from .table_sync import sync_table
     target_id = (customer_id or '').strip()
     if not target_id:
         return False
-    original_count = len(customers)
-    customers = [c for c in customers if (c.get('customer_id') or '').strip() != target_id]
-    if len(customers) < original_count:
-        write_customers(customers)
-        return True
-    return False
+    with get_cursor() as (conn, cur):
+        report = sync_table('customers', 'customer_id', _CUSTOMER_COLUMNS, [],
+                            scope_keys=[target_id], audit_entity='customer', cur=cur)
+        conn.commit()
+    return report['deleted'] > 0
 
 
 def get_customer_sales_summary(customer_id):
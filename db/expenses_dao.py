@@ -2,7 +2,8 @@ from .imports_dao import recompute_import_batches
 from .connection import get_cursor
 from .audit import write_audit
 from .settings import get_default_expense_currency, get_base_currency
-from .crypto import encrypt_str, decrypt_str
+from .crypto import encrypt_str, LazyDecryptRow
+from .note_index import index_note
 from .auth import require_admin
 from .imports_dao import recompute_import_batches
 
@@ -50,6 +51,7 @@ def add_expense(date, amount, is_import_related=False, import_id=None, category=
         _cur.execute('''INSERT INTO expenses (date, amount, is_import_related, import_id, category, notes, document_path, currency, vat_rate, vat_amount, is_vat_inclusive)
                     VALUES (?,?,?,?,?,?,?,?,?,?,?)''', (date, amount, 1 if is_import_related else 0, first_id, category, enc_notes, document_path, exp_ccy, vat_rate, vat, 1 if is_vat_inclusive else 0))
         expense_id = _cur.lastrowid
+        index_note(_cur, 'expense', expense_id, notes)
         try:
             for iid in ids:
                 _cur.execute('INSERT OR IGNORE INTO expense_import_links (expense_id, import_id) VALUES (?,?)', (expense_id, iid))
@@ -84,10 +86,10 @@ def get_expenses(limit=500):
             cur.execute('SELECT id, date, amount, is_import_related, import_id, category, notes, document_path, currency, vat_rate, vat_amount, is_vat_inclusive FROM active_expenses ORDER BY id DESC LIMIT ?', (limit,))
         except Exception:
             cur.execute('SELECT id, date, amount, is_import_related, import_id, category, notes, document_path, currency, vat_rate, vat_amount, is_vat_inclusive FROM expenses ORDER BY id DESC LIMIT ?', (limit,))
-        rows = [dict(r) for r in cur.fetchall()]
+        # notes stay encrypted until a caller reads them
+        rows = [LazyDecryptRow(r) for r in cur.fetchall()]
 
     for r in rows:
-        r['notes'] = decrypt_str(r.get('notes'))
         # Calculate net and gross
         is_incl = r.get('is_vat_inclusive', 1)
         amt = r.get('amount', 0) or 0
@@ -130,6 +132,7 @@ def edit_expense(expense_id, date, amount, is_import_related=False, import_id=No
     with get_cursor() as (conn, cur):
         cur.execute('''UPDATE expenses SET date=?, amount=?, is_import_related=?, import_id=?, category=?, notes=?, document_path=?, currency=?, vat_rate=?, vat_amount=?, is_vat_inclusive=? WHERE id=?''',
                     (date, amount, 1 if is_import_related else 0, first_id, category, enc_notes, document_path, exp_ccy, vat_rate, vat, 1 if is_vat_inclusive else 0, expense_id))
+        index_note(cur, 'expense', expense_id, notes)
         try:
             cur.execute('DELETE FROM expense_import_links WHERE expense_id=?', (expense_id,))
             for iid in ids:
@@ -0,0 +1,260 @@
+"""fx_loader.py - offline bulk loader for historical FX rates.
+
+Production machines are often offline, so rates can be loaded from files
+instead of the Frankfurter API:
+
+- ECB historical reference rates (``eurofxref-hist.zip``), either the CSV
+  (``Date,USD,JPY,...``) or the XML (``<Cube time=..><Cube currency=.. rate=..>``)
+  variant, zipped or not;
+- a generic long CSV with a ``date,ccy,rate`` header, where ``rate`` is units
+  of ``ccy`` per one unit of ``quote_ccy`` (EUR by default, like the ECB).
+
+Files are streamed one publication date at a time. For each date the quote
+rates are pivoted into cross rates against the app's anchor currencies (base
+and default currencies) in both directions, and upserted into ``fx_cache`` in
+chunked transactions.
+
+CLI::
+
+    python -m db.fx_loader eurofxref-hist.zip
+    python -m db.fx_loader rates.csv --quote USD --anchor TRY
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import itertools
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .connection import get_cursor
+
+DayRates = Tuple[str, Dict[str, float]]
+
+_UPSERT_SQL = (
+    'INSERT INTO fx_cache(date, from_ccy, to_ccy, rate) VALUES (?,?,?,?) '
+    'ON CONFLICT(date, from_ccy, to_ccy) DO UPDATE SET rate=excluded.rate'
+)
+
+
+def _to_rate(v) -> Optional[float]:
+    try:
+        r = float(str(v).strip())
+    except Exception:
+        return None
+    return r if r > 0 else None
+
+
+def _iter_wide_csv(reader) -> Iterator[DayRates]:
+    """ECB layout: ``Date,USD,JPY,...`` with one row per date (``N/A`` for gaps)."""
+    header = None
+    for row in reader:
+        if not row:
+            continue
+        if header is None:
+            header = [(h or '').strip().upper() for h in row]
+            continue
+        d = (row[0] or '').strip()
+        if not d:
+            continue
+        rates = {}
+        for ccy, v in zip(header[1:], row[1:]):
+            r = _to_rate(v) if ccy else None
+            if r:
+                rates[ccy] = r
+        if rates:
+            yield d, rates
+
+
+def _iter_long_csv(reader, cols: Dict[str, int]) -> Iterator[DayRates]:
+    """Generic layout: one ``date,ccy,rate`` row per quote; rows of a date must be contiguous."""
+    cur_date, rates = None, {}
+    for row in reader:
+        if not row or len(row) <= max(cols.values()):
+            continue
+        d = (row[cols['date']] or '').strip()
+        ccy = (row[cols['ccy']] or '').strip().upper()
+        r = _to_rate(row[cols['rate']])
+        if not d or not ccy or not r:
+            continue
+        if d != cur_date:
+            if cur_date and rates:
+                yield cur_date, rates
+            cur_date, rates = d, {}
+        rates[ccy] = r
+    if cur_date and rates:
+        yield cur_date, rates
+
+
+def _iter_csv(text) -> Iterator[DayRates]:
+    reader = csv.reader(text)
+    first = next(reader, None)
+    if not first:
+        return
+    names = [(h or '').strip().lower() for h in first]
+    ccy_col = 'ccy' if 'ccy' in names else ('currency' if 'currency' in names else None)
+    if 'date' in names and 'rate' in names and ccy_col:
+        cols = {'date': names.index('date'), 'ccy': names.index(ccy_col), 'rate': names.index('rate')}
+        yield from _iter_long_csv(reader, cols)
+    else:
+        # put the header back in front for the wide parser
+        yield from _iter_wide_csv(itertools.chain([first], reader))
+
+
+def _iter_xml(fh) -> Iterator[DayRates]:
+    """ECB XML: ``<Cube time="YYYY-MM-DD"><Cube currency="USD" rate="1.1"/>...</Cube>``."""
+    cur_date, rates = None, {}
+    for event, el in ET.iterparse(fh, events=('start', 'end')):
+        tag = el.tag.rsplit('}', 1)[-1]
+        if tag != 'Cube':
+            continue
+        if event == 'start' and el.get('time'):
+            cur_date, rates = el.get('time'), {}
+        elif event == 'end' and el.get('currency'):
+            r = _to_rate(el.get('rate'))
+            if r:
+                rates[el.get('currency').upper()] = r
+        elif event == 'end' and el.get('time'):
+            if cur_date and rates:
+                yield cur_date, rates
+            cur_date, rates = None, {}
+            el.clear()
+
+
+def iter_rate_file(path) -> Iterator[DayRates]:
+    """Yield ``(date, {ccy: units per quote})`` per publication date from a supported file."""
+    p = Path(path)
+    if zipfile.is_zipfile(p):
+        with zipfile.ZipFile(p) as zf:
+            members = [n for n in zf.namelist() if n.lower().endswith(('.csv', '.xml'))]
+            if not members:
+                raise ValueError(f'No CSV or XML rate file inside {p.name}')
+            name = members[0]
+            with zf.open(name) as raw:
+                if name.lower().endswith('.xml'):
+                    yield from _iter_xml(raw)
+                else:
+                    yield from _iter_csv(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        return
+    if p.suffix.lower() == '.xml':
+        with open(p, 'rb') as fh:
+            yield from _iter_xml(fh)
+        return
+    with open(p, encoding='utf-8-sig', newline='') as fh:
+        yield from _iter_csv(fh)
+
+
+def pivot_rows(date_str: str, rates: Dict[str, float], quote_ccy: str,
+               anchors: Iterable[str]) -> List[Tuple[str, str, str, float]]:
+    """Cross rates for one date: every currency against every anchor, both directions."""
+    day = dict(rates)
+    day[quote_ccy] = 1.0
+    out, seen = [], set()
+    for a in anchors:
+        ra = day.get(a)
+        if not ra:
+            continue
+        for x, rx in day.items():
+            if x == a:
+                continue
+            for f, t, v in ((x, a, ra / rx), (a, x, rx / ra)):
+                if (f, t) not in seen:
+                    seen.add((f, t))
+                    out.append((date_str, f, t, v))
+    return out
+
+
+def _default_anchors() -> Set[str]:
+    anchors = {'EUR'}
+    try:
+        from .settings import (get_base_currency, get_default_import_currency,
+                               get_default_sale_currency, get_default_expense_currency)
+        for fn in (get_base_currency, get_default_import_currency,
+                   get_default_sale_currency, get_default_expense_currency):
+            try:
+                anchors.add((fn() or '').upper())
+            except Exception:
+                pass
+    except Exception:
+        pass
+    anchors.discard('')
+    return anchors
+
+
+def load_fx_file(path, quote_ccy: str = 'EUR', anchors: Optional[Iterable[str]] = None,
+                 chunk_size: int = 50_000,
+                 progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, float]:
+    """Stream a rate file into ``fx_cache`` with upsert semantics.
+
+    Args:
+        path: ECB zip/CSV/XML or a generic ``date,ccy,rate`` CSV.
+        quote_ccy: Currency the file's rates are quoted against (EUR for ECB files).
+        anchors: Currencies to pivot into; defaults to EUR plus the base and
+            default import/sale/expense currencies.
+        chunk_size: Rows per transaction.
+        progress: Optional ``callback(dates_done, rows_written)`` after each chunk.
+
+    Returns:
+        Dict with ``dates``, ``rows`` and ``seconds``.
+    """
+    quote_ccy = (quote_ccy or 'EUR').upper()
+    anchor_set = {(a or '').upper() for a in (anchors or _default_anchors())} - {''}
+    t0 = time.perf_counter()
+    dates = rows = 0
+    buf: List[Tuple[str, str, str, float]] = []
+    with get_cursor() as (conn, cur):
+        for d, day_rates in iter_rate_file(path):
+            buf.extend(pivot_rows(d, day_rates, quote_ccy, anchor_set))
+            dates += 1
+            if len(buf) >= chunk_size:
+                cur.executemany(_UPSERT_SQL, buf)
+                conn.commit()
+                rows += len(buf)
+                buf = []
+                if progress:
+                    progress(dates, rows)
+        if buf:
+            cur.executemany(_UPSERT_SQL, buf)
+            conn.commit()
+            rows += len(buf)
+            if progress:
+                progress(dates, rows)
+    # The publication-date index and mapped series were built from the old fx_cache contents
+    try:
+        import core.fx_calendar as fx_calendar
+        fx_calendar.clear()
+    except Exception:
+        pass
+    try:
+        import core.fx_series as fx_series
+        fx_series.build()
+    except Exception:
+        pass
+    return {'dates': dates, 'rows': rows, 'seconds': round(time.perf_counter() - t0, 3)}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Load historical FX rates into fx_cache.')
+    ap.add_argument('path', help='ECB eurofxref-hist zip/csv/xml or a date,ccy,rate CSV')
+    ap.add_argument('--quote', default='EUR', help='currency the file is quoted against (default: EUR)')
+    ap.add_argument('--anchor', action='append', default=None,
+                    help='currency to pivot into (repeatable; default: EUR + app currencies)')
+    ap.add_argument('--chunk-size', type=int, default=50_000)
+    args = ap.parse_args(argv)
+
+    from .connection import init_db
+    init_db().close()
+    stats = load_fx_file(args.path, quote_ccy=args.quote, anchors=args.anchor,
+                         chunk_size=args.chunk_size,
+                         progress=lambda d, r: print(f'{d} dates, {r} rows...'))
+    print(f"Loaded {stats['rows']} rates for {stats['dates']} dates in {stats['seconds']}s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
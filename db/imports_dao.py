@@ -3,12 +3,13 @@ from core.vat_utils import compute_vat
 from .connection import get_cursor
 from .suppliers_dao import find_or_create_supplier
 from .settings import get_default_import_currency, get_base_currency
-from .crypto import encrypt_str, decrypt_str
+from .crypto import encrypt_str, LazyDecryptRow
+from .note_index import index_note
 from .auth import require_admin
 from .utils import float_or_none
-from .inventory_dao import update_inventory, rebuild_inventory_from_imports
 from .audit import write_audit
 from .rates import convert_amount
+from .sale_orders_dao import allocation_filter
 
 def add_import(
     date: str,
@@ -85,6 +86,7 @@ def add_import(
             document_path
         ))
         import_id = _cur.lastrowid
+        index_note(_cur, 'import', import_id, notes)
     except Exception as e:
         raise
 
@@ -253,7 +255,7 @@ def _insert_line(
     notes: str
 ) -> None:
     """
-    Insert a line into import_lines, create a batch, and update inventory.
+    Insert a line into import_lines and create its batch (inventory follows the batch).
     """
     if not cat or price is None or qty is None:
         return
@@ -266,12 +268,11 @@ def _insert_line(
     unit_cost_ccy, unit_cost_base, fx_to_base = _compute_cost_base(date, price, cur_ccy, fx_override)
     create_import_batch(import_id, date, cat, sub, qty, unit_cost_ccy, supplier, notes,
                         cur_ccy, fx_to_base, unit_cost_base, unit_cost_ccy, import_line_id=import_line_id, cur=cur)
-    update_inventory(cat, sub, qty, cur=cur)
 
 
 def get_imports(limit: int = 500) -> List[Dict]:
     """
-    Return a list of recent imports (active or all), decrypting notes.
+    Return a list of recent imports (active or all); notes decrypt lazily on access.
     """
     with get_cursor() as (conn, cur):
         try:
@@ -280,10 +281,10 @@ def get_imports(limit: int = 500) -> List[Dict]:
         except Exception:
             cur.execute(
                 'SELECT id, date, ordered_price, quantity, supplier, notes, category, subcategory, currency, vat_rate, vat_amount, is_vat_inclusive FROM imports ORDER BY id DESC LIMIT ?', (limit,))
-        rows = [dict(r) for r in cur.fetchall()]
+        # notes stay encrypted until a caller reads them
+        rows = [LazyDecryptRow(r) for r in cur.fetchall()]
 
     for r in rows:
-        r['notes'] = decrypt_str(r.get('notes'))
         # Calculate net and gross
         is_incl = r.get('is_vat_inclusive', 1)
         amt = r.get('ordered_price', 0) or 0
@@ -306,7 +307,7 @@ def get_imports_with_lines(limit: int = 500) -> List[Dict]:
             cur.execute(
                 'SELECT id, date, ordered_price, quantity, supplier, notes, category, subcategory, currency, deleted '
                 'FROM imports ORDER BY id DESC LIMIT ?', (limit,))
-        imports = [dict(r) for r in cur.fetchall()]
+        imports = [LazyDecryptRow(r) for r in cur.fetchall()]
 
         out = []
         for imp in imports:
@@ -322,7 +323,6 @@ def get_imports_with_lines(limit: int = 500) -> List[Dict]:
                 except Exception:
                     continue
             imp['lines'] = lines
-            imp['notes'] = decrypt_str(imp.get('notes'))
             out.append(imp)
 
     return out
@@ -374,11 +374,12 @@ def edit_import(
 
         cur.execute('''UPDATE imports SET date=?, ordered_price=?, quantity=?, supplier=?, supplier_id=?, notes=?, category=?, subcategory=?, currency=?, vat_rate=?, vat_amount=?, is_vat_inclusive=?, document_path=? WHERE id=?''',
             (date, ordered_price, quantity, supplier_name, supplier_id, encrypt_str(notes), category, subcategory, new_currency, vat_rate, vat, 1 if is_vat_inclusive else 0, document_path, import_id))
+        index_note(cur, 'import', import_id, notes)
 
 
 def delete_import(import_id: int) -> None:
     """
-    Soft-delete an import and its batches, then rebuild inventory.
+    Soft-delete an import and its batches (inventory drops their stock).
     Requires admin privileges.
     """
     require_admin('delete', 'import', str(import_id))
@@ -387,17 +388,12 @@ def delete_import(import_id: int) -> None:
         # Soft-delete the import and its batches
         cur.execute('UPDATE import_batches SET deleted=1 WHERE import_id=?', (import_id,))
         cur.execute('UPDATE imports SET deleted=1 WHERE id=?', (import_id,))
-    
-    # Rebuild inventory from non-deleted imports
-    with get_cursor() as (conn, cur):
-        rebuild_inventory_from_imports(cur)
-    
-    write_audit('delete', 'import', str(import_id), 'soft-deleted', cur=cur)
+        write_audit('delete', 'import', str(import_id), 'soft-deleted', cur=cur)
 
 
 def undelete_import(import_id: int) -> None:
     """
-    Restore a soft-deleted import and its batches, then rebuild inventory.
+    Restore a soft-deleted import and its batches (inventory regains their stock).
     """
     try:
         require_admin('undelete', 'import', str(import_id))
@@ -407,11 +403,7 @@ def undelete_import(import_id: int) -> None:
     with get_cursor() as (conn, cur):
         cur.execute('UPDATE imports SET deleted=0 WHERE id=?', (import_id,))
         cur.execute('UPDATE import_batches SET deleted=0 WHERE import_id=?', (import_id,))
-
-    with get_cursor() as (conn, cur):
-        rebuild_inventory_from_imports(cur)
-    
-    write_audit('undelete', 'import', str(import_id), cur=cur)
+        write_audit('undelete', 'import', str(import_id), cur=cur)
 
 
 def get_available_batches(
@@ -463,80 +455,111 @@ def allocate_sale_to_batches(
     """
     if quantity <= 0:
         return []
-
-    allocations = []
-    remaining_to_allocate = quantity
-
     with get_cursor() as (conn, cur):
-        batches = get_available_batches(category, subcategory)
+        return allocate_to_batches(cur, product_id, sale_date, category, subcategory,
+                                   quantity, unit_sale_price_base)
 
-        for batch in batches:
-            if remaining_to_allocate <= 0:
-                break
-
-            batch_id = batch['id']
-            batch_available = batch['remaining_quantity']
-
-            # Determine unit cost in base currency
-            try:
-                unit_cost_base = float(batch.get('unit_cost_orig') or 0.0)
-                if unit_cost_base == 0.0:
-                    unit_cost_base = float(batch.get('unit_cost') or 0.0)
-            except Exception:
-                unit_cost_base = float(batch.get('unit_cost') or 0.0)
 
-            unit_sale_price_base = float(unit_sale_price_base or 0.0)
+def allocate_to_batches(
+    cur,
+    product_id,
+    sale_date: str,
+    category: str,
+    subcategory: str,
+    quantity: float,
+    unit_sale_price_base: float,
+    order_line_id: Optional[int] = None
+) -> List[Dict]:
+    """
+    FIFO-allocate ``quantity`` units to batches inside the caller's transaction.
 
-            allocated_from_batch = min(remaining_to_allocate, batch_available)
-            profit_per_unit = unit_sale_price_base - unit_cost_base
+    One allocation row is written per batch touched (not per unit), tagged
+    with ``order_line_id`` for sale-order lines.
+    """
+    if quantity <= 0:
+        return []
 
-            # Insert allocation
-            cur.execute('''
-                INSERT INTO sale_batch_allocations
-                (product_id, sale_date, category, subcategory, batch_id, quantity_from_batch,
-                 unit_cost, unit_sale_price, profit_per_unit)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                product_id, sale_date, category or '', subcategory or '',
-                batch_id, allocated_from_batch, unit_cost_base, unit_sale_price_base, profit_per_unit
-            ))
+    allocations = []
+    remaining_to_allocate = quantity
+    unit_sale_price_base = float(unit_sale_price_base or 0.0)
+
+    query = '''
+        SELECT id, batch_date, remaining_quantity, unit_cost, unit_cost_orig, supplier
+        FROM import_batches
+        WHERE category = ? AND remaining_quantity > 0
+    '''
+    params = [category]
+    if subcategory:
+        query += ' AND subcategory = ?'
+        params.append(subcategory)
+    cur.execute(query + ' ORDER BY batch_date ASC, id ASC', params)
+    batches = [dict(r) for r in cur.fetchall()]
+
+    for batch in batches:
+        if remaining_to_allocate <= 0:
+            break
+
+        batch_id = batch['id']
+        batch_available = batch['remaining_quantity']
+
+        # Determine unit cost in base currency
+        try:
+            unit_cost_base = float(batch.get('unit_cost_orig') or 0.0)
+            if unit_cost_base == 0.0:
+                unit_cost_base = float(batch.get('unit_cost') or 0.0)
+        except Exception:
+            unit_cost_base = float(batch.get('unit_cost') or 0.0)
 
-            # Update remaining quantity
-            new_remaining = batch_available - allocated_from_batch
-            cur.execute(
-                'UPDATE import_batches SET remaining_quantity = ? WHERE id = ?',
-                (new_remaining, batch_id)
-            )
+        allocated_from_batch = min(remaining_to_allocate, batch_available)
+        profit_per_unit = unit_sale_price_base - unit_cost_base
 
-            allocations.append({
-                'batch_id': batch_id,
-                'batch_date': batch['batch_date'],
-                'supplier': batch['supplier'],
-                'quantity_allocated': allocated_from_batch,
-                'unit_cost': unit_cost_base,
-                'unit_sale_price': unit_sale_price_base,
-                'profit_per_unit': profit_per_unit,
-                'total_cost': allocated_from_batch * unit_cost_base,
-                'total_revenue': allocated_from_batch * unit_sale_price_base,
-                'total_profit': allocated_from_batch * profit_per_unit
-            })
+        # Insert allocation
+        cur.execute('''
+            INSERT INTO sale_batch_allocations
+            (product_id, sale_date, category, subcategory, batch_id, quantity_from_batch,
+             unit_cost, unit_sale_price, profit_per_unit, order_line_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            product_id, sale_date, category or '', subcategory or '',
+            batch_id, allocated_from_batch, unit_cost_base, unit_sale_price_base, profit_per_unit,
+            order_line_id
+        ))
 
-            remaining_to_allocate -= allocated_from_batch
-
-        # Handle shortage if not enough inventory
-        if remaining_to_allocate > 0:
-            allocations.append({
-                'batch_id': None,
-                'batch_date': 'NO_INVENTORY',
-                'supplier': 'SHORTAGE',
-                'quantity_allocated': remaining_to_allocate,
-                'unit_cost': 0.0,
-                'unit_sale_price': unit_sale_price_base,
-                'profit_per_unit': unit_sale_price_base,
-                'total_cost': 0.0,
-                'total_revenue': remaining_to_allocate * unit_sale_price_base,
-                'total_profit': remaining_to_allocate * unit_sale_price_base
-            })
+        # Update remaining quantity
+        cur.execute(
+            'UPDATE import_batches SET remaining_quantity = remaining_quantity - ? WHERE id = ?',
+            (allocated_from_batch, batch_id)
+        )
+
+        allocations.append({
+            'batch_id': batch_id,
+            'batch_date': batch['batch_date'],
+            'supplier': batch['supplier'],
+            'quantity_allocated': allocated_from_batch,
+            'unit_cost': unit_cost_base,
+            'unit_sale_price': unit_sale_price_base,
+            'profit_per_unit': profit_per_unit,
+            'total_cost': allocated_from_batch * unit_cost_base,
+            'total_revenue': allocated_from_batch * unit_sale_price_base,
+            'total_profit': allocated_from_batch * profit_per_unit
+        })
+
+        remaining_to_allocate -= allocated_from_batch
+
+    # Handle shortage if not enough inventory
+    if remaining_to_allocate > 0:
+        allocations.append({
+            'batch_id': None,
+            'batch_date': 'NO_INVENTORY',
+            'supplier': 'SHORTAGE',
+            'quantity_allocated': remaining_to_allocate,
+            'unit_cost': 0.0,
+            'unit_sale_price': unit_sale_price_base,
+            'profit_per_unit': unit_sale_price_base,
+            'total_cost': 0.0,
+            'total_revenue': remaining_to_allocate * unit_sale_price_base,
+            'total_profit': remaining_to_allocate * unit_sale_price_base
+        })
 
     return allocations
 
@@ -585,8 +608,9 @@ def get_sale_batch_info(product_id: int) -> List[Dict]:
     Return batch allocation info for a given product_id.
     """
     with get_cursor() as (conn, cur):
-        # Get all sale allocations
-        cur.execute('''
+        # Allocations of the unit itself, or of the order line that sold it
+        cond, params = allocation_filter(product_id, 'sba', cur)
+        cur.execute(f'''
             SELECT 
                 sba.id,
                 sba.product_id,
@@ -603,21 +627,22 @@ def get_sale_batch_info(product_id: int) -> List[Dict]:
                 ib.batch_notes
             FROM sale_batch_allocations sba
             LEFT JOIN import_batches ib ON sba.batch_id = ib.id
-            WHERE sba.product_id = ?
+            WHERE {cond}
             ORDER BY sba.id
-        ''', (product_id,))
+        ''', params)
         rows = [dict(r) for r in cur.fetchall()]
 
         # Get all returns for this product
-        cur.execute('''
+        cond, params = allocation_filter(product_id, cur=cur)
+        cur.execute(f'''
             SELECT batch_id, SUM(returned_quantity) as total_returned
             FROM (
                 SELECT batch_id, quantity_from_batch as returned_quantity
                 FROM sale_batch_allocations
-                WHERE product_id = ? AND deleted = 0 AND batch_id IS NOT NULL AND quantity_from_batch < 0
+                WHERE {cond} AND deleted = 0 AND batch_id IS NOT NULL AND quantity_from_batch < 0
             )
             GROUP BY batch_id
-        ''', (product_id,))
+        ''', params)
         returns = {r['batch_id']: r['total_returned'] for r in cur.fetchall()}
 
         # Adjust allocations for returns
@@ -650,12 +675,13 @@ def handle_return_batch_allocation(
     total_lost_inventory_cost = 0.0
 
     with get_cursor() as (conn, cur):
-        cur.execute('''
+        cond, params = allocation_filter(product_id, cur=cur)
+        cur.execute(f'''
             SELECT batch_id, quantity_from_batch, unit_cost
             FROM sale_batch_allocations
-            WHERE product_id = ?
+            WHERE {cond}
             ORDER BY id DESC
-        ''', (product_id,))
+        ''', params)
 
         allocations = [dict(r) for r in cur.fetchall()]
 
@@ -1,91 +1,164 @@
-from datetime import datetime
+"""inventory_dao.py - stock per category/subcategory, derived from import batches.
+
+``inventory`` holds one row per category/subcategory with the on-hand
+quantity (``quantity``), the units allocated to sales (``allocated``) and
+the on-hand value at cost in base currency (``value_at_cost``), summed over
+the live (not soft-deleted) ``import_batches``. Triggers on
+``import_batches`` apply each insert/update/delete as a delta, so sales
+allocations, restocked returns and import deletes keep it current without
+callers touching it, and reads are a single-row lookup.
+
+``rebuild_inventory`` recomputes the table in one set-based statement and
+reports any drift between the stored and the recomputed values.
+"""
+
+import time
+from typing import Dict, List, Optional
+
 from .connection import get_cursor
-from contextlib import ExitStack
+
+# Base-currency unit cost of a batch row (alias {r})
+_UNIT_COST = 'COALESCE({r}.unit_cost_base, {r}.unit_cost, 0)'
+
+_AGGREGATE_SQL = f'''
+    SELECT COALESCE(b.category, '') AS category,
+           COALESCE(b.subcategory, '') AS subcategory,
+           SUM(COALESCE(b.remaining_quantity, 0)) AS on_hand,
+           SUM(COALESCE(b.original_quantity, 0) - COALESCE(b.remaining_quantity, 0)) AS allocated,
+           SUM(COALESCE(b.remaining_quantity, 0) * {_UNIT_COST.format(r='b')}) AS value_at_cost
+    FROM import_batches b
+    WHERE COALESCE(b.deleted, 0) = 0
+    GROUP BY 1, 2
+'''
+
+# Differences below this are float noise from accumulated deltas
+_DRIFT_TOLERANCE = 1e-6
+
+
+def _delta_sql(r: str, sign: str) -> str:
+    """Upsert adding (sign '+') or removing (sign '-') batch row ``r``'s contribution."""
+    return f'''
+        INSERT INTO inventory (category, subcategory, quantity, allocated, value_at_cost, last_updated)
+        SELECT COALESCE({r}.category, ''), COALESCE({r}.subcategory, ''),
+               {sign}COALESCE({r}.remaining_quantity, 0),
+               {sign}(COALESCE({r}.original_quantity, 0) - COALESCE({r}.remaining_quantity, 0)),
+               {sign}COALESCE({r}.remaining_quantity, 0) * {_UNIT_COST.format(r=r)},
+               datetime('now', 'localtime')
+        WHERE COALESCE({r}.deleted, 0) = 0
+        ON CONFLICT(category, subcategory) DO UPDATE SET
+            quantity = COALESCE(quantity, 0) + excluded.quantity,
+            allocated = COALESCE(allocated, 0) + excluded.allocated,
+            value_at_cost = COALESCE(value_at_cost, 0) + excluded.value_at_cost,
+            last_updated = excluded.last_updated;
+    '''
+
+
+def create_inventory_triggers(cur) -> None:
+    """Make ``inventory`` a trigger-maintained aggregate (called from ``init_db_schema``).
+
+    The first time, the table is rebuilt from the batches (which also merges
+    duplicate category/subcategory rows) before the unique key and triggers
+    are added.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_inventory_batches_ai'")
+    if cur.fetchone() is not None:
+        return
+    _rebuild(cur)
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_key ON inventory(category, subcategory)')
+    cur.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_batches_ai AFTER INSERT ON import_batches BEGIN
+        {_delta_sql('new', '+')}
+    END;
+    ''')
+    cur.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_batches_ad AFTER DELETE ON import_batches BEGIN
+        {_delta_sql('old', '-')}
+    END;
+    ''')
+    cur.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_batches_au
+    AFTER UPDATE OF category, subcategory, original_quantity, remaining_quantity,
+                    unit_cost, unit_cost_base, deleted ON import_batches BEGIN
+        {_delta_sql('old', '-')}
+        {_delta_sql('new', '+')}
+    END;
+    ''')
+
 
 def get_inventory():
     with get_cursor() as (conn, cur):
-        cur.execute('SELECT category, subcategory, quantity, last_updated FROM inventory ORDER BY category, subcategory')
+        cur.execute('SELECT category, subcategory, quantity, allocated, value_at_cost, last_updated '
+                    'FROM inventory ORDER BY category, subcategory')
         rows = [dict(r) for r in cur.fetchall()]
     return rows
 
 
-def update_inventory(category, subcategory, quantity, cur=None):
-    """
-    Increment inventory for category/subcategory by quantity.
-    If `cur` is provided, use it (allows transactional use), else open a new cursor.
+def get_inventory_item(category, subcategory) -> Optional[Dict]:
+    """Inventory row of one category/subcategory (indexed lookup), or None."""
+    with get_cursor() as (conn, cur):
+        cur.execute('SELECT category, subcategory, quantity, allocated, value_at_cost, last_updated '
+                    'FROM inventory WHERE category=? AND subcategory=?', (category or '', subcategory or ''))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def _drift(cur) -> List[Dict]:
+    cur.execute(f'''
+        WITH agg AS ({_AGGREGATE_SQL}),
+        cmp AS (
+            SELECT i.category, i.subcategory,
+                   COALESCE(i.quantity, 0) AS stored_on_hand, COALESCE(a.on_hand, 0) AS on_hand,
+                   COALESCE(i.allocated, 0) AS stored_allocated, COALESCE(a.allocated, 0) AS allocated,
+                   COALESCE(i.value_at_cost, 0) AS stored_value_at_cost, COALESCE(a.value_at_cost, 0) AS value_at_cost
+            FROM inventory i
+            LEFT JOIN agg a ON a.category = COALESCE(i.category, '') AND a.subcategory = COALESCE(i.subcategory, '')
+            UNION ALL
+            SELECT a.category, a.subcategory, 0, a.on_hand, 0, a.allocated, 0, a.value_at_cost
+            FROM agg a
+            WHERE NOT EXISTS (SELECT 1 FROM inventory i WHERE COALESCE(i.category, '') = a.category
+                                                        AND COALESCE(i.subcategory, '') = a.subcategory)
+        )
+        SELECT * FROM cmp
+        WHERE ABS(stored_on_hand - on_hand) > ? OR ABS(stored_allocated - allocated) > ?
+           OR ABS(stored_value_at_cost - value_at_cost) > ?
+        ORDER BY category, subcategory
+    ''', (_DRIFT_TOLERANCE,) * 3)
+    return [dict(r) for r in cur.fetchall()]
+
+
+def _rebuild(cur) -> int:
+    cur.execute('DELETE FROM inventory')
+    cur.execute(f'''
+        INSERT INTO inventory (category, subcategory, quantity, allocated, value_at_cost, last_updated)
+        SELECT category, subcategory, on_hand, allocated, value_at_cost, datetime('now', 'localtime')
+        FROM ({_AGGREGATE_SQL})
+    ''')
+    return cur.rowcount
+
+
+def rebuild_inventory(cur=None) -> Dict[str, object]:
+    """Recompute ``inventory`` from the live import batches in one transaction.
+
+    Args:
+        cur: Optional cursor of the caller's transaction (the caller commits).
+
+    Returns:
+        Dict with ``rows`` (category/subcategory rows written), ``seconds``
+        and ``drift``: the rows whose stored values differed from the batches
+        before the rebuild, each with ``category``, ``subcategory`` and the
+        stored/recomputed ``on_hand``, ``allocated`` and ``value_at_cost``.
     """
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    try:
-        q = float(quantity or 0)
-    except Exception:
-        q = 0.0
-
-    if cur is not None:
-        cursor = cur
-        cursor.execute('SELECT id, quantity FROM inventory WHERE category=? AND subcategory=?',
-                       (category or '', subcategory or ''))
-        row = cursor.fetchone()
-        if row:
-            new_q = (row['quantity'] or 0) + q
-            cursor.execute('UPDATE inventory SET quantity=?, last_updated=? WHERE id=?',
-                           (new_q, now, row['id']))
-        else:
-            cursor.execute(
-                'INSERT INTO inventory (category, subcategory, quantity, last_updated) VALUES (?,?,?,?)',
-                (category or '', subcategory or '', q, now)
-            )
-    else:
-        with get_cursor() as (conn, cursor):
-            cursor.execute('SELECT id, quantity FROM inventory WHERE category=? AND subcategory=?',
-                           (category or '', subcategory or ''))
-            row = cursor.fetchone()
-            if row:
-                new_q = (row['quantity'] or 0) + q
-                cursor.execute('UPDATE inventory SET quantity=?, last_updated=? WHERE id=?',
-                               (new_q, now, row['id']))
-            else:
-                cursor.execute(
-                    'INSERT INTO inventory (category, subcategory, quantity, last_updated) VALUES (?,?,?,?)',
-                    (category or '', subcategory or '', q, now)
-                )
+    if cur is None:
+        with get_cursor() as (conn, c):
+            out = rebuild_inventory(c)
             conn.commit()
+            return out
+    t0 = time.perf_counter()
+    drift = _drift(cur)
+    rows = _rebuild(cur)
+    return {'rows': rows, 'drift': drift, 'seconds': round(time.perf_counter() - t0, 3)}
 
 
 def rebuild_inventory_from_imports(cur=None):
-    """
-    Rebuild the inventory table entirely from import totals.
-    Can optionally accept a cursor to avoid creating a new connection.
-    """
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    close_cursor = False
-    if cur:
-        cursor = cur
-    else:
-        ctx = get_cursor()
-        conn, cursor = ctx.__enter__()
-        close_cursor = True
-    cursor.execute('DELETE FROM inventory')
-    cursor.execute('''
-        INSERT INTO inventory (category, subcategory, quantity, last_updated)
-        SELECT category, subcategory, SUM(quantity), ?
-        FROM imports
-        GROUP BY category, subcategory
-    ''', (now,))
-    if not cur:
-        conn.commit()
-
-    try:
-        cursor.execute('SELECT category, subcategory, SUM(quantity) as qty FROM active_imports GROUP BY category, subcategory')
-    except Exception:
-        cursor.execute('SELECT category, subcategory, SUM(quantity) as qty FROM imports GROUP BY category, subcategory')
-
-    rows = cursor.fetchall()
-    cursor.execute('DELETE FROM inventory')
-
-    for r in rows:
-        cursor.execute('INSERT INTO inventory (category, subcategory, quantity, last_updated) VALUES (?,?,?,?)',
-                       (r['category'] or '', r['subcategory'] or '', r['qty'] or 0, now))
-
-    cursor.connection.commit()
-    if close_cursor:
-        ctx.__exit__(None, None, None)
+    """Older name of ``rebuild_inventory``."""
+    return rebuild_inventory(cur)
@@ -0,0 +1,265 @@
+"""inventory_snapshots.py - point-in-time inventory and valuation.
+
+A snapshot records, for one date, the on-hand quantity and unit cost (base
+currency) of every import batch that had stock, in ``inventory_snapshots``
+(header) and ``inventory_snapshot_batches`` (one row per batch with stock;
+empty batches are not stored). Month-end snapshots are taken
+automatically (``ensure_periodic_snapshots``), others on demand.
+
+``get_inventory_as_of(date)`` starts from the snapshot nearest to ``date``
+and applies only the stock movements between the two dates:
+
+- new batches (``batch_date``) add their original quantity;
+- sale allocations (``sale_date``) take their quantity out;
+- restocked returns (``return_date``, via the ``return_allocations`` ledger)
+  put their units back.
+
+Answering a date therefore costs one month of movements at most, however
+long the history. A snapshot of today reads the live ``remaining_quantity``
+of the batches; a snapshot of a past date is computed as above. Snapshots are
+frozen: records backdated before a snapshot's date do not change it (take it
+again to include them). Deleted batches are the exception: like their
+movements, their snapshot rows are ignored while the batch is in the trash.
+
+CLI::
+
+    python -m db.inventory_snapshots --as-of 2024-12-31
+    python -m db.inventory_snapshots --take
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .connection import get_cursor
+
+# Stock movements per live batch within (?, ?] (the bounds are bound twice each, lo then hi)
+_MOVEMENTS_SQL = '''
+    SELECT m.batch_id, SUM(m.qty) AS qty
+    FROM (
+        SELECT id AS batch_id, COALESCE(original_quantity, 0) AS qty
+        FROM import_batches WHERE batch_date > ? AND batch_date <= ?
+        UNION ALL
+        SELECT batch_id, -COALESCE(quantity_from_batch, 0)
+        FROM sale_batch_allocations
+        WHERE COALESCE(deleted, 0) = 0 AND sale_date > ? AND sale_date <= ?
+        UNION ALL
+        SELECT ra.batch_id, ra.quantity
+        FROM return_allocations ra JOIN returns r ON r.id = ra.return_id
+        WHERE COALESCE(r.deleted, 0) = 0 AND COALESCE(r.restock, 0) = 1
+          AND COALESCE(r.restock_processed, 0) = 1 AND r.return_date > ? AND r.return_date <= ?
+    ) m
+    JOIN import_batches b ON b.id = m.batch_id AND COALESCE(b.deleted, 0) = 0
+    GROUP BY m.batch_id
+'''
+
+_UNIT_COST = 'COALESCE(unit_cost_base, unit_cost, 0)'
+
+# Differences below this are float noise, not stock
+_EPSILON = 1e-9
+
+
+def _movements(cur, lo: str, hi: str) -> Dict[int, float]:
+    """Net stock movement per batch for dates in ``(lo, hi]``."""
+    cur.execute(_MOVEMENTS_SQL, (lo, hi) * 3)
+    return {r['batch_id']: float(r['qty'] or 0.0) for r in cur.fetchall()}
+
+
+def _batch_costs(cur, batch_ids) -> Dict[int, Dict]:
+    out: Dict[int, Dict] = {}
+    ids = list(batch_ids)
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        cur.execute(f"SELECT id, batch_date, category, subcategory, {_UNIT_COST} AS unit_cost "
+                    f"FROM import_batches WHERE id IN ({','.join('?' * len(part))})", part)
+        out.update({r['id']: dict(r) for r in cur.fetchall()})
+    return out
+
+
+def _nearest_snapshot(cur, as_of: str) -> Optional[Dict]:
+    cur.execute('SELECT * FROM inventory_snapshots WHERE as_of <= ? ORDER BY as_of DESC LIMIT 1', (as_of,))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute('SELECT * FROM inventory_snapshots WHERE as_of > ? ORDER BY as_of ASC LIMIT 1', (as_of,))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def _stock_as_of(cur, as_of: str) -> Dict[int, Tuple[float, Optional[float]]]:
+    """``{batch_id: (on_hand, snapshot unit cost or None)}`` at the end of ``as_of``."""
+    snap = _nearest_snapshot(cur, as_of)
+    stock: Dict[int, Tuple[float, Optional[float]]] = {}
+    if snap is None:
+        # no snapshot yet: replay the whole history
+        moves, sign = _movements(cur, '', as_of), 1.0
+    else:
+        cur.execute('SELECT s.batch_id, s.on_hand, s.unit_cost FROM inventory_snapshot_batches s '
+                    'JOIN import_batches b ON b.id = s.batch_id AND COALESCE(b.deleted, 0) = 0 '
+                    'WHERE s.snapshot_id = ?', (snap['id'],))
+        stock = {r['batch_id']: (float(r['on_hand']), r['unit_cost']) for r in cur.fetchall()}
+        if snap['as_of'] <= as_of:
+            moves, sign = _movements(cur, snap['as_of'], as_of), 1.0
+        else:
+            # walking back from a later snapshot undoes the movements in between
+            moves, sign = _movements(cur, as_of, snap['as_of']), -1.0
+    for batch_id, qty in moves.items():
+        on_hand, cost = stock.get(batch_id, (0.0, None))
+        stock[batch_id] = (on_hand + sign * qty, cost)
+    return {b: v for b, v in stock.items() if abs(v[0]) > _EPSILON}
+
+
+def _ensure_return_ledger() -> None:
+    # restocked returns recorded before the ledger existed get linked on first use
+    try:
+        from .returns_dao import ensure_return_ledger
+        ensure_return_ledger()
+    except Exception:
+        pass
+
+
+def get_inventory_as_of(as_of: str, by_batch: bool = False) -> List[Dict]:
+    """Stock on hand and its value at cost at the end of ``as_of`` (YYYY-MM-DD).
+
+    Returns one row per category/subcategory with ``category``,
+    ``subcategory``, ``on_hand`` and ``value_at_cost`` (base currency), or
+    with ``by_batch`` one row per batch, adding ``batch_id``, ``batch_date``
+    and ``unit_cost``. Batches keep the unit cost recorded in the snapshot
+    the answer started from; later batches use their current cost.
+    """
+    as_of = str(as_of or '').strip()[:10]
+    _ensure_return_ledger()
+    with get_cursor() as (conn, cur):
+        stock = _stock_as_of(cur, as_of)
+        batches = _batch_costs(cur, stock)
+    rows: List[Dict] = []
+    for batch_id, (on_hand, snap_cost) in stock.items():
+        b = batches.get(batch_id) or {}
+        cost = float(snap_cost if snap_cost is not None else (b.get('unit_cost') or 0.0))
+        rows.append({'category': b.get('category') or '', 'subcategory': b.get('subcategory') or '',
+                     'batch_id': batch_id, 'batch_date': b.get('batch_date'), 'unit_cost': cost,
+                     'on_hand': on_hand, 'value_at_cost': on_hand * cost})
+    if by_batch:
+        return sorted(rows, key=lambda r: (r['category'], r['subcategory'], r['batch_date'] or '', r['batch_id']))
+    totals: Dict[Tuple[str, str], Dict] = {}
+    for r in rows:
+        t = totals.setdefault((r['category'], r['subcategory']),
+                              {'category': r['category'], 'subcategory': r['subcategory'],
+                               'on_hand': 0.0, 'value_at_cost': 0.0})
+        t['on_hand'] += r['on_hand']
+        t['value_at_cost'] += r['value_at_cost']
+    return [totals[k] for k in sorted(totals)]
+
+
+def take_inventory_snapshot(as_of: Optional[str] = None, kind: str = 'manual') -> Dict[str, object]:
+    """Record the stock of every batch at the end of ``as_of`` (default: today, from live stock).
+
+    An existing snapshot of the same date is replaced.
+
+    Returns:
+        Dict with ``snapshot_id``, ``as_of``, ``batches``, ``on_hand``,
+        ``value_at_cost`` and ``seconds``.
+    """
+    t0 = time.perf_counter()
+    today = date.today().isoformat()
+    as_of = str(as_of or today).strip()[:10]
+    _ensure_return_ledger()
+    with get_cursor() as (conn, cur):
+        if as_of == today:
+            cur.execute(f'SELECT id, remaining_quantity AS on_hand, {_UNIT_COST} AS unit_cost FROM import_batches '
+                        f'WHERE COALESCE(deleted, 0) = 0 AND ABS(COALESCE(remaining_quantity, 0)) > ?', (_EPSILON,))
+            rows = [(r['id'], float(r['on_hand']), float(r['unit_cost'])) for r in cur.fetchall()]
+        else:
+            stock = _stock_as_of(cur, as_of)
+            costs = _batch_costs(cur, stock)
+            rows = [(b, q, float(c if c is not None else (costs.get(b) or {}).get('unit_cost') or 0.0))
+                    for b, (q, c) in stock.items()]
+        cur.execute('DELETE FROM inventory_snapshot_batches WHERE snapshot_id IN '
+                    '(SELECT id FROM inventory_snapshots WHERE as_of = ?)', (as_of,))
+        cur.execute('DELETE FROM inventory_snapshots WHERE as_of = ?', (as_of,))
+        cur.execute('INSERT INTO inventory_snapshots (as_of, kind, created_at, batches, on_hand, value_at_cost) '
+                    "VALUES (?, ?, datetime('now', 'localtime'), ?, ?, ?)",
+                    (as_of, kind, len(rows), sum(q for _, q, _ in rows), sum(q * c for _, q, c in rows)))
+        snapshot_id = cur.lastrowid
+        cur.executemany('INSERT INTO inventory_snapshot_batches (snapshot_id, batch_id, on_hand, unit_cost) '
+                        'VALUES (?, ?, ?, ?)', [(snapshot_id, *r) for r in rows])
+        conn.commit()
+    return {'snapshot_id': snapshot_id, 'as_of': as_of, 'batches': len(rows),
+            'on_hand': sum(q for _, q, _ in rows), 'value_at_cost': sum(q * c for _, q, c in rows),
+            'seconds': round(time.perf_counter() - t0, 3)}
+
+
+def _month_ends(first: date, last: date):
+    d = (first.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    while d <= last:
+        yield d
+        d = (d + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def ensure_periodic_snapshots() -> int:
+    """Take any missing month-end snapshot from the first batch up to the last full month.
+
+    Each snapshot starts from the previous one, so catching up costs one
+    month of movements per month. Returns the number of snapshots taken.
+    """
+    with get_cursor() as (conn, cur):
+        cur.execute("SELECT MIN(batch_date) FROM import_batches WHERE COALESCE(batch_date, '') <> ''")
+        first = cur.fetchone()[0]
+        cur.execute('SELECT as_of FROM inventory_snapshots')
+        taken = {r[0] for r in cur.fetchall()}
+    if not first:
+        return 0
+    try:
+        start = date.fromisoformat(str(first)[:10])
+    except ValueError:
+        return 0
+    last = date.today().replace(day=1) - timedelta(days=1)
+    count = 0
+    for d in _month_ends(start, last):
+        if d.isoformat() not in taken:
+            take_inventory_snapshot(d.isoformat(), kind='periodic')
+            count += 1
+    return count
+
+
+def list_inventory_snapshots() -> List[Dict]:
+    """Snapshot headers, newest first."""
+    with get_cursor() as (conn, cur):
+        cur.execute('SELECT id, as_of, kind, created_at, batches, on_hand, value_at_cost '
+                    'FROM inventory_snapshots ORDER BY as_of DESC')
+        return [dict(r) for r in cur.fetchall()]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Inventory snapshots and point-in-time valuation.')
+    ap.add_argument('--as-of', default=None, help='print stock and value at the end of this date (YYYY-MM-DD)')
+    ap.add_argument('--by-batch', action='store_true', help='with --as-of: one line per batch')
+    ap.add_argument('--take', action='store_true', help='take a snapshot (of --as-of, default today)')
+    args = ap.parse_args(argv)
+
+    from .connection import init_db
+    init_db().close()
+    if args.take:
+        s = take_inventory_snapshot(args.as_of)
+        print(f"Snapshot {s['snapshot_id']} of {s['as_of']}: {s['batches']} batches, "
+              f"{s['on_hand']:g} units, value {s['value_at_cost']:.2f}")
+        return 0
+    taken = ensure_periodic_snapshots()
+    if taken:
+        print(f'Took {taken} month-end snapshots')
+    as_of = args.as_of or date.today().isoformat()
+    rows = get_inventory_as_of(as_of, by_batch=args.by_batch)
+    for r in rows:
+        label = f"{r['category']} / {r['subcategory']}"
+        if args.by_batch:
+            label += f"  batch {r['batch_id']} ({r['batch_date']}) @ {r['unit_cost']:.2f}"
+        print(f"{label}: {r['on_hand']:g} on hand, value {r['value_at_cost']:.2f}")
+    print(f"As of {as_of}: {sum(r['on_hand'] for r in rows):g} units, "
+          f"value {sum(r['value_at_cost'] for r in rows):.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
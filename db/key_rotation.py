@@ -0,0 +1,179 @@
+"""key_rotation.py - re-encrypt stored notes under the current secret key.
+
+Rotation procedure:
+
+1. Put the new key in ``TRACKING_APP_SECRET_KEY`` and move the old one(s) to
+   ``TRACKING_APP_PREVIOUS_KEYS`` (comma-separated), then restart the app.
+   Reads keep working immediately: values carry the id of the key that wrote
+   them and older keys are still used for decryption.
+2. Run the rotation (Settings -> "Rotate encryption key" or
+   ``python -m db.key_rotation``). Rows are streamed in primary-key order in
+   chunks; each chunk is decrypted with whichever key wrote it, re-encrypted
+   with the current key and committed together with a resume cursor, so the
+   job never holds a whole table in memory and can be interrupted and rerun.
+3. Once the report shows nothing left to rotate, drop the old keys.
+
+Legacy plaintext notes (written while no valid key was configured) are
+encrypted on the way; tokens no configured key can open are left untouched
+and counted as ``unreadable``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from .connection import get_cursor
+
+try:
+    from core import crypto_utils  # type: ignore
+except Exception:  # pragma: no cover - cryptography not installed
+    crypto_utils = None  # type: ignore
+
+# (table, primary key, encrypted column)
+ENCRYPTED_COLUMNS: Tuple[Tuple[str, str, str], ...] = (
+    ('imports', 'id', 'notes'),
+    ('expenses', 'id', 'notes'),
+)
+
+_CURSOR_KEY = 'key_rotation:{table}.{column}'
+
+
+def _load_cursor(cur, table: str, column: str, kid: str) -> int:
+    cur.execute('SELECT value FROM settings WHERE key=?', (_CURSOR_KEY.format(table=table, column=column),))
+    row = cur.fetchone()
+    if not row or not row[0]:
+        return 0
+    saved_kid, _, last_id = str(row[0]).partition(':')
+    # A cursor left by a rotation to a different key does not apply
+    if saved_kid != kid:
+        return 0
+    try:
+        return int(last_id)
+    except ValueError:
+        return 0
+
+
+def _save_cursor(cur, table: str, column: str, value: Optional[str]) -> None:
+    key = _CURSOR_KEY.format(table=table, column=column)
+    if value is None:
+        cur.execute('DELETE FROM settings WHERE key=?', (key,))
+    else:
+        cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)', (key, value))
+
+
+def rotate_table(table: str, pk: str = 'id', column: str = 'notes', chunk_size: int = 500,
+                 progress: Optional[Callable[[str, int, int], None]] = None,
+                 cancel: Optional[threading.Event] = None) -> Dict[str, int]:
+    """Re-encrypt one column of one table in keyset-paginated chunks.
+
+    Returns counts: ``scanned``, ``rotated``, ``unreadable`` and ``last_id``.
+    """
+    kid = crypto_utils.key_id()
+    stats = {'scanned': 0, 'rotated': 0, 'unreadable': 0, 'last_id': 0}
+    select_sql = f'SELECT {pk}, {column} FROM {table} WHERE {pk} > ? ORDER BY {pk} LIMIT ?'
+    # Only overwrite rows nobody edited since we read them
+    update_sql = f'UPDATE {table} SET {column}=? WHERE {pk}=? AND {column}=?'
+    with get_cursor() as (conn, cur):
+        try:
+            last_id = _load_cursor(cur, table, column, kid)
+            cur.execute(select_sql, (last_id, chunk_size))
+        except sqlite3.OperationalError:
+            # table not present in this database
+            return stats
+        rows = cur.fetchall()
+        while rows:
+            updates = []
+            for row_id, value in rows:
+                if not value or not crypto_utils.needs_rotation(value):
+                    continue
+                new_value = crypto_utils.rotate_value(value)
+                if new_value is None:
+                    stats['unreadable'] += 1
+                else:
+                    updates.append((new_value, row_id, value))
+            if updates:
+                cur.executemany(update_sql, updates)
+            last_id = rows[-1][0]
+            _save_cursor(cur, table, column, f'{kid}:{last_id}')
+            conn.commit()
+            stats['scanned'] += len(rows)
+            stats['rotated'] += len(updates)
+            stats['last_id'] = last_id
+            if progress:
+                progress(table, stats['scanned'], stats['rotated'])
+            if cancel is not None and cancel.is_set():
+                return stats
+            cur.execute(select_sql, (last_id, chunk_size))
+            rows = cur.fetchall()
+        _save_cursor(cur, table, column, None)
+        conn.commit()
+    return stats
+
+
+def rotate_encryption_keys(chunk_size: int = 500,
+                           columns: Iterable[Tuple[str, str, str]] = ENCRYPTED_COLUMNS,
+                           progress: Optional[Callable[[str, int, int], None]] = None,
+                           cancel: Optional[threading.Event] = None) -> Dict[str, object]:
+    """Rotate every encrypted column to the current key.
+
+    Args:
+        chunk_size: Rows per transaction.
+        columns: ``(table, pk, column)`` triples to process.
+        progress: Optional ``callback(table, rows_scanned, rows_rotated)`` after each chunk.
+        cancel: Optional event; when set the job stops after the current chunk
+            and a later run resumes from the saved cursor.
+
+    Returns:
+        Dict with per-table stats, ``key_id``, ``cancelled`` and ``seconds``.
+
+    Raises:
+        RuntimeError: if encryption is unavailable or the current key is not a valid Fernet key.
+    """
+    if crypto_utils is None:
+        raise RuntimeError('Encryption support (cryptography) is not installed')
+    try:
+        crypto_utils._cipher()
+    except Exception as e:
+        raise RuntimeError(f'{crypto_utils._KEY_ENV} is not a valid Fernet key: {e}')
+    t0 = time.perf_counter()
+    out: Dict[str, object] = {'key_id': crypto_utils.key_id(), 'cancelled': False}
+    for table, pk, column in columns:
+        out[table] = rotate_table(table, pk, column, chunk_size=chunk_size,
+                                  progress=progress, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            out['cancelled'] = True
+            break
+    if not out['cancelled']:
+        # The blind note index is keyed from the secret key as well
+        try:
+            from .note_index import rebuild_note_index
+            out['note_index'] = rebuild_note_index(chunk_size=chunk_size)
+        except Exception:
+            pass
+    out['seconds'] = round(time.perf_counter() - t0, 3)
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Re-encrypt stored notes with the current secret key.')
+    ap.add_argument('--chunk-size', type=int, default=500)
+    args = ap.parse_args(argv)
+
+    from .connection import init_db
+    init_db().close()
+    stats = rotate_encryption_keys(chunk_size=args.chunk_size,
+                                   progress=lambda t, s, r: print(f'{t}: {s} scanned, {r} rotated...'))
+    for table, _, _ in ENCRYPTED_COLUMNS:
+        st = stats.get(table) or {}
+        print(f"{table}: {st.get('rotated', 0)} rotated, {st.get('unreadable', 0)} unreadable "
+              f"of {st.get('scanned', 0)} rows")
+    print(f"Now on key {stats['key_id']} ({stats['seconds']}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+"""note_index.py - blind keyword index over encrypted notes.
+
+Notes are stored encrypted, so a plain ``LIKE`` cannot search them and the
+views used to decrypt every row in Python. Instead each note's normalized
+words are hashed with an HMAC key derived from the secret key
+(``crypto_utils.blind_tokens``) and stored in ``note_tokens``. A keyword
+search hashes the query words the same way and becomes an indexed lookup
+returning matching IDs; only those rows ever need decrypting.
+
+Matching is whole-word (case and accent insensitive); all query words must
+be present. Unlike the old decrypt-and-scan search, a fragment of a word
+does not match a note. The index is tied to the key it was built with: after a key
+rotation ``search_note_ids`` returns ``None`` until ``rebuild_note_index``
+has run, and callers fall back to scanning.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .connection import get_cursor
+
+try:
+    from core import crypto_utils  # type: ignore
+except Exception:  # pragma: no cover - cryptography not installed
+    crypto_utils = None  # type: ignore
+
+# entity name -> (table, primary key, encrypted notes column)
+INDEXED_NOTES: Dict[str, Tuple[str, str, str]] = {
+    'import': ('imports', 'id', 'notes'),
+    'expense': ('expenses', 'id', 'notes'),
+}
+
+_KEY_SETTING = 'note_index_key_id'
+_rebuild_lock = threading.Lock()
+
+
+def _tokens(text) -> list:
+    if crypto_utils is None or not isinstance(text, str):
+        return []
+    return crypto_utils.blind_tokens(text)
+
+
+def index_note(cur, entity: str, entity_id, notes) -> None:
+    """Replace the tokens of one note. Call inside the writer's transaction."""
+    cur.execute('DELETE FROM note_tokens WHERE entity=? AND entity_id=?', (entity, entity_id))
+    toks = _tokens(notes)
+    if toks:
+        cur.executemany('INSERT OR IGNORE INTO note_tokens(token, entity, entity_id) VALUES (?,?,?)',
+                        [(t, entity, entity_id) for t in toks])
+
+
+def remove_note(cur, entity: str, entity_id) -> None:
+    """Drop the tokens of a purged row. Call inside the deleting transaction."""
+    cur.execute('DELETE FROM note_tokens WHERE entity=? AND entity_id=?', (entity, entity_id))
+
+
+def index_is_current() -> bool:
+    """True if the index was built with the current key."""
+    if crypto_utils is None:
+        return False
+    try:
+        with get_cursor() as (conn, cur):
+            cur.execute('SELECT value FROM settings WHERE key=?', (_KEY_SETTING,))
+            row = cur.fetchone()
+    except Exception:
+        return False
+    return bool(row) and row[0] == crypto_utils.key_id()
+
+
+def search_note_ids(entity: str, query: str) -> Optional[Set[int]]:
+    """IDs of ``entity`` rows whose notes contain every word of ``query``.
+
+    Returns ``None`` when the index cannot answer (not built for the current
+    key, or the query has no indexable words); callers should then fall back
+    to decrypting and scanning.
+    """
+    toks = _tokens(query)
+    if not toks or not index_is_current():
+        return None
+    placeholders = ','.join('?' * len(toks))
+    with get_cursor() as (conn, cur):
+        cur.execute(
+            f'SELECT entity_id FROM note_tokens WHERE entity=? AND token IN ({placeholders}) '
+            'GROUP BY entity_id HAVING COUNT(*)=?',
+            (entity, *toks, len(toks)))
+        return {r[0] for r in cur.fetchall()}
+
+
+def rebuild_note_index(entities: Optional[Iterable[str]] = None, chunk_size: int = 500) -> Dict[str, int]:
+    """Re-tokenize all notes in keyset-paginated chunks (one transaction per chunk).
+
+    Returns the number of rows indexed per entity.
+    """
+    if crypto_utils is None:
+        return {}
+    stats: Dict[str, int] = {}
+    with _rebuild_lock, get_cursor() as (conn, cur):
+        # Mark stale while rebuilding so searches fall back instead of missing rows
+        cur.execute('DELETE FROM settings WHERE key=?', (_KEY_SETTING,))
+        conn.commit()
+        for entity in (entities or INDEXED_NOTES):
+            table, pk, column = INDEXED_NOTES[entity]
+            cur.execute('DELETE FROM note_tokens WHERE entity=?', (entity,))
+            sql = f'SELECT {pk}, {column} FROM {table} WHERE {pk} > ? ORDER BY {pk} LIMIT ?'
+            last_id, done = 0, 0
+            while True:
+                try:
+                    cur.execute(sql, (last_id, chunk_size))
+                except sqlite3.OperationalError:
+                    break
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                plain = crypto_utils.decrypt_many([r[1] for r in rows])
+                batch = []
+                for (row_id, _), text in zip(rows, plain):
+                    batch.extend((t, entity, row_id) for t in _tokens(text))
+                cur.executemany('INSERT OR IGNORE INTO note_tokens(token, entity, entity_id) VALUES (?,?,?)', batch)
+                conn.commit()
+                last_id = rows[-1][0]
+                done += len(rows)
+            stats[entity] = done
+        cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)',
+                    (_KEY_SETTING, crypto_utils.key_id()))
+        conn.commit()
+    return stats
+
+
+def ensure_note_index() -> Optional[Dict[str, int]]:
+    """Rebuild the index if it is missing or was built with another key."""
+    if crypto_utils is None or index_is_current():
+        return None
+    return rebuild_note_index()
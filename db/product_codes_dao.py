@@ -56,34 +56,63 @@ def get_cat_code_for_category(category: str) -> Optional[str]:
         return None
 
 
-def generate_product_ids(category, subcategory, count, year_prefix=None):
+PRODUCT_PREFIX_LEN = 8  # yy + 3-digit category code + 3-digit subcategory code
+SERIAL_WIDTH = 4
+
+
+def format_product_id(prefix: str, serial: int) -> str:
+    return f"{prefix}{str(int(serial)).zfill(SERIAL_WIDTH)}"
+
+
+def split_product_id(product_id) -> Optional[tuple]:
+    """``(prefix, serial)`` of a generated product ID, or None for other formats."""
+    pid = str(product_id or '').strip()
+    if len(pid) < PRODUCT_PREFIX_LEN + SERIAL_WIDTH or not pid.isdigit():
+        return None
+    return pid[:PRODUCT_PREFIX_LEN], int(pid[PRODUCT_PREFIX_LEN:])
+
+
+def reserve_product_serials(category, subcategory, count, year_prefix=None, cur=None) -> Optional[tuple]:
+    """Reserve ``count`` consecutive serials; returns ``(prefix, first, last)``.
+
+    Returns None when no code mapping exists for the category/subcategory.
+    With ``cur`` the reservation joins the caller's transaction.
+    """
     try:
         c = int(count)
     except Exception:
         c = 0
     if c <= 0:
+        return None
+    if cur is None:
+        with get_cursor() as (conn, cur):
+            out = reserve_product_serials(category, subcategory, c, year_prefix, cur=cur)
+            conn.commit()
+            return out
+    cur.execute('SELECT id, cat_code, sub_code, next_serial FROM product_codes WHERE category=? AND subcategory=?', (category or '', subcategory or ''))
+    row = cur.fetchone()
+    if not row:
+        return None
+    cat_code = (row['cat_code'] or '').zfill(3)
+    sub_code = (row['sub_code'] or '').zfill(3)
+    try:
+        start = int(row['next_serial'] or 1)
+    except Exception:
+        start = 1
+    if year_prefix:
+        yy = str(year_prefix)[-2:]
+    else:
+        yy = datetime.now().strftime('%y')
+    cur.execute('UPDATE product_codes SET next_serial=? WHERE id=?', (start + c, row['id']))
+    return f"{yy}{cat_code}{sub_code}", start, start + c - 1
+
+
+def generate_product_ids(category, subcategory, count, year_prefix=None):
+    reserved = reserve_product_serials(category, subcategory, count, year_prefix)
+    if not reserved:
         return []
-    with get_cursor() as (conn, cur):
-        cur.execute('SELECT id, cat_code, sub_code, next_serial FROM product_codes WHERE category=? AND subcategory=?', (category or '', subcategory or ''))
-        row = cur.fetchone()
-        if not row:
-            return []
-        cat_code = (row['cat_code'] or '').zfill(3)
-        sub_code = (row['sub_code'] or '').zfill(3)
-        try:
-            start = int(row['next_serial'] or 1)
-        except Exception:
-            start = 1
-        ids = []
-        if year_prefix:
-            yy = str(year_prefix)[-2:]
-        else:
-            yy = datetime.now().strftime('%y')
-        for i in range(start, start + c):
-            ids.append(f"{yy}{cat_code}{sub_code}{str(i).zfill(4)}")
-        cur.execute('UPDATE product_codes SET next_serial=? WHERE id=?', (start + c, row['id']))
-        conn.commit()
-        return ids
+    prefix, first, last = reserved
+    return [format_product_id(prefix, i) for i in range(first, last + 1)]
 
 
 def get_all_product_codes():
@@ -1,9 +1,55 @@
 from .connection import get_cursor
 from .settings import get_base_currency
+from datetime import date
 from typing import Optional
+import core.fx_calendar as fx_calendar
+import core.fx_series as fx_series
 
 # ---------------- Currency conversion & FX cache ----------------
 
+# Relative difference below which a cached rate agrees with the mapped series
+# (rounding of published quotes and of derived cross rates)
+_SERIES_TOLERANCE = 1e-6
+
+def _is_weekday(date_str: str) -> bool:
+    try:
+        return date.fromisoformat(date_str.strip()[:10]).weekday() < 5
+    except ValueError:
+        return False
+
+
+def _ensure_fx_index(from_ccy: str, to_ccy: str) -> None:
+    """Seed the publication-date index for a pair from fx_cache on first use.
+
+    fx_cache also holds rows stored under requested weekend dates; those are
+    never publication dates and are left out of the index.
+    """
+    if fx_calendar.is_loaded(from_ccy, to_ccy):
+        return
+    try:
+        with get_cursor() as (conn, cur):
+            cur.execute('SELECT date FROM fx_cache WHERE from_ccy=? AND to_ccy=? AND rate > 0',
+                        (from_ccy, to_ccy))
+            dates = [r[0] for r in cur.fetchall() if r[0] and _is_weekday(r[0])]
+    except Exception:
+        dates = []
+    fx_calendar.load(from_ccy, to_ccy, dates)
+
+
+def _get_published_rate(date_str: str, from_ccy: str, to_ccy: str) -> Optional[float]:
+    """Answer weekend/holiday dates from the nearest prior published rate, if known."""
+    if not date_str:
+        return None
+    _ensure_fx_index(from_ccy, to_ccy)
+    pub = fx_calendar.resolve(date_str, from_ccy, to_ccy)
+    if not pub or pub == date_str:
+        return None
+    cached = get_cached_rate(pub, from_ccy, to_ccy)
+    if cached and cached > 0:
+        return cached
+    return None
+
+
 def _get_rate_generic(date_str: str, from_ccy: str, to_ccy: str) -> Optional[float]:
     from_ccy = (from_ccy or '').upper()
     to_ccy = (to_ccy or '').upper()
@@ -12,10 +58,19 @@ def _get_rate_generic(date_str: str, from_ccy: str, to_ccy: str) -> Optional[flo
     if from_ccy == to_ccy:
         return 1.0
     try:
+        # Memory-mapped daily series: O(1), no SQLite round-trip
+        if date_str:
+            mapped = fx_series.rate(date_str, from_ccy, to_ccy)
+            if mapped and mapped > 0:
+                return mapped
         # Try local cache first
         cached = get_cached_rate(date_str, from_ccy, to_ccy)
         if cached and cached > 0:
             return cached
+        # Weekend/holiday: reuse the previous publication without a network call
+        published = _get_published_rate(date_str, from_ccy, to_ccy)
+        if published:
+            return published
         # Use core.fx_rates for common USD/TRY path
         import core.fx_rates as fx_rates
         if from_ccy == 'USD' and to_ccy == 'TRY':
@@ -29,24 +84,20 @@ def _get_rate_generic(date_str: str, from_ccy: str, to_ccy: str) -> Optional[flo
             if v and v > 0:
                 set_cached_rate(date_str, from_ccy, to_ccy, v)
             return v
-        # Fallback: try frankfurter API
-        from urllib import request
-        path = f"/{date_str}?from={from_ccy}&to={to_ccy}" if date_str else f"/latest?from={from_ccy}&to={to_ccy}"
-        for scheme in ("https", "http"):
-            url = f"{scheme}://api.frankfurter.app{path}"
-            try:
-                req = request.Request(url, headers={'User-Agent': 'TrackingApp/1.0'})
-                with request.urlopen(req, timeout=5.0) as resp:
-                    import json as _json
-                    j = _json.loads(resp.read().decode('utf-8'))
-                    v = (j.get('rates') or {}).get(to_ccy)
-                    if v is not None:
-                        rate = float(v)
-                        if rate and rate > 0:
-                            set_cached_rate(date_str, from_ccy, to_ccy, rate)
-                        return rate
-            except Exception:
-                continue
+        # Fallback: try frankfurter API (fails fast while the breaker is open)
+        j = fx_rates.fetch_frankfurter(date_str, from_ccy, to_ccy)
+        v = (j.get('rates') or {}).get(to_ccy) if j else None
+        if v is not None:
+            rate = float(v)
+            if rate and rate > 0:
+                set_cached_rate(date_str, from_ccy, to_ccy, rate)
+                pub = j.get('date')
+                if date_str and pub:
+                    if pub != date_str:
+                        set_cached_rate(pub, from_ccy, to_ccy, rate)
+                    # only the provider's publication date goes into the index
+                    fx_calendar.record_publication(date_str, pub, from_ccy, to_ccy)
+            return rate
     except Exception:
         return None
     return None
@@ -84,6 +135,10 @@ def set_cached_rate(date_str: str, from_ccy: str, to_ccy: str, rate: float) -> N
             cur.execute('INSERT OR REPLACE INTO fx_cache(date, from_ccy, to_ccy, rate) VALUES (?,?,?,?)',
                         (date_str, (from_ccy or '').upper(), (to_ccy or '').upper(), float(rate)))
             conn.commit()
+        # A corrected or newly fetched rate must not stay shadowed by the mapped series
+        mapped = fx_series.rate(date_str, from_ccy, to_ccy) if date_str else None
+        if mapped and abs(mapped - float(rate)) > _SERIES_TOLERANCE * abs(float(rate)):
+            fx_series.refresh_day(date_str, from_ccy, to_ccy)
     except Exception:
         pass
 
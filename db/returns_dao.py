@@ -8,32 +8,15 @@ def process_restock_change(ret_id: int, restock: int) -> bool:
                 return False
             prev_restock = int(ret['restock'] or 0)
             restock_processed = int(ret['restock_processed'] or 0)
-            product_id = ret['product_id']
-            category = ret['category']
-            subcategory = ret['subcategory']
             # Only process if restock value is changing
             if restock != prev_restock:
                 if restock == 1:
                     # Apply restock logic (like undelete)
-                    cur.execute('SELECT batch_id, quantity_from_batch FROM sale_batch_allocations WHERE product_id = ?', (product_id,))
-                    allocations = cur.fetchall()
-                    for alloc in allocations:
-                        batch_id = alloc['batch_id']
-                        qty = float(alloc['quantity_from_batch'] or 0.0)
-                        if batch_id:
-                            cur.execute('UPDATE import_batches SET remaining_quantity = remaining_quantity + ? WHERE id = ?', (qty, batch_id))
-                    update_inventory(category, subcategory, 1, cur=cur)
+                    _apply_ledger(cur, _ledger(cur, ret), 1)
                     cur.execute('UPDATE returns SET restock_processed = 1, restock = 1 WHERE id = ?', (ret_id,))
                 else:
                     # Reverse restock logic (like delete)
-                    cur.execute('SELECT batch_id, quantity_from_batch FROM sale_batch_allocations WHERE product_id = ?', (product_id,))
-                    allocations = cur.fetchall()
-                    for alloc in allocations:
-                        batch_id = alloc['batch_id']
-                        qty = float(alloc['quantity_from_batch'] or 0.0)
-                        if batch_id:
-                            cur.execute('UPDATE import_batches SET remaining_quantity = remaining_quantity - ? WHERE id = ?', (qty, batch_id))
-                    update_inventory(category, subcategory, -1, cur=cur)
+                    _apply_ledger(cur, _ledger(cur, ret), -1)
                     cur.execute('UPDATE returns SET restock_processed = 0, restock = 0 WHERE id = ?', (ret_id,))
                 return True
             return False
@@ -44,7 +27,11 @@ def process_restock_change(ret_id: int, restock: int) -> bool:
 
 __all__ = [
     "list_returns",
+    "list_returns_for_sale",
+    "backfill_return_ledger",
+    "ensure_return_ledger",
     "insert_return",
+    "insert_returns",
     "update_return",
     "delete_return",
     "undelete_return",
@@ -52,18 +39,26 @@ __all__ = [
 ]
 
 import logging
+import threading
+import time
 
-from typing import Any, Dict, Optional, List
+from typing import Any, Callable, Dict, Iterable, Optional, List
 from db.connection import get_cursor
 from db.settings import get_base_currency, get_default_sale_currency
-from db.rates import convert_amount
-from db.inventory_dao import update_inventory
+from db.rates import convert_amount, get_rate_to_base
+from db.sale_orders_dao import allocation_filter, find_sale_line, find_sale_lines
 import json
 
 
 
 logger = logging.getLogger("returns_dao")
 
+# Float slack when comparing unit counts
+_EPSILON = 1e-9
+
+_ledger_lock = threading.Lock()
+_ledger_backfilled = False
+
 def normalize_doc_paths(val):
     """Normalize doc_paths to a JSON string."""
     if val is None:
@@ -105,6 +100,135 @@ def list_returns() -> List[Dict[str, Any]]:
         return [dict(row) for row in cur.fetchall()]
 
 
+def list_returns_for_sale(sale_id: int) -> List[Dict[str, Any]]:
+    """Non-deleted returns of one sales row: linked by sale_id, or (legacy) by its product ID."""
+    with get_cursor() as (conn, cur):
+        cur.execute('''
+            SELECT r.* FROM returns r JOIN sales s ON s.id = ?
+            WHERE (r.sale_id = s.id OR (r.sale_id IS NULL AND r.product_id = s.product_id))
+              AND COALESCE(r.deleted, 0) = 0
+            ORDER BY r.id
+        ''', (sale_id,))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def _return_qty(ret) -> float:
+    try:
+        q = float(ret['quantity'] if ret['quantity'] is not None else 1.0)
+    except (KeyError, IndexError, TypeError, ValueError):
+        q = 1.0
+    return q if q > 0 else 1.0
+
+
+def _claim_ledger(cur, ret_id) -> bool:
+    """Mark return ``ret_id`` as linked; False if another writer already did.
+
+    This is the first write of the caller's transaction, so the allocation
+    claims read afterwards cannot change under it.
+    """
+    cur.execute('UPDATE returns SET ledger_built = 1 WHERE id = ? AND COALESCE(ledger_built, 0) = 0', (ret_id,))
+    return cur.rowcount > 0
+
+
+def _ledger_rows(cur, ret_id) -> List[Dict[str, Any]]:
+    cur.execute('SELECT * FROM return_allocations WHERE return_id = ? ORDER BY id', (ret_id,))
+    return [dict(r) for r in cur.fetchall()]
+
+
+def _build_ledger(cur, ret, line=None) -> List[Dict[str, Any]]:
+    """Record which allocation rows the return ``ret`` reverses (``return_allocations``).
+
+    Takes ``ret['quantity']`` units from the sale's allocations, newest first,
+    skipping units other live returns already claimed. ``line`` is the sales
+    row when already known. Returns the ledger rows (those another writer
+    recorded, if it linked the return first).
+    """
+    if not _claim_ledger(cur, ret['id']):
+        return _ledger_rows(cur, ret['id'])
+    return _write_ledger(cur, ret, line)
+
+
+def _write_ledger(cur, ret, line=None) -> List[Dict[str, Any]]:
+    ret_id = ret['id']
+    pid = ret['product_id']
+    rows: List[Dict[str, Any]] = []
+    if pid:
+        cond, params = allocation_filter(pid, 'sba', cur, line=line)
+        cur.execute(f'''
+            SELECT sba.id, sba.batch_id, sba.quantity_from_batch, sba.unit_sale_price,
+                   COALESCE(NULLIF(sba.unit_cost, 0), ib.unit_cost_base, ib.unit_cost_orig, ib.unit_cost, 0) AS unit_cost,
+                   COALESCE((SELECT SUM(ra.quantity) FROM return_allocations ra
+                             JOIN returns r ON r.id = ra.return_id
+                             WHERE ra.allocation_id = sba.id AND COALESCE(r.deleted, 0) = 0), 0) AS claimed
+            FROM sale_batch_allocations sba
+            LEFT JOIN import_batches ib ON ib.id = sba.batch_id
+            WHERE {cond} AND sba.quantity_from_batch > 0 AND COALESCE(sba.deleted, 0) = 0
+            ORDER BY sba.id DESC
+        ''', params)
+        remaining = _return_qty(ret)
+        for a in cur.fetchall():
+            if remaining <= 0:
+                break
+            take = min(remaining, float(a['quantity_from_batch'] or 0.0) - float(a['claimed'] or 0.0))
+            if take <= 0:
+                continue
+            rows.append({'return_id': ret_id, 'allocation_id': a['id'], 'batch_id': a['batch_id'],
+                         'quantity': take, 'unit_cost': float(a['unit_cost'] or 0.0),
+                         'unit_sale_price': a['unit_sale_price']})
+            remaining -= take
+    cur.executemany('''
+        INSERT INTO return_allocations (return_id, allocation_id, batch_id, quantity, unit_cost, unit_sale_price)
+        VALUES (:return_id, :allocation_id, :batch_id, :quantity, :unit_cost, :unit_sale_price)
+    ''', rows)
+    return rows
+
+
+def _ledger(cur, ret) -> List[Dict[str, Any]]:
+    """Ledger rows of ``ret``, built on first use for returns recorded before the ledger."""
+    if not int(ret['ledger_built'] or 0):
+        return _build_ledger(cur, ret)
+    return _ledger_rows(cur, ret['id'])
+
+
+def _apply_ledger(cur, ledger: List[Dict[str, Any]], direction: int) -> None:
+    """Put the ledger's units back into (1) or take them out of (-1) their batches."""
+    cur.executemany('UPDATE import_batches SET remaining_quantity = remaining_quantity + ? WHERE id = ?',
+                    [(direction * float(r['quantity']), r['batch_id']) for r in ledger if r['batch_id']])
+
+
+def backfill_return_ledger() -> int:
+    """Build ledger rows for returns recorded before ``return_allocations`` existed.
+
+    Oldest returns claim allocations first; each return is claimed
+    atomically, so a concurrent run (or another process) never links it
+    twice. Returns the number of returns linked (0 once everything is).
+    """
+    built = 0
+    with get_cursor() as (conn, cur):
+        cur.execute('SELECT * FROM returns WHERE COALESCE(ledger_built, 0) = 0 ORDER BY id')
+        for ret in cur.fetchall():
+            if _claim_ledger(cur, ret['id']):
+                _write_ledger(cur, ret)
+                built += 1
+        conn.commit()
+    return built
+
+
+def ensure_return_ledger() -> int:
+    """Run ``backfill_return_ledger`` once per process.
+
+    Started at application start; reports that read the ledger call it too
+    and wait for that run instead of starting their own.
+    """
+    global _ledger_backfilled
+    with _ledger_lock:
+        if _ledger_backfilled:
+            return 0
+        built = backfill_return_ledger()
+        _ledger_backfilled = True
+        return built
+
+
 def _compute_refund_base(return_date: str, refund_amount: float, refund_currency: str) -> float:
     """Convert refund_amount into base currency."""
     base = get_base_currency()
@@ -115,72 +239,309 @@ def _compute_refund_base(return_date: str, refund_amount: float, refund_currency
         return float(refund_amount or 0.0) if (refund_currency or base).upper() == base else 0.0
 
 
+_RETURN_COLUMNS = ('return_date', 'product_id', 'sale_date', 'category', 'subcategory',
+                   'unit_price', 'selling_price', 'platform', 'refund_amount',
+                   'refund_currency', 'refund_amount_base', 'restock', 'reason', 'doc_paths',
+                   'sale_id', 'quantity')
+_INSERT_RETURN_SQL = (f"INSERT INTO returns ({', '.join(_RETURN_COLUMNS)}) "
+                      f"VALUES ({','.join('?' * len(_RETURN_COLUMNS))})")
+
+
+def _return_values(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalized column values of a return (refund_amount_base and sale_id not set).
+
+    Raises ValueError on a non-numeric price or refund amount.
+    """
+    try:
+        quantity = float(fields.get('quantity') or 1.0)
+    except (TypeError, ValueError):
+        quantity = 1.0
+    return {
+        'return_date': str(fields.get('return_date') or fields.get('ReturnDate') or '').strip(),
+        'product_id': str(fields.get('product_id') or fields.get('ProductID') or '').strip(),
+        'sale_date': str(fields.get('sale_date') or fields.get('SaleDate') or '').strip(),
+        'category': str(fields.get('category') or fields.get('Category') or '').strip(),
+        'subcategory': str(fields.get('subcategory') or fields.get('Subcategory') or '').strip(),
+        'platform': str(fields.get('platform') or fields.get('Platform') or '').strip(),
+        'unit_price': float(fields.get('unit_price', 0.0) or 0.0),
+        'selling_price': float(fields.get('selling_price', 0.0) or 0.0),
+        'refund_amount': float(fields.get('refund_amount', 0.0) or 0.0),
+        'refund_currency': str(fields.get('refund_currency', get_default_sale_currency()) or '').upper(),
+        'restock': 1 if str(fields.get('restock', 0)).strip().lower() in ('1','true','yes') else 0,
+        'reason': fields.get('reason', fields.get('Reason', '')),
+        'doc_paths': normalize_doc_paths(fields.get('doc_paths', fields.get('ReturnDocPath', ''))),
+        'quantity': quantity if quantity > 0 else 1.0,
+    }
+
+
+def _over_returned(cur, pid) -> Optional[float]:
+    """Units left on ``pid``'s sales line (negative) if live returns now exceed it, else None.
+
+    Call after this transaction's write, so no other writer can interleave.
+    """
+    line = find_sale_lines([pid], cur).get(pid) if pid else None
+    if not line:
+        return None
+    left = float(line['quantity'] or 1) - float(line['returned_units'] or 0)
+    return left if left < -_EPSILON else None
+
+
+def _ledger_overclaimed(cur, ret_id) -> bool:
+    """True if an allocation in ``ret_id``'s ledger is claimed beyond its units by live returns."""
+    cur.execute('''
+        SELECT 1 FROM return_allocations ra
+        JOIN sale_batch_allocations sba ON sba.id = ra.allocation_id
+        WHERE ra.return_id = ?
+          AND (SELECT SUM(o.quantity) FROM return_allocations o JOIN returns r ON r.id = o.return_id
+               WHERE o.allocation_id = ra.allocation_id AND COALESCE(r.deleted, 0) = 0)
+              > sba.quantity_from_batch + ?
+        LIMIT 1
+    ''', (ret_id, _EPSILON))
+    return cur.fetchone() is not None
+
+
 def insert_return(fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """Insert a return, compute refund_amount_base, optionally restock inventory."""
-    # Normalize inputs
-    rd = str(fields.get('return_date') or fields.get('ReturnDate') or '').strip()
-    pid = str(fields.get('product_id') or fields.get('ProductID') or '').strip()
-    sale_date = str(fields.get('sale_date') or fields.get('SaleDate') or '').strip()
-    category = str(fields.get('category') or fields.get('Category') or '').strip()
-    subcategory = str(fields.get('subcategory') or fields.get('Subcategory') or '').strip()
-    platform = str(fields.get('platform') or fields.get('Platform') or '').strip()
-    unit_price = float(fields.get('unit_price', 0.0) or 0.0)
-    selling_price = float(fields.get('selling_price', 0.0) or 0.0)
-    refund_amount = float(fields.get('refund_amount', 0.0) or 0.0)
-    refund_currency = str(fields.get('refund_currency', get_default_sale_currency()) or '').upper()
-    restock = 1 if str(fields.get('restock', 0)).strip().lower() in ('1','true','yes') else 0
-    reason = fields.get('reason', fields.get('Reason', ''))
-    doc_paths = normalize_doc_paths(fields.get('doc_paths', fields.get('ReturnDocPath', '')))
-    refund_base = _compute_refund_base(rd, refund_amount, refund_currency)
+    """Insert a return, compute refund_amount_base, optionally restock inventory.
+
+    Raises ValueError when the sales line has fewer unreturned units than
+    ``quantity`` (nothing is written).
+    """
+    vals = _return_values(fields)
+    vals['refund_amount_base'] = _compute_refund_base(vals['return_date'], vals['refund_amount'],
+                                                      vals['refund_currency'])
 
     with get_cursor() as (conn, cur):
-        cur.execute('''
-            INSERT INTO returns (
-                return_date, product_id, sale_date, category, subcategory,
-                unit_price, selling_price, platform, refund_amount,
-                refund_currency, refund_amount_base, restock, reason, doc_paths
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        ''', (rd, pid, sale_date, category, subcategory, unit_price, selling_price, platform,
-              refund_amount, refund_currency, refund_base, restock, reason, doc_paths))
+        pid = vals['product_id']
+        line = find_sale_line(pid, cur) if pid else None
+        vals['sale_id'] = line['id'] if line else None
+        cur.execute(_INSERT_RETURN_SQL, tuple(vals[c] for c in _RETURN_COLUMNS))
         new_id = cur.lastrowid
+        over = _over_returned(cur, pid)
+        if over is not None:
+            raise ValueError(f"only {max(vals['quantity'] + over, 0.0):g} unit(s) left to return")
+        cur.execute('SELECT * FROM returns WHERE id = ?', (new_id,))
+        ledger = _build_ledger(cur, cur.fetchone(), line)
 
         returned_batches = []
-        if restock and pid:
-            try:
-                remaining_to_return = 1.0
-                cur.execute('SELECT batch_id, quantity_from_batch, unit_cost FROM sale_batch_allocations WHERE product_id = ? ORDER BY id DESC', (pid,))
-                allocations = cur.fetchall()
-                for alloc in allocations:
-                    if remaining_to_return <= 0:
-                        break
-                    batch_id = alloc['batch_id']
-                    original_allocation = float(alloc['quantity_from_batch'] or 0.0)
-                    unit_cost = float(alloc['unit_cost'] or 0.0)
-                    if batch_id is None:
-                        continue
-                    return_to_batch = min(remaining_to_return, original_allocation)
-                    cur.execute('UPDATE import_batches SET remaining_quantity = remaining_quantity + ? WHERE id = ?', (return_to_batch, batch_id))
-                    cur.execute('SELECT batch_date, supplier, category, subcategory FROM import_batches WHERE id = ?', (batch_id,))
-                    batch_info = cur.fetchone()
-                    returned_batches.append({
-                        'batch_id': batch_id,
-                        'batch_date': batch_info['batch_date'] if batch_info else 'Unknown',
-                        'supplier': batch_info['supplier'] if batch_info else 'Unknown',
-                        'category': batch_info['category'] if batch_info else '',
-                        'subcategory': batch_info['subcategory'] if batch_info else '',
-                        'returned_quantity': return_to_batch,
-                        'unit_cost': unit_cost
-                    })
-                    remaining_to_return -= return_to_batch
-                # mark restock processed
-                if returned_batches:
-                    cur.execute('UPDATE returns SET restock_processed = 1 WHERE id = ?', (new_id,))
-            except Exception:
-                pass
+        if vals['restock'] and ledger:
+            _apply_ledger(cur, ledger, 1)
+            cur.execute('UPDATE returns SET restock_processed = 1 WHERE id = ?', (new_id,))
+            batch_ids = sorted({r['batch_id'] for r in ledger if r['batch_id']})
+            cur.execute(f"SELECT id, batch_date, supplier, category, subcategory FROM import_batches "
+                        f"WHERE id IN ({','.join('?' * len(batch_ids))})", batch_ids)
+            batches = {b['id']: b for b in cur.fetchall()}
+            for r in ledger:
+                if not r['batch_id']:
+                    continue
+                batch_info = batches.get(r['batch_id'])
+                returned_batches.append({
+                    'batch_id': r['batch_id'],
+                    'batch_date': batch_info['batch_date'] if batch_info else 'Unknown',
+                    'supplier': batch_info['supplier'] if batch_info else 'Unknown',
+                    'category': batch_info['category'] if batch_info else '',
+                    'subcategory': batch_info['subcategory'] if batch_info else '',
+                    'returned_quantity': r['quantity'],
+                    'unit_cost': r['unit_cost']
+                })
 
         return {'id': new_id, 'restocked_batches': returned_batches}
 
 
+def _base_rates(pairs: Iterable) -> Dict[tuple, Optional[float]]:
+    """Rate to the base currency for each distinct ``(date, currency)`` pair.
+
+    Cached rates are read in one query; only pairs missing from ``fx_cache``
+    go through ``get_rate_to_base`` (once per pair).
+    """
+    base = (get_base_currency() or '').upper()
+    pairs = set(pairs)
+    rates: Dict[tuple, Optional[float]] = {p: 1.0 for p in pairs if p[1] == base}
+    wanted = pairs - set(rates)
+    if wanted:
+        ccys = sorted({c for _, c in wanted})
+        dates = sorted(d for d, _ in wanted)
+        with get_cursor() as (conn, cur):
+            cur.execute(f"SELECT date, from_ccy, rate FROM fx_cache WHERE to_ccy = ? AND rate > 0 "
+                        f"AND from_ccy IN ({','.join('?' * len(ccys))}) AND date BETWEEN ? AND ?",
+                        [base, *ccys, dates[0], dates[-1]])
+            for r in cur.fetchall():
+                if (r['date'], r['from_ccy']) in wanted:
+                    rates[(r['date'], r['from_ccy'])] = float(r['rate'])
+    for p in pairs - set(rates):
+        rates[p] = get_rate_to_base(*p)
+    return rates
+
+
+def _returned_product_ids(product_ids: Iterable[str]) -> set:
+    """The given product IDs that already have a live return, 300 IDs per query."""
+    pids = [p for p in dict.fromkeys(product_ids) if p]
+    out = set()
+    with get_cursor() as (conn, cur):
+        for i in range(0, len(pids), 300):
+            part = pids[i:i + 300]
+            cur.execute(f"SELECT DISTINCT product_id FROM returns WHERE COALESCE(deleted, 0) = 0 "
+                        f"AND product_id IN ({','.join('?' * len(part))})", part)
+            out.update(r[0] for r in cur.fetchall())
+    return out
+
+
+def insert_returns(rows: Iterable[Dict[str, Any]], chunk_size: int = 500, dry_run: bool = False,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """Record many returns at once, e.g. a marketplace's weekly returns file.
+
+    Every row is validated before anything is written: product IDs are
+    resolved to their sales lines in one query per 300 IDs, and a row fails
+    when its ID was never sold, already has a live return, repeats an earlier
+    row's ID, the sale is deleted/voided, or the line has fewer unreturned
+    units than ``quantity`` (counting earlier rows of the same call). Sale date, category, subcategory, platform and price missing from a
+    row are taken from the sale; a blank refund defaults to price x quantity
+    in the sale's currency. Refund FX is resolved once per distinct
+    date/currency. Valid rows are then inserted ``chunk_size`` at a time, each
+    chunk in one transaction with its ledger and batch restocks (inventory
+    follows the batches); a failing chunk is rolled back and reported.
+
+    Args:
+        rows: Dicts with the keys ``insert_return`` accepts.
+        chunk_size: Rows per transaction.
+        dry_run: Validate and convert only; nothing is written.
+        progress: Optional ``callback(rows_done, rows_inserted)`` after each chunk.
+
+    Returns:
+        Dict with ``rows``, ``inserted``, ``failed``, ``restocked_units``,
+        ``seconds`` and ``report``: per input row (in order) its ``row``
+        number, ``product_id``, ``status`` ('inserted', 'valid' on a dry run,
+        or 'error'), ``message``, ``return_id``, ``sale_id``, ``quantity``,
+        ``refund_amount_base`` and ``restocked`` units.
+    """
+    t0 = time.perf_counter()
+    report: List[Dict[str, Any]] = []
+    pending = []
+    for n, fields in enumerate(rows, start=1):
+        entry = {'row': n, 'product_id': str(fields.get('product_id') or fields.get('ProductID') or '').strip(),
+                 'status': 'error', 'message': '', 'return_id': None, 'sale_id': None,
+                 'quantity': None, 'refund_amount_base': None, 'restocked': 0.0}
+        report.append(entry)
+        try:
+            vals = _return_values(fields)
+        except (TypeError, ValueError) as e:
+            entry['message'] = f'invalid number: {e}'
+            continue
+        if not vals['product_id']:
+            entry['message'] = 'missing product ID'
+        elif not vals['return_date']:
+            entry['message'] = 'missing return date'
+        else:
+            pending.append((entry, vals, fields))
+
+    lines = find_sale_lines(v['product_id'] for _, v, _ in pending)
+    returned = _returned_product_ids(v['product_id'] for _, v, _ in pending)
+    seen = set()
+    claimed: Dict[int, float] = {}
+    valid = []
+    for entry, vals, fields in pending:
+        pid = vals['product_id']
+        if pid in seen:
+            entry['message'] = 'product ID repeated in this import'
+            continue
+        seen.add(pid)
+        if pid in returned:
+            entry['message'] = 'product ID already returned'
+            continue
+        line = lines.get(pid)
+        if line is None:
+            entry['message'] = 'product ID not found in sales'
+            continue
+        if int(line.get('deleted') or 0) or int(line.get('voided') or 0):
+            entry['message'] = 'sale is deleted or voided'
+            continue
+        left = float(line['quantity'] or 1) - float(line['returned_units'] or 0) - claimed.get(line['id'], 0.0)
+        if vals['quantity'] > left:
+            entry['message'] = f'only {max(left, 0.0):g} unit(s) left to return'
+            continue
+        claimed[line['id']] = claimed.get(line['id'], 0.0) + vals['quantity']
+        vals['sale_id'] = line['id']
+        for key, col in (('sale_date', 'date'), ('category', 'category'),
+                         ('subcategory', 'subcategory'), ('platform', 'platform')):
+            vals[key] = vals[key] or str(line.get(col) or '')
+        if not vals['selling_price']:
+            vals['selling_price'] = float(line.get('selling_price') or 0.0)
+        if not vals['unit_price']:
+            vals['unit_price'] = vals['selling_price']
+        if not str(fields.get('refund_currency') or '').strip():
+            vals['refund_currency'] = str(line.get('sale_currency') or vals['refund_currency'] or '').upper()
+        if str(fields.get('refund_amount') or '').strip() == '':
+            vals['refund_amount'] = vals['selling_price'] * vals['quantity']
+        entry.update(sale_id=line['id'], quantity=vals['quantity'])
+        valid.append((entry, vals, line))
+
+    base = (get_base_currency() or '').upper()
+    rates = _base_rates((v['return_date'], v['refund_currency'] or base) for _, v, _ in valid)
+    for entry, vals, _ in valid:
+        ccy = vals['refund_currency'] or base
+        rate = rates.get((vals['return_date'], ccy))
+        if rate and rate > 0:
+            vals['refund_amount_base'] = vals['refund_amount'] * rate
+        else:
+            vals['refund_amount_base'] = 0.0
+            entry['message'] = f"no {ccy} rate for {vals['return_date']}; base refund recorded as 0"
+        entry['refund_amount_base'] = vals['refund_amount_base']
+        if dry_run:
+            entry['status'] = 'valid'
+
+    inserted = 0
+    restocked_units = 0.0
+    if not dry_run and valid:
+        size = max(1, int(chunk_size or 1))
+        with get_cursor() as (conn, cur):
+            for i in range(0, len(valid), size):
+                chunk = valid[i:i + size]
+                try:
+                    cur.executemany(_INSERT_RETURN_SQL,
+                                    [tuple(vals[c] for c in _RETURN_COLUMNS) for _, vals, _ in chunk])
+                    # consecutive AUTOINCREMENT ids under this transaction's write lock
+                    cur.execute('SELECT last_insert_rowid()')
+                    last = cur.fetchone()[0]
+                    cur.execute('SELECT * FROM returns WHERE id BETWEEN ? AND ? ORDER BY id',
+                                (last - len(chunk) + 1, last))
+                    batch_delta: Dict[int, float] = {}
+                    restocked = []
+                    for (entry, vals, line), ret in zip(chunk, cur.fetchall()):
+                        ledger = _build_ledger(cur, ret, line)
+                        entry['return_id'] = ret['id']
+                        if vals['restock'] and ledger:
+                            for r in ledger:
+                                if r['batch_id']:
+                                    batch_delta[r['batch_id']] = batch_delta.get(r['batch_id'], 0.0) + r['quantity']
+                            entry['restocked'] = sum(r['quantity'] for r in ledger)
+                            restocked.append((ret['id'],))
+                    cur.executemany('UPDATE import_batches SET remaining_quantity = remaining_quantity + ? WHERE id = ?',
+                                    [(q, b) for b, q in batch_delta.items()])
+                    cur.executemany('UPDATE returns SET restock_processed = 1 WHERE id = ?', restocked)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"insert_returns: chunk starting at row {chunk[0][0]['row']} failed: {e}")
+                    for entry, _, _ in chunk:
+                        entry.update(status='error', return_id=None, restocked=0.0, message=f'not saved: {e}')
+                else:
+                    for entry, _, _ in chunk:
+                        entry['status'] = 'inserted'
+                        restocked_units += entry['restocked']
+                    inserted += len(chunk)
+                if progress:
+                    progress(min(i + size, len(valid)), inserted)
+
+    ok = 'valid' if dry_run else 'inserted'
+    return {
+        'rows': len(report),
+        'inserted': inserted,
+        'failed': sum(1 for e in report if e['status'] != ok),
+        'restocked_units': restocked_units,
+        'seconds': round(time.perf_counter() - t0, 3),
+        'report': report,
+    }
+
+
 def update_return(ret_id: int, fields: Dict[str, Any]) -> bool:
     """Update a return and recompute refund_amount_base if needed."""
     with get_cursor() as (conn, cur):
@@ -218,18 +579,9 @@ def delete_return(ret_id: int) -> bool:
         restock = ret['restock']
         restock_processed = ret['restock_processed']
         product_id = ret['product_id']
-        category = ret['category']
-        subcategory = ret['subcategory']
         if int(restock or 0) == 1 and int(restock_processed or 0) == 1 and product_id:
             try:
-                cur.execute('SELECT batch_id, quantity_from_batch FROM sale_batch_allocations WHERE product_id = ?', (product_id,))
-                allocations = cur.fetchall()
-                for alloc in allocations:
-                    batch_id = alloc['batch_id']
-                    qty = float(alloc['quantity_from_batch'] or 0.0)
-                    if batch_id:
-                        cur.execute('UPDATE import_batches SET remaining_quantity = remaining_quantity - ? WHERE id = ?', (qty, batch_id))
-                update_inventory(category, subcategory, -1, cur=cur)
+                _apply_ledger(cur, _ledger(cur, ret), -1)
             except Exception as e:
                 conn.rollback()
                 logger.error(f"Error updating inventory or batches during delete_return: {e}")
@@ -239,7 +591,12 @@ def delete_return(ret_id: int) -> bool:
 
 
 def undelete_return(ret_id: int) -> bool:
-    """Restore a soft-deleted return and re-apply inventory restock if needed."""
+    """Restore a soft-deleted return and re-apply inventory restock if needed.
+
+    Refused (False) when live returns recorded since leave the sales line
+    too few units; if they only took the allocations it reversed, the
+    ledger is rebuilt from the allocations still unclaimed.
+    """
     logger.info(f"Undeleted return id={ret_id}")
     with get_cursor() as (conn, cur):
         cur.execute('SELECT * FROM returns WHERE id = ?', (ret_id,))
@@ -249,23 +606,25 @@ def undelete_return(ret_id: int) -> bool:
         restock = ret['restock']
         restock_processed = ret['restock_processed']
         product_id = ret['product_id']
-        category = ret['category']
-        subcategory = ret['subcategory']
-        if int(restock or 0) == 1 and int(restock_processed or 0) == 1 and product_id:
-            try:
-                cur.execute('SELECT batch_id, quantity_from_batch FROM sale_batch_allocations WHERE product_id = ?', (product_id,))
-                allocations = cur.fetchall()
-                for alloc in allocations:
-                    batch_id = alloc['batch_id']
-                    qty = float(alloc['quantity_from_batch'] or 0.0)
-                    if batch_id:
-                        cur.execute('UPDATE import_batches SET remaining_quantity = remaining_quantity + ? WHERE id = ?', (qty, batch_id))
-                update_inventory(category, subcategory, 1, cur=cur)
-            except Exception as e:
+        # Restore first: this write locks out other writers while the claims are checked
+        cur.execute('UPDATE returns SET deleted = 0 WHERE id = ?', (ret_id,))
+        if product_id:
+            if _over_returned(cur, product_id) is not None:
                 conn.rollback()
-                logger.error(f"Error updating inventory or batches during undelete_return: {e}")
+                logger.error(f"Cannot undelete return id={ret_id}: its units were returned again since")
                 return False
-        cur.execute('UPDATE returns SET deleted = 0 WHERE id = ?', (ret_id,))
+            ledger = _ledger(cur, ret)
+            if _ledger_overclaimed(cur, ret_id):
+                # Later returns took these allocations; link the units still unclaimed instead
+                cur.execute('DELETE FROM return_allocations WHERE return_id = ?', (ret_id,))
+                ledger = _write_ledger(cur, ret)
+            if int(restock or 0) == 1 and int(restock_processed or 0) == 1:
+                try:
+                    _apply_ledger(cur, ledger, 1)
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Error updating inventory or batches during undelete_return: {e}")
+                    return False
         return True
 
 
@@ -0,0 +1,121 @@
+"""returns_import.py - bulk import of a returns file (CSV).
+
+Marketplaces send their returns as a weekly spreadsheet. Instead of one
+dialog per product in the sales view, the file is read here and recorded
+through ``insert_returns``: product IDs are validated against sales in bulk,
+refund FX is resolved once per date/currency, and rows are written in
+chunked transactions. Each input row gets a line in the result report.
+
+Headers are matched case-insensitively; the ``insert_return`` field names
+work, as do common spellings (``ProductID``, ``Date``, ``Refund``,
+``Currency``, ``Qty``...). Only a product ID and a return date are required.
+Comma, semicolon and tab separated files are accepted.
+
+CLI::
+
+    python -m db.returns_import returns.csv --report returns-report.csv
+    python -m db.returns_import returns.csv --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .returns_dao import insert_returns
+
+_HEADER_ALIASES = {
+    'productid': 'product_id',
+    'product': 'product_id',
+    'sku': 'product_id',
+    'date': 'return_date',
+    'returndate': 'return_date',
+    'saledate': 'sale_date',
+    'order_date': 'sale_date',
+    'refund': 'refund_amount',
+    'amount': 'refund_amount',
+    'refund_ccy': 'refund_currency',
+    'currency': 'refund_currency',
+    'qty': 'quantity',
+    'units': 'quantity',
+    'restocked': 'restock',
+    'returndocpath': 'doc_paths',
+}
+
+REPORT_FIELDS = ['row', 'product_id', 'status', 'message', 'return_id', 'sale_id',
+                 'quantity', 'refund_amount_base', 'restocked']
+
+
+def _field_name(header: str) -> str:
+    key = (header or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return _HEADER_ALIASES.get(key, key)
+
+
+def read_returns_csv(path) -> Iterator[Dict[str, str]]:
+    """Rows of a returns CSV as dicts keyed by ``insert_return`` field names."""
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(fh, dialect)
+        header = [_field_name(h) for h in next(reader, [])]
+        for values in reader:
+            if not any((v or '').strip() for v in values):
+                continue
+            yield {k: (v or '').strip() for k, v in zip(header, values) if k}
+
+
+def write_report(report: Iterable[Dict], path) -> None:
+    """Write the per-row result report of an import as CSV."""
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.DictWriter(fh, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def import_returns_csv(path, chunk_size: int = 500, dry_run: bool = False,
+                       report_path=None,
+                       progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, object]:
+    """Import a returns CSV; see ``insert_returns`` for validation and the result.
+
+    Row numbers in the report count data rows (the header is not counted,
+    blank lines are skipped). With ``report_path`` the report is also
+    written there as CSV.
+    """
+    stats = insert_returns(read_returns_csv(path), chunk_size=chunk_size, dry_run=dry_run,
+                           progress=progress)
+    if report_path:
+        write_report(stats['report'], report_path)
+    return stats
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Record the returns listed in a CSV file.')
+    ap.add_argument('path', help='returns CSV (product_id, return_date, refund_amount, ...)')
+    ap.add_argument('--report', default=None, help='write the per-row result report to this CSV')
+    ap.add_argument('--dry-run', action='store_true', help='validate only; record nothing')
+    ap.add_argument('--chunk-size', type=int, default=500)
+    args = ap.parse_args(argv)
+
+    from .connection import init_db
+    init_db().close()
+    stats = import_returns_csv(Path(args.path), chunk_size=args.chunk_size, dry_run=args.dry_run,
+                               report_path=args.report,
+                               progress=lambda d, n: print(f'{d} rows, {n} recorded...'))
+    failed: List[Dict] = [e for e in stats['report'] if e['status'] == 'error']
+    for e in failed[:20]:
+        print(f"row {e['row']} ({e['product_id'] or '-'}): {e['message']}")
+    verb = 'Validated' if args.dry_run else 'Recorded'
+    ok = stats['rows'] - stats['failed']
+    print(f"{verb} {ok} of {stats['rows']} returns ({stats['restocked_units']:g} units restocked) "
+          f"in {stats['seconds']}s; {stats['failed']} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,317 @@
+"""sale_orders_dao.py - sale orders with serial-range lines.
+
+A sale is one ``sale_orders`` header plus one ``sales`` row per line. A line
+stores ``quantity`` units at the unit ``selling_price`` and a product-ID
+serial range: the IDs are ``product_prefix`` followed by every serial in
+``serial_from..serial_to`` (``product_id`` / ``product_id_last`` hold the
+first and last). Batch allocations are written per line and batch, tagged
+with ``order_line_id``, so a 500-unit sale costs one sales row and a few
+allocation rows instead of 500 of each.
+
+Per-unit product IDs are only materialized on demand (``expand_product_ids``);
+``find_sale_line`` resolves any unit's ID to its line through the
+``(product_prefix, serial_from)`` index.
+
+Legacy sales (one row per unit) keep working; ``compact_sales_into_orders``
+folds them into orders. CLI::
+
+    python -m db.sale_orders_dao --compact
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .connection import get_cursor
+from .product_codes_dao import format_product_id, reserve_product_serials, split_product_id
+
+_ORDER_FIELDS = ('date', 'customer_id', 'platform', 'sale_currency', 'fx_to_base', 'document_path')
+# Legacy rows with equal values here (and consecutive serials) fold into one line
+_LINE_FIELDS = ('category', 'subcategory', 'selling_price', 'selling_price_base',
+                'vat_rate', 'vat_amount', 'is_vat_inclusive')
+
+
+def expand_product_ids(line) -> List[str]:
+    """Every product ID of a sales line (a row dict, or a sales id)."""
+    if not isinstance(line, dict):
+        with get_cursor() as (conn, cur):
+            cur.execute('SELECT * FROM sales WHERE id=?', (line,))
+            row = cur.fetchone()
+        if not row:
+            return []
+        line = dict(row)
+    prefix, first, last = line.get('product_prefix'), line.get('serial_from'), line.get('serial_to')
+    if not prefix or first is None or last is None:
+        return [line['product_id']] if line.get('product_id') else []
+    return [format_product_id(prefix, s) for s in range(int(first), int(last) + 1)]
+
+
+def find_sale_line(product_id, cur=None) -> Optional[Dict]:
+    """The sales row (line or legacy unit row) that sold ``product_id``, or None.
+
+    Exact ``product_id`` matches win; otherwise the line whose serial range
+    covers the ID. Active rows are preferred over deleted/voided ones.
+    """
+    pid = str(product_id or '').strip()
+    if not pid:
+        return None
+    if cur is None:
+        with get_cursor() as (conn, c):
+            return find_sale_line(pid, c)
+    order = 'ORDER BY (COALESCE(deleted, 0) + COALESCE(voided, 0)) ASC, id DESC LIMIT 1'
+    cur.execute(f'SELECT * FROM sales WHERE product_id = ? AND quantity > 0 {order}', (pid,))
+    row = cur.fetchone()
+    if row is None:
+        parts = split_product_id(pid)
+        if parts is None:
+            return None
+        # serial_from <= serial is a range on idx_sales_serial; the nearest
+        # range start is the only candidate since ranges never overlap
+        cur.execute('SELECT * FROM sales WHERE product_prefix = ? AND serial_from <= ? '
+                    'ORDER BY serial_from DESC, id DESC LIMIT 1', parts)
+        row = cur.fetchone()
+        if row is None or row['serial_to'] is None or row['serial_to'] < parts[1]:
+            return None
+    return dict(row)
+
+
+def find_sale_lines(product_ids: Iterable, cur=None) -> Dict[str, Dict]:
+    """Bulk ``find_sale_line``: ``{product_id: sales row}`` for the IDs that were sold.
+
+    Resolves up to 300 IDs per query (exact match, else the covering serial
+    range). Each row also carries ``returned_units``, the units of the line
+    already returned by live returns.
+    """
+    from .sales_dao import _RETURNED_UNITS_SQL
+    pids = [p for p in dict.fromkeys(str(p or '').strip() for p in product_ids) if p]
+    if cur is None:
+        with get_cursor() as (conn, c):
+            return find_sale_lines(pids, c)
+    out: Dict[str, Dict] = {}
+    active = '(COALESCE(deleted, 0) + COALESCE(voided, 0)) ASC, id DESC'
+    for i in range(0, len(pids), 300):
+        part = pids[i:i + 300]
+        params: list = []
+        for pid in part:
+            parts = split_product_id(pid) or (None, None)
+            params.extend((pid, parts[0], parts[1]))
+        cur.execute(f'''
+            WITH q(pid, prefix, serial) AS (VALUES {','.join(['(?,?,?)'] * len(part))})
+            SELECT q.pid AS requested_id, s.*, {_RETURNED_UNITS_SQL} AS returned_units
+            FROM q JOIN sales s ON s.id = COALESCE(
+                (SELECT id FROM sales WHERE product_id = q.pid AND quantity > 0 ORDER BY {active} LIMIT 1),
+                (SELECT CASE WHEN serial_to >= q.serial THEN id END FROM sales
+                 WHERE product_prefix = q.prefix AND serial_from <= q.serial
+                 ORDER BY serial_from DESC, id DESC LIMIT 1))
+        ''', params)
+        for row in cur.fetchall():
+            line = dict(row)
+            out[line.pop('requested_id')] = line
+    return out
+
+
+def allocation_filter(product_id, alias: str = '', cur=None, line=None) -> Tuple[str, list]:
+    """SQL condition (and params) selecting the batch allocations of ``product_id``.
+
+    Legacy allocations are keyed by the unit's own product ID; order lines
+    tag theirs with ``order_line_id``. Pass ``line`` when the sales row is
+    already known to skip the lookup.
+    """
+    p = f'{alias}.' if alias else ''
+    if line is None:
+        line = find_sale_line(product_id, cur)
+    if line and line.get('order_id') is not None:
+        return f'({p}product_id = ? OR {p}order_line_id = ?)', [str(product_id), line['id']]
+    return f'{p}product_id = ?', [str(product_id)]
+
+
+def create_sale_order(order: Dict, lines: Iterable[Dict]) -> Dict:
+    """Record a sale as one order with one line per product, in one transaction.
+
+    Args:
+        order: Header fields ``date``, ``customer_id``, ``platform``,
+            ``sale_currency``, ``fx_to_base`` and ``document_path``.
+        lines: Dicts with ``category``, ``subcategory``, ``quantity`` (whole
+            units), ``selling_price`` (unit price), ``selling_price_base``,
+            ``vat_rate``, ``vat_amount`` and ``is_vat_inclusive``. Serials are
+            reserved for each line from its category's product code, using
+            the order date's year as prefix.
+
+    Returns:
+        Dict with ``order_id`` and ``lines``: per line ``sale_id``,
+        ``product_id``, ``product_id_last``, ``quantity`` and ``allocations``
+        (as returned by ``allocate_to_batches``).
+
+    Raises:
+        ValueError: on a non-whole quantity or a category/subcategory without
+            a product code (nothing is written).
+    """
+    from .audit import write_audit
+    from .imports_dao import allocate_to_batches
+    from .sales_dao import _SALE_INSERT_SQL, _sale_params
+    d = str(order.get('date') or '')
+    header = [order.get(k) for k in _ORDER_FIELDS]
+    header[0] = d
+    out: Dict = {'order_id': None, 'lines': []}
+    with get_cursor() as (conn, cur):
+        cur.execute(f"INSERT INTO sale_orders ({', '.join(_ORDER_FIELDS)}) VALUES (?,?,?,?,?,?)", header)
+        order_id = cur.lastrowid
+        units = 0
+        for line in lines:
+            qty = float(line.get('quantity') or 0)
+            if qty <= 0 or not qty.is_integer():
+                raise ValueError(f'Quantity must be a positive whole number (got {qty})')
+            cat, sub = line.get('category') or '', line.get('subcategory') or ''
+            reserved = reserve_product_serials(cat, sub, int(qty), year_prefix=d[:4] or None, cur=cur)
+            if not reserved:
+                raise ValueError(f"No product code mapping for '{cat}' / '{sub}'")
+            prefix, first, last = reserved
+            row = {k: order.get(k) for k in _ORDER_FIELDS}
+            row.update(line, date=d, quantity=qty, product_id=format_product_id(prefix, first))
+            cur.execute(_SALE_INSERT_SQL, _sale_params(row))
+            sale_id = cur.lastrowid
+            cur.execute('UPDATE sales SET order_id=?, product_prefix=?, serial_from=?, serial_to=?, '
+                        'product_id_last=? WHERE id=?',
+                        (order_id, prefix, first, last, format_product_id(prefix, last), sale_id))
+            allocations = allocate_to_batches(cur, row['product_id'], d, cat, sub, qty,
+                                              line.get('selling_price_base') or 0.0, order_line_id=sale_id)
+            out['lines'].append({'sale_id': sale_id, 'product_id': row['product_id'],
+                                 'product_id_last': format_product_id(prefix, last),
+                                 'quantity': int(qty), 'allocations': allocations})
+            units += int(qty)
+        write_audit('add', 'sale_order', str(order_id), f"lines={len(out['lines'])}; units={units}", cur=cur)
+        conn.commit()
+        out['order_id'] = order_id
+    return out
+
+
+def _runs(rows: List[Dict]) -> List[List[Dict]]:
+    """Split unit rows into line runs: same line fields and consecutive serials."""
+    keyed = []
+    for r in rows:
+        parts = split_product_id(r['product_id'])
+        keyed.append((parts, r))
+    keyed.sort(key=lambda kr: (tuple(str(kr[1][f]) for f in _LINE_FIELDS),
+                               kr[0] or ('', 0), kr[1]['id']))
+    runs: List[List[Dict]] = []
+    prev = None
+    for parts, r in keyed:
+        r['_parts'] = parts
+        if (prev is not None and parts and prev['_parts']
+                and all(r[f] == prev[f] for f in _LINE_FIELDS)
+                and parts[0] == prev['_parts'][0] and parts[1] == prev['_parts'][1] + 1):
+            runs[-1].append(r)
+        else:
+            runs.append([r])
+        prev = r
+    return runs
+
+
+def _compact_order(cur, header: tuple, rows: List[Dict]) -> Tuple[int, int]:
+    """Fold one group of unit rows into an order; returns (order_id, lines)."""
+    cur.execute(f"INSERT INTO sale_orders ({', '.join(_ORDER_FIELDS)}) VALUES (?,?,?,?,?,?)", header)
+    order_id = cur.lastrowid
+    runs = _runs(rows)
+    for run in runs:
+        keep = run[0]
+        parts, last = keep['_parts'], run[-1]['_parts']
+        cur.execute('UPDATE sales SET order_id=?, quantity=?, product_prefix=?, serial_from=?, serial_to=?, '
+                    'product_id_last=? WHERE id=?',
+                    (order_id, len(run), parts[0] if parts else None, parts[1] if parts else None,
+                     last[1] if last else None, run[-1]['product_id'], keep['id']))
+        pids = [r['product_id'] for r in run]
+        marks = ','.join('?' * len(pids))
+        cur.execute(f'UPDATE returns SET sale_id=? WHERE product_id IN ({marks})', (keep['id'], *pids))
+        # re-key the units' allocations onto the line, then merge same-batch rows
+        cur.execute(f'UPDATE sale_batch_allocations SET order_line_id=?, product_id=? '
+                    f'WHERE product_id IN ({marks})', (keep['id'], keep['product_id'], *pids))
+        cur.execute('SELECT id, batch_id, unit_cost, unit_sale_price, deleted, quantity_from_batch '
+                    'FROM sale_batch_allocations WHERE order_line_id = ? ORDER BY id', (keep['id'],))
+        merged: Dict[tuple, list] = {}
+        for a in cur.fetchall():
+            qty = a['quantity_from_batch'] or 0
+            # returns write negative rows; keep them apart from the sale's own
+            key = (a['batch_id'], a['unit_cost'], a['unit_sale_price'], a['deleted'] or 0, qty < 0)
+            merged.setdefault(key, []).append((a['id'], qty))
+        drop, resize, repoint = [], [], []
+        for allocs in merged.values():
+            if len(allocs) > 1:
+                resize.append((sum(q for _, q in allocs), allocs[0][0]))
+                drop.extend((i,) for i, _ in allocs[1:])
+                repoint.extend((allocs[0][0], i) for i, _ in allocs[1:])
+        cur.executemany('UPDATE sale_batch_allocations SET quantity_from_batch=? WHERE id=?', resize)
+        # the return ledger follows its allocations onto the kept row
+        cur.executemany('UPDATE return_allocations SET allocation_id=? WHERE allocation_id=?', repoint)
+        cur.executemany('DELETE FROM sale_batch_allocations WHERE id=?', drop)
+        if len(run) > 1:
+            cur.executemany('DELETE FROM sales WHERE id=?', [(r['id'],) for r in run[1:]])
+    return order_id, len(runs)
+
+
+def compact_sales_into_orders(chunk_size: int = 500) -> Dict[str, object]:
+    """Fold legacy one-row-per-unit sales into orders with serial-range lines.
+
+    Active single-unit sales without an order are grouped into orders by
+    date, customer, platform, currency, FX rate and document; within an order,
+    units with the same category, prices and VAT and consecutive product-ID
+    serials become one line. Their allocations and returns are re-pointed at
+    the line, and return-ledger rows follow their merged allocations. Each
+    ``chunk_size`` orders commit together, so the migration can be
+    interrupted and re-run.
+
+    Returns:
+        Dict with ``orders``, ``lines``, ``rows_before``, ``rows_removed``
+        and ``seconds``.
+    """
+    from .audit import write_audit
+    t0 = time.perf_counter()
+    out = {'orders': 0, 'lines': 0, 'rows_before': 0, 'rows_removed': 0, 'seconds': 0.0}
+    cols = ', '.join(('id', 'product_id') + _ORDER_FIELDS + _LINE_FIELDS)
+    with get_cursor() as (conn, cur):
+        cur.execute(f'''
+            SELECT {cols} FROM sales
+            WHERE order_id IS NULL AND quantity = 1
+              AND COALESCE(deleted, 0) = 0 AND COALESCE(voided, 0) = 0
+            ORDER BY {', '.join(_ORDER_FIELDS)}, id
+        ''')
+        groups: Dict[tuple, List[Dict]] = {}
+        for r in cur.fetchall():
+            r = dict(r)
+            groups.setdefault(tuple(r[k] for k in _ORDER_FIELDS), []).append(r)
+        pending = 0
+        for header, rows in groups.items():
+            order_id, lines = _compact_order(cur, header, rows)
+            write_audit('compact', 'sale_order', str(order_id), f'rows={len(rows)}; lines={lines}', cur=cur)
+            out['orders'] += 1
+            out['lines'] += lines
+            out['rows_before'] += len(rows)
+            out['rows_removed'] += len(rows) - lines
+            pending += 1
+            if pending >= chunk_size:
+                conn.commit()
+                pending = 0
+        conn.commit()
+    out['seconds'] = round(time.perf_counter() - t0, 3)
+    return out
+
+
+def main(argv=None) -> int:
+    from . import connection
+    ap = argparse.ArgumentParser(description='Sale order maintenance.')
+    ap.add_argument('--compact', action='store_true',
+                    help='fold legacy one-row-per-unit sales into orders with serial-range lines')
+    args = ap.parse_args(argv)
+    if not args.compact:
+        ap.print_help()
+        return 0
+    connection.init_db().close()
+    stats = compact_sales_into_orders()
+    print(f"Compacted {stats['rows_before']} sales rows into {stats['lines']} lines "
+          f"in {stats['orders']} orders ({stats['rows_removed']} rows removed) in {stats['seconds']}s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
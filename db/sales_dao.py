@@ -1,5 +1,6 @@
 from .connection import get_conn, get_cursor
 from .utils import float_or_none
+from .product_codes_dao import split_product_id
 
 
 def list_sales(include_deleted: bool = False):
@@ -24,45 +25,233 @@ def list_sales(include_deleted: bool = False):
         return []
 
 
+# sort name -> (column, direction); ties are broken by id in the same direction
+SALE_SORTS = {
+    'date_desc': ('date', 'DESC'),
+    'date_asc': ('date', 'ASC'),
+    'price_desc': ('selling_price', 'DESC'),
+    'price_asc': ('selling_price', 'ASC'),
+}
+# NULL sort keys page as these values (a NULL never satisfies the keyset predicate)
+_SORT_NULLS = {'date': '', 'selling_price': 0}
+
+# Returns of a sales row: linked by sale_id, or (legacy returns) by product ID
+_RETURN_OF_SALE = ('(r.sale_id = s.id OR (r.sale_id IS NULL AND r.product_id = s.product_id)) '
+                   'AND COALESCE(r.deleted, 0) = 0')
+_RETURNED_SQL = f'EXISTS (SELECT 1 FROM returns r WHERE {_RETURN_OF_SALE})'
+_RETURNED_UNITS_SQL = f'(SELECT COALESCE(SUM(COALESCE(r.quantity, 1)), 0) FROM returns r WHERE {_RETURN_OF_SALE})'
+_RETURN_ID_SQL = f'(SELECT MAX(r.id) FROM returns r WHERE {_RETURN_OF_SALE})'
+# Row shape shared by query_sales and get_sale
+_SALE_ROW_SELECT = (f'SELECT s.*, c.name AS customer_name, {_RETURNED_SQL} AS is_returned, '
+                    f'{_RETURNED_UNITS_SQL} AS returned_units, {_RETURN_ID_SQL} AS return_id '
+                    'FROM sales s LEFT JOIN customers c ON c.customer_id = s.customer_id')
+_SEARCH_COLUMNS = ('s.product_id', 's.category', 's.subcategory', 's.platform', 's.customer_id', 'c.name')
+
+
+def _sales_where(filters: dict):
+    """Build the WHERE clause shared by the page and totals queries."""
+    f = filters or {}
+    where, params = [], []
+    if not f.get('include_deleted'):
+        where.append('COALESCE(s.deleted, 0) = 0')
+    if not f.get('include_voided') and not f.get('include_deleted'):
+        where.append('COALESCE(s.voided, 0) = 0')
+    # Year filters become a date range so idx_sales_date can be used
+    year_from = f.get('year_from') or f.get('year')
+    year_to = f.get('year_to') or f.get('year')
+    if year_from:
+        where.append('s.date >= ?')
+        params.append(f'{int(year_from):04d}-01-01')
+    if year_to:
+        where.append('s.date < ?')
+        params.append(f'{int(year_to) + 1:04d}-01-01')
+    if f.get('customer_id'):
+        where.append('s.customer_id = ?')
+        params.append(str(f['customer_id']))
+    returned = f.get('returned')
+    if returned == 'returned':
+        where.append(_RETURNED_SQL)
+    elif returned == 'not_returned':
+        where.append('NOT ' + _RETURNED_SQL)
+    q = (f.get('search') or '').strip()
+    if q:
+        from .text_search import match_expression, search_available
+        expr = match_expression(q)
+        if expr and search_available('sale'):
+            cond = 's.id IN (SELECT rowid FROM sales_fts WHERE sales_fts MATCH ?)'
+            params.append(expr)
+            parts = split_product_id(q)
+            if parts:
+                # IDs inside an order line's serial range are not in the index
+                cond = f'({cond} OR (s.product_prefix = ? AND s.serial_from <= ? AND s.serial_to >= ?))'
+                params.extend([parts[0], parts[1], parts[1]])
+            where.append(cond)
+        else:
+            # FTS index missing or not backfilled yet
+            like = f'%{q}%'
+            where.append('(' + ' OR '.join(f'{c} LIKE ?' for c in _SEARCH_COLUMNS) + ')')
+            params.extend([like] * len(_SEARCH_COLUMNS))
+    return (' WHERE ' + ' AND '.join(where)) if where else '', params
+
+
+def query_sales(filters: dict = None, sort: str = 'date_desc', page_size: int = 200, cursor=None) -> dict:
+    """Fetch one page of sales with filtering, sorting and totals done in SQL.
+
+    Args:
+        filters: Optional keys ``year`` (or ``year_from``/``year_to``),
+            ``search`` (words prefix-matched against product id, category,
+            subcategory, platform, customer id or name and date, via
+            ``sales_fts``), ``returned`` (``'returned'`` or
+            ``'not_returned'``), ``customer_id``, ``include_deleted`` and
+            ``include_voided``.
+        sort: One of ``SALE_SORTS``.
+        page_size: Rows per page.
+        cursor: ``next_cursor`` of the previous page, or None for the first.
+
+    Returns:
+        Dict with ``rows`` (sales dicts plus ``customer_name``, ``is_returned``,
+        ``returned_units`` and ``return_id``), ``next_cursor`` (None on the last page) and,
+        for the first page only, ``totals`` over every matching row:
+        ``count``, ``units``, ``returned`` and the sums of ``selling_price``,
+        ``net``, ``vat_amount``, ``gross`` and ``selling_price_usd`` (units
+        not returned; USD via cached USD/TRY rates, ``usd_missing`` counts
+        rows without one). Order lines count ``quantity`` units at the unit
+        price; legacy rows count as one sale each.
+    """
+    col, direction = SALE_SORTS.get(sort, SALE_SORTS['date_desc'])
+    key = f'COALESCE(s.{col}, {_SORT_NULLS[col]!r})'
+    where, params = _sales_where(filters)
+    out = {'rows': [], 'next_cursor': None, 'totals': None}
+    try:
+        with get_cursor() as (conn, cur):
+            page_where, page_params = where, list(params)
+            if cursor:
+                op = '<' if direction == 'DESC' else '>'
+                cond = f'({key} {op} ? OR ({key} = ? AND s.id {op} ?))'
+                page_where = (page_where + ' AND ' + cond) if page_where else ' WHERE ' + cond
+                page_params += [cursor[0], cursor[0], cursor[1]]
+            cur.execute(
+                f'''{_SALE_ROW_SELECT}
+                    {page_where}
+                    ORDER BY {key} {direction}, s.id {direction}
+                    LIMIT ?''',
+                (*page_params, int(page_size)))
+            rows = [dict(r) for r in cur.fetchall()]
+            out['rows'] = rows
+            if len(rows) == page_size:
+                last = rows[-1][col]
+                out['next_cursor'] = (_SORT_NULLS[col] if last is None else last, rows[-1]['id'])
+            if cursor is None:
+                out['totals'] = _sales_totals(cur, where, params)
+    except Exception as e:
+        print("Error in query_sales:", e)
+    return out
+
+
+def get_sale(sale_id: int):
+    """One sales row by id (deleted rows included), shaped like ``query_sales`` rows.
+
+    Returns None if there is no such sale.
+    """
+    try:
+        with get_cursor() as (conn, cur):
+            cur.execute(f'{_SALE_ROW_SELECT} WHERE s.id = ?', (int(sale_id),))
+            row = cur.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        print("Error in get_sale:", e)
+        return None
+
+
+def _sales_totals(cur, where: str, params: list) -> dict:
+    rate = 'COALESCE(s.vat_rate, 18.0)'
+    net = (f'CASE WHEN COALESCE(s.is_vat_inclusive, 1) THEN s.selling_price / (1 + {rate} / 100.0) '
+           'ELSE s.selling_price END')
+    gross = (f'CASE WHEN COALESCE(s.is_vat_inclusive, 1) THEN s.selling_price '
+             f'ELSE s.selling_price * (1 + {rate} / 100.0) END')
+    usd = ("CASE WHEN UPPER(COALESCE(s.sale_currency, '')) = 'USD' THEN s.selling_price "
+           'ELSE s.selling_price / NULLIF(fx.rate, 0) END')
+    # units still sold: an order line's quantity net of returned units; a
+    # legacy row is one sale, gone once returned
+    units = (f'CASE WHEN s.order_id IS NULL THEN 1 - {_RETURNED_SQL} '
+             f'ELSE MAX(s.quantity - {_RETURNED_UNITS_SQL}, 0) END')
+    cur.execute(
+        f'''SELECT COUNT(*) AS count,
+                  SUM(t.units) AS units,
+                  SUM(t.units = 0) AS returned,
+                  SUM(t.units * t.price) AS selling_price,
+                  SUM(t.units * t.net) AS net,
+                  SUM(t.units * (t.gross - t.net)) AS vat_amount,
+                  SUM(t.units * t.gross) AS gross,
+                  SUM(t.units * t.usd) AS selling_price_usd,
+                  SUM(CASE WHEN t.units = 0 OR t.usd IS NOT NULL THEN 0 ELSE 1 END) AS usd_missing
+             FROM (SELECT {units} AS units, s.selling_price AS price,
+                          {net} AS net, {gross} AS gross, {usd} AS usd
+                     FROM sales s
+                     LEFT JOIN customers c ON c.customer_id = s.customer_id
+                     LEFT JOIN fx_cache fx ON fx.date = s.date AND fx.from_ccy = 'USD' AND fx.to_ccy = 'TRY'
+                     {where}) t''',
+        params)
+    row = dict(cur.fetchone())
+    return {k: (v or 0) for k, v in row.items()}
+
+
+def get_sale_years(include_deleted: bool = False) -> list:
+    """Distinct sale years, newest first (read from the date index)."""
+    try:
+        with get_cursor() as (conn, cur):
+            where = '' if include_deleted else ' WHERE COALESCE(deleted, 0) = 0'
+            cur.execute(f"SELECT DISTINCT substr(date, 1, 4) FROM sales{where} ORDER BY 1 DESC")
+            return [r[0] for r in cur.fetchall() if r[0] and str(r[0]).isdigit()]
+    except Exception as e:
+        print("Error in get_sale_years:", e)
+        return []
+
+
+_SALE_INSERT_SQL = '''INSERT INTO sales (
+    date, category, subcategory, quantity, selling_price, platform, product_id,
+    customer_id, document_path, fx_to_base, selling_price_base, sale_currency,
+    vat_rate, vat_amount, is_vat_inclusive, deleted
+) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'''
+
+
+def _sale_params(row: dict) -> tuple:
+    """Normalize one sale dict (any key casing/aliases) into INSERT parameters."""
+    r = {k.lower(): v for k, v in (row or {}).items()}
+    deleted_flag = str(r.get('deleted')).lower()
+    deleted_val = 1 if deleted_flag in ('1', 'true', 'yes', 'y') else 0
+    vat_rate = float_or_none(r.get('vat_rate'))
+    vat_amount = float_or_none(r.get('vat_amount'))
+    is_vat_inclusive = r.get('is_vat_inclusive')
+    if is_vat_inclusive is None:
+        is_vat_inclusive = 1
+    else:
+        is_vat_inclusive = 1 if str(is_vat_inclusive).lower() in ('1','true','yes','y') else 0
+    return (
+        r.get('date', ''),
+        r.get('category', ''),
+        r.get('subcategory', ''),
+        float_or_none(r.get('quantity')) or 0,
+        float_or_none(r.get('sellingprice') or r.get('selling_price') or r.get('unit_price')) or 0,
+        r.get('platform', ''),
+        r.get('productid') or r.get('product_id') or '',
+        r.get('customerid') or r.get('customer_id') or '',
+        r.get('documentpath') or r.get('document_path') or r.get('doc_paths') or '',
+        float_or_none(r.get('fxtobase') or r.get('fx_to_base')),
+        float_or_none(r.get('sellingpricebase') or r.get('selling_price_base') or r.get('sellingpriceusd')),
+        (r.get('salecurrency') or r.get('sale_currency') or '').upper(),
+        vat_rate,
+        vat_amount,
+        is_vat_inclusive,
+        deleted_val
+    )
+
+
 def add_sale(row: dict) -> int:
     """Insert a sale into the sales table. Returns the new row id."""
     try:
         with get_cursor() as (conn, cur):
-            r = {k.lower(): v for k, v in (row or {}).items()}
-            deleted_flag = str(r.get('deleted')).lower()
-            deleted_val = 1 if deleted_flag in ('1', 'true', 'yes', 'y') else 0
-            vat_rate = float_or_none(r.get('vat_rate'))
-            vat_amount = float_or_none(r.get('vat_amount'))
-            is_vat_inclusive = r.get('is_vat_inclusive')
-            if is_vat_inclusive is None:
-                is_vat_inclusive = 1
-            else:
-                is_vat_inclusive = 1 if str(is_vat_inclusive).lower() in ('1','true','yes','y') else 0
-            cur.execute(
-                '''INSERT INTO sales (
-                    date, category, subcategory, quantity, selling_price, platform, product_id,
-                    customer_id, document_path, fx_to_base, selling_price_base, sale_currency,
-                    vat_rate, vat_amount, is_vat_inclusive, deleted
-                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
-                (
-                    r.get('date', ''),
-                    r.get('category', ''),
-                    r.get('subcategory', ''),
-                    float_or_none(r.get('quantity')) or 0,
-                    float_or_none(r.get('sellingprice') or r.get('selling_price') or r.get('unit_price')) or 0,
-                    r.get('platform', ''),
-                    r.get('productid') or r.get('product_id') or '',
-                    r.get('customerid') or r.get('customer_id') or '',
-                    r.get('documentpath') or r.get('document_path') or r.get('doc_paths') or '',
-                    float_or_none(r.get('fxtobase') or r.get('fx_to_base')),
-                    float_or_none(r.get('sellingpricebase') or r.get('selling_price_base') or r.get('sellingpriceusd')),
-                    (r.get('salecurrency') or r.get('sale_currency') or '').upper(),
-                    vat_rate,
-                    vat_amount,
-                    is_vat_inclusive,
-                    deleted_val
-                )
-            )
+            cur.execute(_SALE_INSERT_SQL, _sale_params(row))
             conn.commit()
             return cur.lastrowid
     except Exception as e:
@@ -70,41 +259,95 @@ def add_sale(row: dict) -> int:
         return 0
 
 
-def overwrite_sales(rows: list) -> int:
-    """Replace all sales rows with provided rows. Returns number of rows written."""
+def _insert_sales(cur, params: list) -> list[int]:
+    if not params:
+        return []
+    cur.executemany(_SALE_INSERT_SQL, params)
+    # executemany does not report row ids; the rows were written back to back
+    # under this transaction's write lock, so their AUTOINCREMENT ids are
+    # consecutive and end at last_insert_rowid().
+    cur.execute('SELECT last_insert_rowid()')
+    last = cur.fetchone()[0]
+    return list(range(last - len(params) + 1, last + 1))
+
+
+def add_sales(rows: list, conn=None, cur=None) -> list[int]:
+    """Insert many sales in one transaction. Returns the new ids in input order.
+
+    Rows are normalized like ``add_sale`` and written with a single
+    ``executemany``. Pass ``conn``/``cur`` to join the caller's transaction
+    (the caller then commits); otherwise the batch is committed here and
+    rolled back as a whole on error (returning ``[]``).
+    """
+    params = [_sale_params(r) for r in rows or []]
+    if cur is not None or conn is not None:
+        return _insert_sales(cur or conn.cursor(), params)
+    if not params:
+        return []
     try:
         with get_cursor() as (conn, cur):
-            cur.execute('DELETE FROM sales')
-            count = 0
-            for r in rows or []:
-                # inline insert instead of calling add_sale (to reuse connection)
-                rr = {k.lower(): v for k, v in (r or {}).items()}
-                deleted_flag = str(rr.get('deleted')).lower()
-                deleted_val = 1 if deleted_flag in ('1', 'true', 'yes', 'y') else 0
-                cur.execute(
-                    '''INSERT INTO sales (
-                        date, category, subcategory, quantity, selling_price, platform, product_id,
-                        customer_id, document_path, fx_to_base, selling_price_base, sale_currency, deleted
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)''',
-                    (
-                        rr.get('date', ''),
-                        rr.get('category', ''),
-                        rr.get('subcategory', ''),
-                        float_or_none(rr.get('quantity')) or 0,
-                        float_or_none(rr.get('sellingprice') or rr.get('selling_price') or rr.get('unit_price')) or 0,
-                        rr.get('platform', ''),
-                        rr.get('productid') or rr.get('product_id') or '',
-                        rr.get('customerid') or rr.get('customer_id') or '',
-                        rr.get('documentpath') or rr.get('document_path') or rr.get('doc_paths') or '',
-                        float_or_none(rr.get('fxtobase') or rr.get('fx_to_base')),
-                        float_or_none(rr.get('sellingpricebase') or rr.get('selling_price_base') or rr.get('sellingpriceusd')),
-                        (rr.get('salecurrency') or rr.get('sale_currency') or '').upper(),
-                        deleted_val
-                    )
-                )
-                count += 1
+            ids = _insert_sales(cur, params)
+            conn.commit()
+            return ids
+    except Exception as e:
+        print("Error in add_sales:", e)
+        return []
+
+
+# Columns of order lines (set by sale_orders_dao, not by _sale_params)
+_ORDER_LINE_COLUMNS = ('order_id', 'product_prefix', 'serial_from', 'serial_to', 'product_id_last')
+
+_SALE_COLUMNS = (
+    'date', 'category', 'subcategory', 'quantity', 'selling_price', 'platform', 'product_id',
+    'customer_id', 'document_path', 'fx_to_base', 'selling_price_base', 'sale_currency',
+    'vat_rate', 'vat_amount', 'is_vat_inclusive', 'deleted',
+) + _ORDER_LINE_COLUMNS
+
+
+def sync_sales(rows: list, cur=None) -> dict:
+    """Make the sales table match ``rows``, writing only what changed.
+
+    Rows are keyed by ``id`` (rows without one are inserted) and compared by
+    content hash; sales missing from ``rows`` are soft-deleted, since
+    allocations and returns still point at them. Order and serial-range
+    columns a row does not carry keep their stored values. Returns the
+    ``table_sync.sync_table`` report (row counts, audit entries, seconds).
+    """
+    if cur is None:
+        with get_cursor() as (conn, c):
+            out = sync_sales(rows, c)
             conn.commit()
-            return count
+            return out
+    from .table_sync import sync_table
+    rows = [r or {} for r in rows or []]
+    stored: dict = {}
+    ids = [r['id'] for r in rows if r.get('id') not in (None, '')]
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        cur.execute(f"SELECT id, {', '.join(_ORDER_LINE_COLUMNS)} FROM sales "
+                    f"WHERE id IN ({','.join('?' * len(part))})", part)
+        stored.update({r['id']: dict(r) for r in cur.fetchall()})
+    desired = []
+    for r in rows:
+        values = dict(zip(_SALE_COLUMNS, _sale_params(r)))
+        # NOT NULL columns fall back to their schema defaults
+        if values['vat_rate'] is None:
+            values['vat_rate'] = 18.0
+        if values['vat_amount'] is None:
+            values['vat_amount'] = 0.0
+        values['id'] = r.get('id')
+        keep = stored.get(values['id']) or {}
+        for c in _ORDER_LINE_COLUMNS:
+            values[c] = r[c] if c in r else keep.get(c)
+        desired.append(values)
+    return sync_table('sales', 'id', _SALE_COLUMNS, desired, audit_entity='sale', cur=cur,
+                      soft_delete='deleted')
+
+
+def overwrite_sales(rows: list) -> int:
+    """Make the sales table match ``rows`` (see ``sync_sales``). Returns the number of rows given."""
+    try:
+        return sync_sales(rows)['rows']
     except Exception as e:
         print("Error in overwrite_sales:", e)
         return 0
@@ -174,7 +417,11 @@ def mark_sale_deleted(ids: list[int]) -> int:
 
 
 def update_sale(sale_id: int, changes: dict) -> bool:
-    """Update fields on a sale row. `changes` keys should be DB column names (snake_case)."""
+    """Update fields on a sale row. `changes` keys should be DB column names (snake_case).
+
+    The quantity and product ID of an order line cannot change (its serial
+    range and batch allocations depend on them); such an update returns False.
+    """
     if not sale_id or not changes:
         return False
 
@@ -195,6 +442,14 @@ def update_sale(sale_id: int, changes: dict) -> bool:
 
     try:
         with get_cursor() as (conn, cur):
+            if 'quantity' in changes or 'product_id' in changes:
+                cur.execute('SELECT order_id, quantity, product_id FROM sales WHERE id=?', (sale_id,))
+                row = cur.fetchone()
+                if row is not None and row['order_id'] is not None and (
+                        float_or_none(changes.get('quantity', row['quantity'])) != float(row['quantity'] or 0)
+                        or str(changes.get('product_id', row['product_id']) or '') != str(row['product_id'] or '')):
+                    print("Error in update_sale: the quantity and product ID of an order line cannot be changed")
+                    return False
             sql = f"UPDATE sales SET {', '.join(sets)} WHERE id=?"
             cur.execute(sql, tuple(params))
             conn.commit()
@@ -226,6 +226,8 @@ def init_db_schema(conn):
         created_at TEXT DEFAULT CURRENT_TIMESTAMP
     )
     ''')
+    add_column_if_missing(cur, 'users', 'hash_params TEXT')
+
 
     cur.execute('''
     CREATE TABLE IF NOT EXISTS audit_log (
@@ -238,6 +240,20 @@ def init_db_schema(conn):
         details TEXT
     )
     ''')
+    # Hash chain: sha256 over the previous row's hash and this row's fields
+    add_column_if_missing(cur, 'audit_log', 'row_hash TEXT')
+    # Signed (HMAC) markers of how far the chain has been verified
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS audit_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        last_id INTEGER NOT NULL,
+        last_hash TEXT NOT NULL,
+        verified_rows INTEGER NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        key_id TEXT,
+        signature TEXT
+    )
+    ''')
 
     cur.execute('''
     CREATE TABLE IF NOT EXISTS inventory (
@@ -279,6 +295,85 @@ def init_db_schema(conn):
     )
     ''')
 
+    # Blind index over encrypted notes: keyed hashes of normalized words, so
+    # keyword search is an indexed lookup instead of decrypting every row
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS note_tokens (
+        token TEXT NOT NULL,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        PRIMARY KEY (token, entity, entity_id)
+    ) WITHOUT ROWID
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_note_tokens_entity ON note_tokens(entity, entity_id)')
+
+    # Sale orders: one header per sale, with `sales` rows as its lines. A line
+    # covers `quantity` units whose product IDs are product_prefix followed by
+    # each serial in serial_from..serial_to (materialized only on demand).
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS sale_orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        customer_id TEXT,
+        platform TEXT,
+        sale_currency TEXT,
+        fx_to_base REAL,
+        document_path TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    add_column_if_missing(cur, 'sales', 'order_id INTEGER')
+    add_column_if_missing(cur, 'sales', 'product_prefix TEXT')
+    add_column_if_missing(cur, 'sales', 'serial_from INTEGER')
+    add_column_if_missing(cur, 'sales', 'serial_to INTEGER')
+    add_column_if_missing(cur, 'sales', 'product_id_last TEXT')
+    add_column_if_missing(cur, 'sale_batch_allocations', 'order_line_id INTEGER')
+    add_column_if_missing(cur, 'returns', 'sale_id INTEGER')
+
+    # Return ledger: the allocation rows (and quantities) each return reversed.
+    # Restocking moves exactly these quantities; analytics read their costs.
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS return_allocations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        return_id INTEGER NOT NULL,
+        allocation_id INTEGER NOT NULL,
+        batch_id INTEGER,
+        quantity REAL NOT NULL,
+        unit_cost REAL,
+        unit_sale_price REAL,
+        FOREIGN KEY (return_id) REFERENCES returns(id) ON DELETE CASCADE
+    )
+    ''')
+    add_column_if_missing(cur, 'returns', 'quantity REAL DEFAULT 1')
+    add_column_if_missing(cur, 'returns', 'ledger_built INTEGER DEFAULT 0')
+
+    # Inventory is an aggregate of import_batches (see inventory_dao)
+    add_column_if_missing(cur, 'inventory', 'allocated REAL DEFAULT 0')
+    add_column_if_missing(cur, 'inventory', 'value_at_cost REAL DEFAULT 0')
+
+    # Point-in-time inventory: per-batch stock at a date (see inventory_snapshots)
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        as_of TEXT NOT NULL UNIQUE,
+        kind TEXT DEFAULT 'manual',
+        created_at TEXT,
+        batches INTEGER DEFAULT 0,
+        on_hand REAL DEFAULT 0,
+        value_at_cost REAL DEFAULT 0
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_snapshot_batches (
+        snapshot_id INTEGER NOT NULL,
+        batch_id INTEGER NOT NULL,
+        on_hand REAL NOT NULL,
+        unit_cost REAL,
+        PRIMARY KEY (snapshot_id, batch_id),
+        FOREIGN KEY (snapshot_id) REFERENCES inventory_snapshots(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    ''')
+
     # --- INDEXES ---
     cur.execute('CREATE INDEX IF NOT EXISTS idx_import_batches_category ON import_batches(category, subcategory)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_import_batches_date ON import_batches(batch_date)')
@@ -286,8 +381,20 @@ def init_db_schema(conn):
     cur.execute('CREATE INDEX IF NOT EXISTS idx_sale_allocations_batch ON sale_batch_allocations(batch_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_product ON sales(product_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_id, date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_order ON sales(order_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_serial ON sales(product_prefix, serial_from)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sale_allocations_line ON sale_batch_allocations(order_line_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sale_allocations_date ON sale_batch_allocations(sale_date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_returns_sale ON returns(sale_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_return_allocations_return ON return_allocations(return_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_return_allocations_alloc ON return_allocations(allocation_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_returns_date ON returns(return_date)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_returns_product ON returns(product_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_log(ts)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_audit_user_ts ON audit_log(user, ts)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_audit_entity_ref ON audit_log(entity, ref_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_audit_action_ts ON audit_log(action, ts)')
 
     # --- VIEWS ---
     cur.execute("CREATE VIEW IF NOT EXISTS active_sales AS SELECT * FROM sales WHERE (deleted IS NULL OR deleted=0) AND (voided IS NULL OR voided=0)")
@@ -344,4 +451,51 @@ def init_db_schema(conn):
     END;
     ''')
 
+    from .inventory_dao import create_inventory_triggers
+    create_inventory_triggers(cur)
+
+    _create_audit_fts(cur)
+    from .text_search import create_search_indexes
+    create_search_indexes(cur)
+
     conn.commit()
+
+
+def _create_audit_fts(cur):
+    """Full-text index over audit_log.details/ref_id, kept in sync by triggers.
+
+    Skipped when SQLite lacks FTS5 (callers fall back to LIKE). On a database
+    that already has audit rows the index starts empty and is only used once
+    ``db.audit.rebuild_audit_fts()`` has backfilled it.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name='audit_fts'")
+    if cur.fetchone():
+        return
+    try:
+        cur.execute('''
+        CREATE VIRTUAL TABLE audit_fts USING fts5(
+            details, ref_id, content='audit_log', content_rowid='id'
+        )
+        ''')
+    except Exception:
+        # FTS5 not compiled into this SQLite
+        return
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_fts_ai AFTER INSERT ON audit_log BEGIN
+        INSERT INTO audit_fts(rowid, details, ref_id) VALUES (new.id, new.details, new.ref_id);
+    END;
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_fts_ad AFTER DELETE ON audit_log BEGIN
+        INSERT INTO audit_fts(audit_fts, rowid, details, ref_id) VALUES ('delete', old.id, old.details, old.ref_id);
+    END;
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_fts_au AFTER UPDATE OF details, ref_id ON audit_log BEGIN
+        INSERT INTO audit_fts(audit_fts, rowid, details, ref_id) VALUES ('delete', old.id, old.details, old.ref_id);
+        INSERT INTO audit_fts(rowid, details, ref_id) VALUES (new.id, new.details, new.ref_id);
+    END;
+    ''')
+    cur.execute('SELECT EXISTS(SELECT 1 FROM audit_log)')
+    if not cur.fetchone()[0]:
+        cur.execute("INSERT OR REPLACE INTO settings(key, value) VALUES ('audit_fts_ready', '1')")
@@ -0,0 +1,151 @@
+"""table_sync.py - write a desired set of rows as a keyed delta.
+
+``sync_table`` compares the desired rows with the current table contents by
+primary key and a content hash of the synced columns, then applies only the
+difference (``executemany`` INSERT / UPDATE / DELETE) in one transaction,
+with one audit entry per changed row. Rewriting a table of N rows where one
+changed therefore costs one UPDATE instead of N deletes and N inserts.
+
+Columns not listed in ``columns`` are never touched, so fields the caller
+does not know about (soft-delete metadata, void flags) survive a sync.
+Tables whose rows are referenced elsewhere pass ``soft_delete`` so rows
+missing from the desired set are flagged instead of deleted.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .connection import get_cursor
+
+
+def row_hash(values: Sequence) -> str:
+    """Content hash of a row's synced values (type-normalized, order-sensitive)."""
+    parts = []
+    for v in values:
+        if v is None:
+            parts.append('\x00')
+        elif isinstance(v, float) and v.is_integer():
+            parts.append(str(int(v)))
+        else:
+            parts.append(str(v))
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _chunks(seq: list, size: int = 500):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def sync_table(table: str, key: str, columns: Sequence[str], rows: Iterable[dict],
+               scope_keys: Optional[Iterable] = None, audit_entity: Optional[str] = None,
+               cur=None, soft_delete: Optional[str] = None) -> Dict[str, object]:
+    """Make ``table`` hold exactly ``rows`` (within the scope) by applying a keyed delta.
+
+    Args:
+        table: Table name.
+        key: Primary-key column. Desired rows without a key value are inserted
+            (the table assigns the key).
+        columns: Columns to compare and write (the key excluded).
+        rows: Desired rows as dicts holding ``key`` and ``columns``.
+        scope_keys: Limit the comparison to these keys; rows outside the
+            scope are left alone. Default: the whole table, so current rows
+            missing from ``rows`` are deleted.
+        audit_entity: Entity name for audit entries (default: ``table``).
+        cur: Optional cursor of the caller's transaction (the caller commits).
+        soft_delete: Flag column (e.g. ``deleted``); when given, current rows
+            missing from ``rows`` get it set to 1 instead of being deleted
+            (rows already flagged are left alone).
+
+    Returns:
+        Dict with ``rows`` (desired row count), ``inserted``, ``updated``,
+        ``deleted``, ``unchanged``, ``audit_entries`` and ``seconds``.
+    """
+    if cur is None:
+        with get_cursor() as (conn, c):
+            out = sync_table(table, key, columns, rows, scope_keys, audit_entity, cur=c,
+                             soft_delete=soft_delete)
+            conn.commit()
+            return out
+
+    from .audit import write_audit
+    t0 = time.perf_counter()
+    columns = [c for c in columns if c != key]
+    entity = audit_entity or table
+    select = f"SELECT {key}, {', '.join(columns)} FROM {table}"
+    current: Dict[object, str] = {}
+    if scope_keys is None:
+        cur.execute(select)
+        current = {r[0]: row_hash(tuple(r)[1:]) for r in cur.fetchall()}
+    else:
+        for part in _chunks(list(scope_keys)):
+            cur.execute(f"{select} WHERE {key} IN ({','.join('?' * len(part))})", part)
+            current.update({r[0]: row_hash(tuple(r)[1:]) for r in cur.fetchall()})
+
+    inserts: List[tuple] = []
+    keyed_inserts: List[tuple] = []
+    updates: List[tuple] = []
+    desired_keys = set()
+    count = 0
+    for r in rows:
+        count += 1
+        values = tuple(r.get(c) for c in columns)
+        k = r.get(key)
+        if k in (None, ''):
+            inserts.append(values)
+            continue
+        desired_keys.add(k)
+        if k not in current:
+            keyed_inserts.append((k, *values))
+        elif current[k] != row_hash(values):
+            updates.append((*values, k))
+    deletes = [(k,) for k in current if k not in desired_keys]
+    if deletes and soft_delete:
+        live = []
+        for part in _chunks([k for (k,) in deletes]):
+            cur.execute(f"SELECT {key} FROM {table} WHERE COALESCE({soft_delete}, 0) = 0 "
+                        f"AND {key} IN ({','.join('?' * len(part))})", part)
+            live.extend((r[0],) for r in cur.fetchall())
+        deletes = live
+
+    if deletes:
+        if soft_delete:
+            cur.executemany(f'UPDATE {table} SET {soft_delete}=1 WHERE {key}=?', deletes)
+        else:
+            cur.executemany(f'DELETE FROM {table} WHERE {key}=?', deletes)
+    if updates:
+        cur.executemany(f"UPDATE {table} SET {', '.join(f'{c}=?' for c in columns)} WHERE {key}=?", updates)
+    if keyed_inserts:
+        cur.executemany(f"INSERT INTO {table}({key}, {', '.join(columns)}) "
+                        f"VALUES ({','.join('?' * (len(columns) + 1))})", keyed_inserts)
+    new_keys: List[object] = []
+    if inserts:
+        cur.executemany(f"INSERT INTO {table}({', '.join(columns)}) VALUES ({','.join('?' * len(columns))})",
+                        inserts)
+        # consecutive AUTOINCREMENT ids under this transaction's write lock
+        cur.execute('SELECT last_insert_rowid()')
+        last = cur.fetchone()[0]
+        new_keys = list(range(last - len(inserts) + 1, last + 1))
+
+    audit = 0
+    for (k,) in deletes:
+        write_audit('soft_delete' if soft_delete else 'delete', entity, str(k), 'sync', cur=cur)
+        audit += 1
+    for values in updates:
+        write_audit('edit', entity, str(values[-1]), 'sync', cur=cur)
+        audit += 1
+    for k in [kv[0] for kv in keyed_inserts] + new_keys:
+        write_audit('add', entity, str(k), 'sync', cur=cur)
+        audit += 1
+
+    return {
+        'rows': count,
+        'inserted': len(inserts) + len(keyed_inserts),
+        'updated': len(updates),
+        'deleted': len(deletes),
+        'unchanged': len(desired_keys) - len(updates) - len(keyed_inserts),
+        'audit_entries': audit,
+        'seconds': round(time.perf_counter() - t0, 3),
+    }
@@ -0,0 +1,213 @@
+"""text_search.py - FTS5 keyword search over sales, returns, imports and expenses.
+
+Each entity has an FTS5 table (``sales_fts``, ...) holding copies of its
+searchable text columns, keyed by the entity's id and kept in sync by
+triggers. ``search(entity, query)`` turns the query into prefix terms and
+returns matching ids ranked by relevance. ``search_matches`` combines it with
+the note index for the list views, which still scan the columns FTS does not
+cover (ids, amounts, mid-word substrings) for the remaining rows.
+
+Encrypted notes are not indexed here (see ``note_index``). On a database
+that already has rows an index starts empty and ``search`` returns None
+until ``rebuild_search_index`` has backfilled it; callers then fall back to
+scanning.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .connection import get_cursor
+from .utils import fts_match_query
+
+# entity -> (table, fts table, [(fts column, SQL expression over the row alias {r})])
+SEARCH_INDEXES: Dict[str, Tuple[str, str, List[Tuple[str, str]]]] = {
+    'sale': ('sales', 'sales_fts', [
+        ('product_id', '{r}.product_id'),
+        ('category', '{r}.category'),
+        ('subcategory', '{r}.subcategory'),
+        ('platform', '{r}.platform'),
+        ('customer', "{r}.customer_id || ' ' || COALESCE((SELECT name FROM customers WHERE customer_id = {r}.customer_id), '')"),
+        ('date', '{r}.date'),
+    ]),
+    'return': ('returns', 'returns_fts', [
+        ('product_id', '{r}.product_id'),
+        ('category', '{r}.category'),
+        ('subcategory', '{r}.subcategory'),
+        ('platform', '{r}.platform'),
+        ('reason', '{r}.reason'),
+        ('date', '{r}.return_date'),
+    ]),
+    'import': ('imports', 'imports_fts', [
+        ('supplier', '{r}.supplier'),
+        ('category', '{r}.category'),
+        ('subcategory', '{r}.subcategory'),
+        ('currency', '{r}.currency'),
+        ('date', '{r}.date'),
+    ]),
+    'expense': ('expenses', 'expenses_fts', [
+        ('category', '{r}.category'),
+        ('currency', '{r}.currency'),
+        ('date', '{r}.date'),
+    ]),
+}
+
+_READY_KEY = 'search_fts_ready:{entity}'
+_rebuild_lock = threading.Lock()
+
+
+def _table_exists(cur, name: str) -> bool:
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+    return cur.fetchone() is not None
+
+
+def _insert_sql(fts: str, columns, alias: str) -> str:
+    names = ', '.join(c for c, _ in columns)
+    exprs = ', '.join(e.format(r=alias) for _, e in columns)
+    return f'INSERT INTO {fts}(rowid, {names}) SELECT {alias}.id, {exprs}'
+
+
+def create_search_indexes(cur) -> None:
+    """Create the FTS tables and sync triggers (called from ``init_db_schema``).
+
+    Entities whose base table does not exist yet, or SQLite builds without
+    FTS5, are skipped; the next schema init picks them up.
+    """
+    for entity, (table, fts, columns) in SEARCH_INDEXES.items():
+        if _table_exists(cur, fts) or not _table_exists(cur, table):
+            continue
+        try:
+            cur.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(c for c, _ in columns)})")
+        except sqlite3.OperationalError:
+            # FTS5 not compiled into this SQLite
+            return
+        # base-table columns the index reads; other updates leave it alone
+        watched = sorted({m for _, e in columns for m in re.findall(r'\{r\}\.(\w+)', e)})
+        cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_ai AFTER INSERT ON {table} BEGIN
+            {_insert_sql(fts, columns, 'new')};
+        END;
+        ''')
+        cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_ad AFTER DELETE ON {table} BEGIN
+            DELETE FROM {fts} WHERE rowid = old.id;
+        END;
+        ''')
+        cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_au AFTER UPDATE OF {', '.join(watched)} ON {table} BEGIN
+            DELETE FROM {fts} WHERE rowid = old.id;
+            {_insert_sql(fts, columns, 'new')};
+        END;
+        ''')
+        if table == 'sales':
+            # Sales are searchable by customer name, which lives in customers
+            for event in ('INSERT', 'UPDATE OF name'):
+                suffix = 'ai' if event == 'INSERT' else 'au'
+                cur.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_customers_sales_fts_{suffix} AFTER {event} ON customers BEGIN
+                    UPDATE sales_fts SET customer = new.customer_id || ' ' || COALESCE(new.name, '')
+                    WHERE rowid IN (SELECT id FROM sales WHERE customer_id = new.customer_id);
+                END;
+                ''')
+        cur.execute(f'SELECT EXISTS(SELECT 1 FROM {table})')
+        if not cur.fetchone()[0]:
+            cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)',
+                        (_READY_KEY.format(entity=entity), '1'))
+
+
+def search_available(entity: str) -> bool:
+    """True if ``entity`` has a backfilled FTS index."""
+    if entity not in SEARCH_INDEXES:
+        return False
+    try:
+        with get_cursor() as (conn, cur):
+            if not _table_exists(cur, SEARCH_INDEXES[entity][1]):
+                return False
+            cur.execute('SELECT value FROM settings WHERE key=?', (_READY_KEY.format(entity=entity),))
+            row = cur.fetchone()
+        return bool(row and row[0] == '1')
+    except Exception:
+        return False
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 MATCH expression for ``query`` (every word as a prefix term), or None."""
+    return fts_match_query(query)
+
+
+def search(entity: str, query: str, limit: Optional[int] = 200) -> Optional[List[int]]:
+    """Ids of ``entity`` rows matching every word of ``query``, best match first.
+
+    Words match as prefixes across the indexed columns (case and accent
+    insensitive). ``limit=None`` returns every match. Returns None when the
+    index cannot answer (FTS5 missing or not backfilled yet, or no words in
+    the query); callers should then fall back to scanning.
+    """
+    expr = match_expression(query)
+    if expr is None or not search_available(entity):
+        return None
+    fts = SEARCH_INDEXES[entity][1]
+    sql = f'SELECT rowid FROM {fts} WHERE {fts} MATCH ? ORDER BY rank'
+    params: tuple = (expr,)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params = (expr, int(limit))
+    try:
+        with get_cursor() as (conn, cur):
+            cur.execute(sql, params)
+            return [r[0] for r in cur.fetchall()]
+    except sqlite3.OperationalError:
+        return None
+
+
+def search_matches(entity: str, query: str) -> Tuple[Optional[Set[int]], Set[int]]:
+    """``(note_ids, hits)`` for a list view's search box.
+
+    ``note_ids`` are the rows whose encrypted notes match (``note_index``),
+    or None when the view must decrypt and scan notes itself. ``hits`` are
+    the rows matched by FTS or the note index; a row not in ``hits`` can
+    still match on a column the indexes leave out, so views scan those.
+    """
+    from .note_index import search_note_ids
+    if not query:
+        return None, set()
+    try:
+        note_ids = search_note_ids(entity, query)
+    except Exception:
+        note_ids = None
+    try:
+        ids = search(entity, query, limit=None)
+    except Exception:
+        ids = None
+    return note_ids, set(ids or ()) | (note_ids or set())
+
+
+def rebuild_search_index(entities: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Re-create the FTS rows of each entity from its base table (one statement each).
+
+    Returns the number of rows indexed per entity.
+    """
+    stats: Dict[str, int] = {}
+    with _rebuild_lock, get_cursor() as (conn, cur):
+        for entity in (entities or SEARCH_INDEXES):
+            table, fts, columns = SEARCH_INDEXES[entity]
+            if not _table_exists(cur, fts):
+                continue
+            cur.execute(f'DELETE FROM {fts}')
+            cur.execute(_insert_sql(fts, columns, 't') + f' FROM {table} t')
+            stats[entity] = cur.rowcount
+            cur.execute('INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)',
+                        (_READY_KEY.format(entity=entity), '1'))
+            conn.commit()
+    return stats
+
+
+def ensure_search_index() -> Dict[str, int]:
+    """Backfill any entity index that exists but has not been built yet."""
+    pending = [e for e in SEARCH_INDEXES if not search_available(e)]
+    with get_cursor() as (conn, cur):
+        pending = [e for e in pending if _table_exists(cur, SEARCH_INDEXES[e][1])]
+    return rebuild_search_index(pending) if pending else {}
@@ -1,5 +1,19 @@
+import re
+from typing import Optional
+
 from .connection import DB_PATH, get_conn, get_cursor
 
+_WORD_RE = re.compile(r"\w+")
+
+
+def fts_match_query(q: str) -> Optional[str]:
+    """Every word of ``q`` as a quoted prefix term, ANDed (``"inv"* AND "001"*``); None without words."""
+    words = _WORD_RE.findall(q or '')
+    if not words:
+        return None
+    return ' AND '.join(f'"{w}"*' for w in words)
+
+
 def float_or_none(v):
     try:
         return float(v)
@@ -20,6 +34,7 @@ def reset_all_tables(clear_product_codes=True):
         cur.execute('DELETE FROM imports')
         cur.execute('DELETE FROM inventory')
         cur.execute('DELETE FROM expenses')
+        cur.execute('DELETE FROM note_tokens')
         if clear_product_codes:
             cur.execute('DELETE FROM product_codes')
         conn.commit()
@@ -33,6 +33,11 @@ def safe_shutdown(root):
     if app_exiting:
         return
     app_exiting = True
+    try:
+        # Don't lose audit entries still buffered by the background writer
+        db.flush_audit()
+    except Exception:
+        pass
     try:
         root.destroy()
     except Exception:
@@ -40,6 +45,26 @@ def safe_shutdown(root):
 
 def main():
     db.init_db()
+    try:
+        # Map the compact FX series so rate lookups avoid per-call SQLite queries
+        import core.fx_series as fx_series
+        fx_series.load()
+    except Exception:
+        pass
+    try:
+        # Build the blind note index in the background on first run / after a key change
+        import threading
+        threading.Thread(target=db.ensure_note_index, daemon=True).start()
+        # Backfill the keyword search indexes on databases created before they existed
+        threading.Thread(target=db.ensure_search_index, daemon=True).start()
+        # Link returns recorded before the return ledger to the allocations they reversed
+        threading.Thread(target=db.ensure_return_ledger, daemon=True).start()
+        # Take any missing month-end inventory snapshots (point-in-time valuation)
+        threading.Thread(target=db.ensure_periodic_snapshots, daemon=True).start()
+        # Apply the audit retention policy (no-op unless audit_retention_months is set)
+        threading.Thread(target=db.archive_audit_logs, daemon=True).start()
+    except Exception:
+        pass
     root = tk.Tk()
     root.title("Product Tracker")
     root.geometry("980x720")
@@ -0,0 +1,50 @@
+# bench_audit.py
+# Run with: python scripts/bench_audit.py [count]
+#
+# Compares one-connection-per-entry audit writes (sync=True, the old path)
+# with the buffered background writer on a temporary database. The sync path
+# is timed on a sample and extrapolated, since it commits once per entry.
+
+import sys
+import os
+import time
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+
+
+def _count():
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT COUNT(*) FROM audit_log')
+        return cur.fetchone()[0]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+    print(f"{n} audit entries\n")
+
+    sample = min(n, 2_000)
+    t0 = time.perf_counter()
+    for i in range(sample):
+        db.write_audit('edit', 'sale', str(i), f"bench sync #{i}", sync=True)
+    sync_s = time.perf_counter() - t0
+    print(f"{'sync (commit per entry)':<28} {sync_s / sample * 1e6:8.1f} us/entry  ~{sync_s / sample * n:7.2f}s for {n}")
+
+    before = _count()
+    t0 = time.perf_counter()
+    for i in range(n):
+        db.write_audit('edit', 'sale', str(i), f"bench async #{i}")
+    enqueue_s = time.perf_counter() - t0
+    db.flush_audit()
+    total_s = time.perf_counter() - t0
+    print(f"{'buffered (enqueue)':<28} {enqueue_s / n * 1e6:8.1f} us/entry   {enqueue_s:7.2f}s")
+    print(f"{'buffered (incl. flush)':<28} {total_s / n * 1e6:8.1f} us/entry   {total_s:7.2f}s")
+    assert _count() - before == n, "buffered writer lost entries"
+
+
+if __name__ == "__main__":
+    main()
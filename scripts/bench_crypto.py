@@ -0,0 +1,39 @@
+# bench_crypto.py
+# Run with: python scripts/bench_crypto.py [count]
+#
+# Compares per-value Fernet construction (the old behaviour) with the cached
+# cipher and the thread-pooled decrypt_many/encrypt_many on encrypted notes.
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cryptography.fernet import Fernet  # type: ignore
+import core.crypto_utils as crypto_utils
+
+
+def _timed(label, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    print(f"{label:<32} {time.perf_counter() - t0:8.3f}s")
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    if not os.environ.get('TRACKING_APP_SECRET_KEY'):
+        os.environ['TRACKING_APP_SECRET_KEY'] = Fernet.generate_key().decode('utf-8')
+    key = crypto_utils._get_key()
+    notes = [f"Import note #{i}: shipment via carrier, invoice INV-{i:06d}" for i in range(n)]
+    print(f"{n} notes, {os.cpu_count()} CPU(s)\n")
+
+    tokens = _timed('encrypt (new Fernet per value)', lambda: [Fernet(key).encrypt(s.encode()).decode() for s in notes])
+    _timed('decrypt (new Fernet per value)', lambda: [Fernet(key).decrypt(t.encode()).decode() for t in tokens])
+    _timed('decrypt_str (cached cipher)', lambda: [crypto_utils.decrypt_str(t) for t in tokens])
+    out = _timed('decrypt_many', lambda: crypto_utils.decrypt_many(tokens))
+    _timed('encrypt_many', lambda: crypto_utils.encrypt_many(notes))
+    assert out == notes, "round-trip mismatch"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# bench_password_hash.py
+# Run with: python scripts/bench_password_hash.py [--target-ms 250] [--scheme scrypt|pbkdf2] [--save]
+#
+# Times the supported password hash settings on this machine and picks the
+# parameters that hit the target login latency. With --save the choice is
+# stored in settings; existing users are re-hashed on their next login.
+
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.auth as auth
+
+
+def _time(params, rounds=3):
+    salt = os.urandom(16)
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        auth.hash_password('benchmark-password', salt, params)
+        ms = (time.perf_counter() - t0) * 1000.0
+        best = ms if best is None else min(best, ms)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Calibrate password hashing for a target latency.')
+    ap.add_argument('--target-ms', type=float, default=250.0)
+    ap.add_argument('--scheme', choices=['scrypt', 'pbkdf2'], default='scrypt')
+    ap.add_argument('--save', action='store_true', help='store the calibrated parameters in settings')
+    args = ap.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s)\n")
+    for params in (auth.LEGACY_HASH_PARAMS, 'pbkdf2_sha256$600000',
+                   'scrypt$16384$8$1', 'scrypt$32768$8$1', 'scrypt$65536$8$1'):
+        try:
+            print(f"{params:<24} {_time(params):8.1f} ms")
+        except Exception as e:
+            print(f"{params:<24} unavailable ({e})")
+
+    choice = db.calibrate_hash_params(args.target_ms, scheme='scrypt' if args.scheme == 'scrypt' else 'pbkdf2')
+    print(f"\nTarget {args.target_ms:.0f} ms -> {choice['params']} ({choice['ms']} ms)")
+    if args.save:
+        db.init_db().close()
+        db.set_setting('password_hash_params', choice['params'])
+        print("Saved; users are re-hashed on their next login.")
+
+
+if __name__ == "__main__":
+    main()
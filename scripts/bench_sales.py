@@ -0,0 +1,56 @@
+# bench_sales.py
+# Run with: python scripts/bench_sales.py [sizes...]   (default: 10 1000 100000)
+#
+# Compares one add_sale call per unit (a connection and commit per row, the
+# old save_sale path) with a single add_sales batch on a temporary database.
+# For large sizes the per-row path is timed on a sample and extrapolated.
+
+import sys
+import os
+import time
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+
+
+def _rows(n, tag):
+    return [{
+        'date': '2024-05-01', 'category': 'Bench', 'subcategory': tag, 'quantity': 1,
+        'selling_price': 100.0, 'platform': 'BENCH', 'product_id': f'{tag}-{i:06d}',
+        'customer_id': 'C1', 'fx_to_base': 1.0, 'selling_price_base': 100.0,
+        'sale_currency': 'TRY', 'vat_rate': 20, 'vat_amount': 16.67, 'is_vat_inclusive': 1,
+    } for i in range(n)]
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 1_000, 100_000]
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+    print(f"{'rows':>8} {'add_sale x n':>16} {'add_sales':>12} {'speedup':>8}")
+
+    for n in sizes:
+        sample = min(n, 1_000)
+        rows = _rows(sample, f'one{n}')
+        t0 = time.perf_counter()
+        for r in rows:
+            db.add_sale(r)
+        single_s = (time.perf_counter() - t0) / sample * n
+
+        rows = _rows(n, f'many{n}')
+        t0 = time.perf_counter()
+        ids = db.add_sales(rows)
+        batch_s = time.perf_counter() - t0
+        assert len(ids) == n, "add_sales did not return one id per row"
+        with db.get_cursor() as (conn, cur):
+            cur.execute('SELECT id, product_id FROM sales WHERE subcategory=? ORDER BY id', (f'many{n}',))
+            stored = [(r[0], r[1]) for r in cur.fetchall()]
+        assert stored == [(i, r['product_id']) for i, r in zip(ids, rows)], "ids out of order"
+
+        est = '~' if sample < n else ' '
+        print(f"{n:>8} {est}{single_s:14.3f}s {batch_s:11.3f}s {single_s / batch_s:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
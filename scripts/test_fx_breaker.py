@@ -0,0 +1,100 @@
+# test_fx_breaker.py
+# Run with: python scripts/test_fx_breaker.py
+#
+# Simulates an FX API outage with a local stub server and checks that the
+# circuit breaker opens, fails fast, and recovers through a single probe.
+
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+import core.fx_rates as fx_rates
+import core.fx_breaker as fx_breaker
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        _StubHandler.hits += 1
+        u = urlparse(self.path)
+        to_ccy = (parse_qs(u.query).get('to') or ['GBP'])[0]
+        body = json.dumps({'date': u.path.strip('/'), 'rates': {to_ccy: 0.85}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_stub(port=0):
+    srv = ThreadingHTTPServer(('127.0.0.1', port), _StubHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def test_breaker_opens_and_fails_fast():
+    print("\n[TEST] Breaker opens after consecutive failures")
+    srv = _start_stub()
+    port = srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()  # nothing listens on the port now: connection refused
+    fx_rates.FRANKFURTER_HOST = f'127.0.0.1:{port}'
+    fx_breaker.BREAKER = fx_breaker.CircuitBreaker(failure_threshold=3, cool_down=0.5)
+
+    for day in ('2025-01-06', '2025-01-07', '2025-01-08'):
+        assert db._get_rate_generic(day, 'EUR', 'GBP') is None
+    assert fx_breaker.BREAKER.state == fx_breaker.OPEN, "Breaker should be open"
+
+    t0 = time.perf_counter()
+    for i in range(100):
+        assert db.convert_amount('2025-02-%02d' % (i % 28 + 1), 10.0, 'EUR', 'GBP') is None
+    elapsed = time.perf_counter() - t0
+    assert elapsed < 1.0, f"Open breaker should fail fast (took {elapsed:.2f}s)"
+    return port
+
+
+def test_half_open_single_probe(port):
+    print("\n[TEST] Half-open state lets one probe through and closes on success")
+    srv = _start_stub(port)
+    try:
+        time.sleep(0.6)
+        assert fx_breaker.BREAKER.state == fx_breaker.HALF_OPEN
+        assert fx_breaker.BREAKER.allow_request() is True, "First caller should be the probe"
+        assert fx_breaker.BREAKER.allow_request() is False, "Only one probe at a time"
+        fx_breaker.BREAKER.record_failure('simulated')
+        assert fx_breaker.BREAKER.state == fx_breaker.OPEN, "Failed probe re-opens the breaker"
+
+        time.sleep(0.6)
+        _StubHandler.hits = 0
+        rate = db._get_rate_generic('2025-01-09', 'EUR', 'GBP')
+        assert rate == 0.85, f"Probe should fetch from the stub, got {rate}"
+        assert fx_breaker.BREAKER.state == fx_breaker.CLOSED, "Successful probe closes the breaker"
+        assert _StubHandler.hits >= 1
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def main():
+    # Keep the stubbed rates out of the real database
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+
+    port = test_breaker_opens_and_fails_fast()
+    test_half_open_single_probe(port)
+    print("\nAll FX breaker tests passed!")
+
+
+if __name__ == "__main__":
+    main()
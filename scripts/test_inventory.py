@@ -0,0 +1,153 @@
+# test_inventory.py
+# Run with: python scripts/test_inventory.py
+#
+# Checks the trigger-maintained inventory table against a full
+# rebuild_inventory after each kind of stock movement, and point-in-time
+# stock (get_inventory_as_of) against live stock, on a throwaway database.
+
+import sys
+import os
+import tempfile
+from datetime import date
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+import db.imports_dao
+
+
+def _add_batch(date, unit_cost, quantity, category='Cat', subcategory='Sub'):
+    base = db.get_base_currency()
+    with db.get_cursor() as (conn, cur):
+        cur.execute('INSERT INTO imports (date, ordered_price, quantity, category, subcategory, currency) '
+                    'VALUES (?,?,?,?,?,?)', (date, unit_cost, quantity, category, subcategory, base))
+        import_id = cur.lastrowid
+        db.create_import_batch(import_id, date, category, subcategory, quantity, unit_cost, 'Supplier',
+                               currency=base, fx_to_base=1.0, unit_cost_base=unit_cost,
+                               unit_cost_orig=unit_cost, cur=cur)
+        return import_id
+
+
+def _sell(date, quantity, price=20.0):
+    header = {'date': date, 'customer_id': 'C1', 'platform': 'Shop',
+              'sale_currency': db.get_base_currency(), 'fx_to_base': 1.0}
+    line = {'category': 'Cat', 'subcategory': 'Sub', 'quantity': quantity, 'selling_price': price,
+            'selling_price_base': price, 'vat_rate': 20, 'vat_amount': 0.0, 'is_vat_inclusive': 1}
+    return db.create_sale_order(header, [line])['lines'][0]
+
+
+def _batch_sql(sql, params=()):
+    with db.get_cursor() as (conn, cur):
+        cur.execute(sql, params)
+
+
+def _on_hand(category, subcategory):
+    item = db.get_inventory_item(category, subcategory)
+    return item['quantity'] if item else 0
+
+
+def _assert_no_drift(step):
+    drift = db.rebuild_inventory()['drift']
+    assert not drift, f"Inventory drifted after {step}: {drift}"
+
+
+def test_triggers_match_rebuild():
+    print("\n[TEST] Inventory triggers match rebuild_inventory")
+    _add_batch('2024-01-01', 10.0, 3)
+    _add_batch('2024-02-01', 12.0, 10)
+    other = _add_batch('2024-02-15', 5.0, 4, 'Other', '')
+    _assert_no_drift('imports')
+    assert db.get_inventory_item('Cat', 'Sub')['quantity'] == 13
+    assert db.get_inventory_item('Cat', 'Sub')['value_at_cost'] == 150
+
+    line = _sell('2024-05-01', 5)
+    _assert_no_drift('a sale')
+    item = db.get_inventory_item('Cat', 'Sub')
+    assert item['quantity'] == 8 and item['allocated'] == 5
+
+    ids = db.expand_product_ids(line['sale_id'])
+    ret = db.insert_return({'return_date': '2024-06-01', 'product_id': ids[0], 'quantity': 2, 'restock': 1})
+    _assert_no_drift('a restocked return')
+    db.delete_return(ret['id'])
+    _assert_no_drift('deleting the return')
+
+    db.delete_import(other)
+    _assert_no_drift('deleting an import')
+    assert _on_hand('Other', '') == 0
+    db.undelete_import(other)
+    _assert_no_drift('restoring an import')
+    assert _on_hand('Other', '') == 4
+
+    # Direct batch edits: cost, category move, hard delete
+    _batch_sql('UPDATE import_batches SET unit_cost_base = 6.0 WHERE import_id = ?', (other,))
+    _assert_no_drift('a cost change')
+    _batch_sql("UPDATE import_batches SET category = 'Moved' WHERE import_id = ?", (other,))
+    _assert_no_drift('a category move')
+    assert db.get_inventory_item('Moved', '')['value_at_cost'] == 24
+    _batch_sql('DELETE FROM import_batches WHERE import_id = ?', (other,))
+    _assert_no_drift('a batch delete')
+
+    # Drift is reported with both values, then repaired
+    expected = db.get_inventory_item('Cat', 'Sub')['quantity']
+    with db.get_cursor() as (conn, cur):
+        cur.execute("UPDATE inventory SET quantity = 99 WHERE category = 'Cat' AND subcategory = 'Sub'")
+    drift = db.rebuild_inventory()['drift']
+    assert [(d['category'], d['stored_on_hand'], d['on_hand']) for d in drift] == [('Cat', 99, expected)]
+    _assert_no_drift('a rebuild')
+    assert db.get_inventory_item('Cat', 'Sub')['quantity'] == expected
+
+
+def _as_of(day):
+    return {(r['category'], r['subcategory']): (r['on_hand'], round(r['value_at_cost'], 6))
+            for r in db.get_inventory_as_of(day) if r['on_hand']}
+
+
+def _live():
+    return {(r['category'], r['subcategory']): (r['quantity'], round(r['value_at_cost'], 6))
+            for r in db.get_inventory() if r['quantity']}
+
+
+def test_inventory_as_of_matches_live():
+    print("\n[TEST] Inventory as of today matches live stock")
+    today = date.today().isoformat()
+    assert _as_of(today) == _live(), f"{_as_of(today)} != {_live()}"
+
+    # Earlier dates replay the movements: before the sale, and before any batch
+    assert _as_of('2024-04-30')[('Cat', 'Sub')] == (13, 150)
+    assert _as_of('2023-12-31') == {}
+    past = {d: _as_of(d) for d in ('2024-01-15', '2024-04-30', '2024-05-01', '2024-06-30')}
+
+    # Answers starting from snapshots agree with the full replay
+    db.ensure_periodic_snapshots()
+    db.take_inventory_snapshot('2024-05-01')
+    for d, expected in past.items():
+        assert _as_of(d) == expected, f"Snapshot changed the answer for {d}"
+    db.take_inventory_snapshot()
+    assert _as_of(today) == _live()
+
+    # Trashing an import after a snapshot takes its stock out of every answer
+    trashed = _add_batch('2024-03-01', 10.0, 5, 'Trash', '')
+    db.take_inventory_snapshot()
+    assert _as_of(today)[('Trash', '')] == (5, 50)
+    db.delete_import(trashed)
+    assert ('Trash', '') not in _as_of(today) and _as_of(today) == _live()
+    db.undelete_import(trashed)
+    assert _as_of(today)[('Trash', '')] == (5, 50) and _as_of(today) == _live()
+
+
+def main():
+    # Keep the test stock out of the real database
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+    db.set_product_code('Cat', 'Sub', '1', '2')
+
+    # Patch require_admin for testing (bypass admin check)
+    db.imports_dao.require_admin = lambda *a, **kw: None
+
+    test_triggers_match_rebuild()
+    test_inventory_as_of_matches_live()
+    print("\nAll inventory tests passed!")
+
+
+if __name__ == "__main__":
+    main()
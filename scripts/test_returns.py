@@ -0,0 +1,177 @@
+# test_returns.py
+# Run with: python scripts/test_returns.py
+#
+# Checks the return ledger (which allocations a return reverses), the
+# restock round-trip and bulk-return validation against a throwaway database.
+
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+from db.returns_dao import process_restock_change
+
+
+def _add_batch(date, unit_cost, quantity, category='Cat', subcategory='Sub'):
+    base = db.get_base_currency()
+    with db.get_cursor() as (conn, cur):
+        cur.execute('INSERT INTO imports (date, ordered_price, quantity, category, subcategory, currency) '
+                    'VALUES (?,?,?,?,?,?)', (date, unit_cost, quantity, category, subcategory, base))
+        return db.create_import_batch(cur.lastrowid, date, category, subcategory, quantity, unit_cost, 'Supplier',
+                                      currency=base, fx_to_base=1.0, unit_cost_base=unit_cost,
+                                      unit_cost_orig=unit_cost, cur=cur)
+
+
+def _remaining(batch_id):
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT remaining_quantity FROM import_batches WHERE id = ?', (batch_id,))
+        return cur.fetchone()[0]
+
+
+def _ledger(return_id):
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT allocation_id, batch_id, quantity FROM return_allocations WHERE return_id = ? ORDER BY id',
+                    (return_id,))
+        return [tuple(r) for r in cur.fetchall()]
+
+
+def _sell(date, quantity, price=20.0):
+    header = {'date': date, 'customer_id': 'C1', 'platform': 'Shop',
+              'sale_currency': db.get_base_currency(), 'fx_to_base': 1.0}
+    line = {'category': 'Cat', 'subcategory': 'Sub', 'quantity': quantity, 'selling_price': price,
+            'selling_price_base': price, 'vat_rate': 20, 'vat_amount': 0.0, 'is_vat_inclusive': 1}
+    return db.create_sale_order(header, [line])['lines'][0]
+
+
+def test_return_ledger_and_restock():
+    print("\n[TEST] Return ledger and restock round-trip")
+    b1 = _add_batch('2024-01-01', 10.0, 3)
+    b2 = _add_batch('2024-02-01', 12.0, 10)
+    line = _sell('2024-05-01', 5)
+    ids = db.expand_product_ids(line['sale_id'])
+    assert _remaining(b1) == 0 and _remaining(b2) == 8
+
+    # Returns reverse the newest allocations first, and never claim a unit twice
+    first = db.insert_return({'return_date': '2024-06-01', 'product_id': ids[0], 'quantity': 2, 'restock': 1})
+    second = db.insert_return({'return_date': '2024-06-02', 'product_id': ids[1], 'quantity': 2, 'restock': 1})
+    assert [(b, q) for _, b, q in _ledger(first['id'])] == [(b2, 2.0)]
+    assert [(b, q) for _, b, q in _ledger(second['id'])] == [(b1, 2.0)]
+    assert _remaining(b1) == 2 and _remaining(b2) == 10
+    assert db.get_inventory_item('Cat', 'Sub')['quantity'] == 12
+    assert db.get_sale(line['sale_id'])['returned_units'] == 4
+
+    # Undeleting after a later return took the same allocation relinks to what is unclaimed
+    assert db.delete_return(first['id'])
+    later = db.insert_return({'return_date': '2024-06-03', 'product_id': ids[2], 'restock': 1})
+    assert [(b, q) for _, b, q in _ledger(later['id'])] == [(b2, 1.0)]
+    assert db.undelete_return(first['id'])
+    assert sorted((b, q) for _, b, q in _ledger(first['id'])) == [(b1, 1.0), (b2, 1.0)]
+    assert _remaining(b1) == 3 and _remaining(b2) == 10
+    assert db.delete_return(later['id'])
+    assert _remaining(b2) == 9
+
+    # Delete/undelete and restock toggles replay the same ledger
+    ledger = _ledger(first['id'])
+    assert db.delete_return(first['id'])
+    assert _remaining(b1) == 2 and _remaining(b2) == 8 and db.get_inventory_item('Cat', 'Sub')['quantity'] == 10
+    assert db.undelete_return(first['id'])
+    assert _remaining(b1) == 3 and _remaining(b2) == 9 and db.get_inventory_item('Cat', 'Sub')['quantity'] == 12
+    assert process_restock_change(first['id'], 0)
+    assert _remaining(b1) == 2 and _remaining(b2) == 8
+    assert process_restock_change(first['id'], 1)
+    assert _remaining(b1) == 3 and _remaining(b2) == 9
+    assert _ledger(first['id']) == ledger, "Ledger rows changed during the round-trip"
+
+
+def test_return_quantity_limits():
+    print("\n[TEST] Returns never exceed the units sold")
+    line = _sell('2024-06-20', 1)
+    pid = line['product_id']
+    b = line['allocations'][0]['batch_id']
+    stock = _remaining(b)
+    try:
+        db.insert_return({'return_date': '2024-06-21', 'product_id': pid, 'quantity': 3, 'restock': 1})
+    except ValueError as e:
+        assert 'left to return' in str(e)
+    else:
+        raise AssertionError("Returning 3 units of a 1-unit line should fail")
+    assert _remaining(b) == stock and db.get_sale(line['sale_id'])['returned_units'] == 0
+
+    # A deleted return cannot come back once its unit was returned again
+    a = db.insert_return({'return_date': '2024-06-22', 'product_id': pid, 'restock': 1})
+    assert db.delete_return(a['id'])
+    db.insert_return({'return_date': '2024-06-23', 'product_id': pid, 'restock': 1})
+    assert not db.undelete_return(a['id']), "Undelete must not return the same unit twice"
+    assert _remaining(b) == stock + 1
+    assert db.get_sale(line['sale_id'])['returned_units'] == 1
+
+
+def test_backfill_return_ledger():
+    print("\n[TEST] Backfill ledger for older returns")
+    line = _sell('2024-07-01', 2)
+    ids = db.expand_product_ids(line['sale_id'])
+    b = line['allocations'][-1]['batch_id']
+    stock = _remaining(b)
+    with db.get_cursor() as (conn, cur):
+        cur.execute("INSERT INTO returns (return_date, product_id, sale_id, quantity, restock, ledger_built) "
+                    "VALUES ('2024-08-01', ?, ?, 1, 0, 0)", (ids[1], line['sale_id']))
+        ret_id = cur.lastrowid
+    assert db.backfill_return_ledger() == 1
+    assert [(batch, q) for _, batch, q in _ledger(ret_id)] == [(b, 1.0)]
+    assert db.backfill_return_ledger() == 0, "A second run has nothing to link"
+    assert _remaining(b) == stock, "Backfilling a non-restock return must not touch stock"
+
+
+def test_insert_returns_validation():
+    print("\n[TEST] Bulk returns validation")
+    line = _sell('2024-10-01', 4)
+    ids = db.expand_product_ids(line['sale_id'])
+    b = line['allocations'][-1]['batch_id']
+    db.insert_return({'return_date': '2024-10-05', 'product_id': ids[0], 'restock': 0})
+    rows = [
+        {'return_date': '2024-10-10', 'product_id': ids[0]},                 # already returned
+        {'return_date': '2024-10-10', 'product_id': ids[1], 'restock': 1},
+        {'return_date': '2024-10-10', 'product_id': ids[1]},                 # repeated in this file
+        {'return_date': '2024-10-10', 'product_id': ids[2], 'quantity': 3},  # only 2 units left
+        {'return_date': '2024-10-10', 'product_id': 'NOPE'},
+        {'return_date': '', 'product_id': ids[3]},
+        {'return_date': '2024-10-10', 'product_id': ids[3], 'refund_amount': 'abc'},
+    ]
+    expected = ['already returned', None, 'repeated', 'left to return', 'not found', 'missing return date',
+                'invalid number']
+
+    dry = db.insert_returns(rows, dry_run=True)
+    assert dry['inserted'] == 0 and dry['report'][1]['status'] == 'valid'
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT COUNT(*) FROM returns WHERE sale_id = ?', (line['sale_id'],))
+        assert cur.fetchone()[0] == 1, "A dry run must not write"
+
+    stock = _remaining(b)
+    stats = db.insert_returns(rows, chunk_size=2)
+    for entry, want in zip(stats['report'], expected):
+        if want is None:
+            assert entry['status'] == 'inserted', entry
+        else:
+            assert entry['status'] == 'error' and want in entry['message'], (want, entry)
+    assert stats['inserted'] == 1 and stats['failed'] == len(rows) - 1
+    assert stats['restocked_units'] == 1 and _remaining(b) == stock + 1
+    assert db.get_sale(line['sale_id'])['returned_units'] == 2
+
+
+def main():
+    # Keep the test returns out of the real database
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+    db.set_product_code('Cat', 'Sub', '1', '2')
+
+    test_return_ledger_and_restock()
+    test_return_quantity_limits()
+    test_backfill_return_ledger()
+    test_insert_returns_validation()
+    print("\nAll return tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# test_sale_orders.py
+# Run with: python scripts/test_sale_orders.py
+#
+# Checks sale orders with serial-range lines against a throwaway database:
+# recording an order, and compacting legacy one-row-per-unit sales into lines.
+
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import db
+import db.connection
+
+
+def _add_batch(date, unit_cost, quantity, category='Cat', subcategory='Sub'):
+    base = db.get_base_currency()
+    with db.get_cursor() as (conn, cur):
+        cur.execute('INSERT INTO imports (date, ordered_price, quantity, category, subcategory, currency) '
+                    'VALUES (?,?,?,?,?,?)', (date, unit_cost, quantity, category, subcategory, base))
+        return db.create_import_batch(cur.lastrowid, date, category, subcategory, quantity, unit_cost, 'Supplier',
+                                      currency=base, fx_to_base=1.0, unit_cost_base=unit_cost,
+                                      unit_cost_orig=unit_cost, cur=cur)
+
+
+def _remaining(batch_id):
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT remaining_quantity FROM import_batches WHERE id = ?', (batch_id,))
+        return cur.fetchone()[0]
+
+
+def _allocated_by_batch():
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT batch_id, SUM(quantity_from_batch) FROM sale_batch_allocations '
+                    'WHERE COALESCE(deleted, 0) = 0 GROUP BY batch_id')
+        return {r[0]: r[1] for r in cur.fetchall()}
+
+
+def _line(category, quantity, price):
+    return {'category': category, 'subcategory': 'Sub', 'quantity': quantity, 'selling_price': price,
+            'selling_price_base': price, 'vat_rate': 20, 'vat_amount': 0.0, 'is_vat_inclusive': 1}
+
+
+def test_create_sale_order():
+    print("\n[TEST] Create sale order")
+    b1 = _add_batch('2024-01-01', 10.0, 3)
+    b2 = _add_batch('2024-02-01', 12.0, 10)
+    header = {'date': '2024-05-01', 'customer_id': 'C1', 'platform': 'Shop',
+              'sale_currency': db.get_base_currency(), 'fx_to_base': 1.0}
+    order = db.create_sale_order(header, [_line('Cat', 5, 20.0), _line('Cat', 2, 25.0)])
+    first, second = order['lines']
+    assert first['quantity'] == 5 and second['quantity'] == 2
+
+    ids = db.expand_product_ids(first['sale_id'])
+    assert len(ids) == 5 and ids[0] == first['product_id'] and ids[-1] == first['product_id_last']
+    assert db.expand_product_ids(second['sale_id'])[0] > ids[-1], "Lines reserve consecutive serials"
+    line = db.find_sale_line(ids[2])
+    assert line and line['id'] == first['sale_id'], "A unit ID inside the range resolves to its line"
+
+    # FIFO: the line takes the 3 units of the older batch, then 2 of the newer one
+    assert [(a['batch_id'], a['quantity_allocated']) for a in first['allocations']] == [(b1, 3.0), (b2, 2.0)]
+    assert _remaining(b1) == 0 and _remaining(b2) == 6
+    assert db.get_inventory_item('Cat', 'Sub')['quantity'] == 6
+
+    # A bad line rolls back the whole order
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT COUNT(*) FROM sale_orders')
+        orders_before = cur.fetchone()[0]
+    for bad in (_line('Cat', 1.5, 20.0), _line('Unmapped', 1, 20.0)):
+        try:
+            db.create_sale_order(header, [_line('Cat', 1, 20.0), bad])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Expected ValueError for {bad}")
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT COUNT(*) FROM sale_orders')
+        assert cur.fetchone()[0] == orders_before, "Failed order left a header behind"
+    assert _remaining(b2) == 6, "Failed order left allocations behind"
+
+
+def test_compact_sales_into_orders():
+    print("\n[TEST] Compact legacy sales into orders")
+    ids = db.generate_product_ids('Cat', 'Sub', 4, year_prefix='2024')
+    rows = [{'date': '2024-07-01', 'category': 'Cat', 'subcategory': 'Sub', 'quantity': 1,
+             'selling_price': 30.0, 'platform': 'Shop', 'product_id': p, 'customer_id': 'C2',
+             'fx_to_base': 1.0, 'selling_price_base': 30.0, 'sale_currency': db.get_base_currency(),
+             'vat_rate': 20, 'vat_amount': 5.0, 'is_vat_inclusive': 1} for p in ids]
+    rows[3]['selling_price'] = rows[3]['selling_price_base'] = 31.0
+    db.add_sales(rows)
+    for p in ids:
+        db.allocate_sale_to_batches(p, '2024-07-01', 'Cat', 'Sub', 1, 30.0)
+    totals_before = db.query_sales({})['totals']
+    allocated_before = _allocated_by_batch()
+
+    stats = db.compact_sales_into_orders()
+    assert stats['orders'] == 1 and stats['lines'] == 2, f"Expected one order with two lines, got {stats}"
+    assert stats['rows_removed'] == 2
+    with db.get_cursor() as (conn, cur):
+        cur.execute('SELECT quantity, serial_to - serial_from + 1 FROM sales WHERE product_id IN (?,?)',
+                    (ids[0], ids[3]))
+        assert sorted(tuple(r) for r in cur.fetchall()) == [(1.0, 1), (3.0, 3)]
+    assert _allocated_by_batch() == allocated_before, "Compaction changed the allocated units"
+    assert db.find_sale_line(ids[1])['product_id'] == ids[0], "Folded unit IDs resolve to their line"
+    totals = db.query_sales({})['totals']
+    assert totals['units'] == totals_before['units'] and totals['selling_price'] == totals_before['selling_price']
+
+    assert db.compact_sales_into_orders()['orders'] == 0, "A second run has nothing to do"
+
+
+def main():
+    # Keep the test sales out of the real database
+    db.connection.DB_PATH = Path(tempfile.mkdtemp()) / 'app.db'
+    db.init_db().close()
+    db.set_product_code('Cat', 'Sub', '1', '2')
+
+    test_create_sale_order()
+    test_compact_sales_into_orders()
+    print("\nAll sale order tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ import threading
 import shutil
 import zipfile
 import os
+import db as db
 
 BACKUP_DIR = Path(__file__).resolve().parents[1] / 'data' / 'backups'
 DATA_DIR = Path(__file__).resolve().parents[1] / 'data'
@@ -33,6 +34,7 @@ def zip_data_folder():
 def backup_now_callback(parent):
     def do_backup():
         try:
+            db.flush_audit()
             zip_path = zip_data_folder()
             parent.after(0, lambda: messagebox.showinfo('Backup', f'Backup created at:\n{zip_path}'))
         except Exception as e:
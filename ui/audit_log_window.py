@@ -59,37 +59,125 @@ def open_audit_log_window(root):
     themed_button(row2, text='🔍 Search', variant='primary', command=lambda: populate()).pack(side='left', padx=4)
     themed_button(row2, text='Reset', variant='secondary', command=lambda: reset_filters()).pack(side='left', padx=4)
     themed_button(row2, text='Export CSV', variant='secondary', command=lambda: export_treeview_csv(win, tree, cols, 'Export Audit Log')).pack(side='right')
+    themed_button(row2, text='Verify integrity', variant='secondary', command=lambda: verify_integrity()).pack(side='right', padx=4)
 
     # Table
     cols = ['id', 'ts', 'user', 'action', 'entity', 'ref_id', 'details']
-    tree = ttk.Treeview(win, columns=cols, show='headings')
+    table = ttk.Frame(win)
+    table.pack(fill='both', expand=True, padx=8, pady=8)
+    tree = ttk.Treeview(table, columns=cols, show='headings')
     for c in cols:
         tree.heading(c, text=c)
         width = 90 if c in ('id', 'user', 'action', 'entity') else 160
         if c == 'details':
             width = 320
         tree.column(c, width=width, anchor=tk.W if c in ('details', 'entity', 'action', 'user') else tk.CENTER)
-    tree.pack(fill='both', expand=True, padx=8, pady=8)
+    vsb = ttk.Scrollbar(table, orient='vertical', command=tree.yview)
+    vsb.pack(side='right', fill='y')
+    tree.pack(side='left', fill='both', expand=True)
 
     make_treeview_sortable(tree, cols)
 
+    status_var = tk.StringVar(value='')
+    ttk.Label(win, textvariable=status_var, foreground='#666').pack(anchor='w', padx=8, pady=(0, 8))
+
+    # Newest first; older pages are fetched by keyset cursor as the list is scrolled
+    PAGE_SIZE = 200
+    page = {'filters': {}, 'cursor': None, 'done': False, 'count': 0, 'pending': False}
+
+    def load_page():
+        page['pending'] = False
+        if page['done']:
+            return
+        if page['filters'].get('q'):
+            # Text search: one page of the best matches, most relevant first
+            rows = db.get_audit_logs(limit=PAGE_SIZE * 5, order='rank', **page['filters'])
+            for r in rows:
+                tree.insert('', 'end', values=[r.get(c, '') for c in cols])
+            page.update(done=True, count=len(rows))
+            status_var.set(f"Top {len(rows)} matches by relevance")
+            try:
+                stripe_treeview(tree)
+            except Exception:
+                pass
+            return
+        cursor = page['cursor'] or (None, None)
+        rows = db.get_audit_logs(limit=PAGE_SIZE, before_ts=cursor[0], before_id=cursor[1], **page['filters'])
+        for r in rows:
+            tree.insert('', 'end', values=[r.get(c, '') for c in cols])
+        if rows:
+            page['cursor'] = (rows[-1].get('ts'), rows[-1].get('id'))
+        page['done'] = len(rows) < PAGE_SIZE
+        page['count'] += len(rows)
+        status_var.set(f"Showing {page['count']} entries" + ('' if page['done'] else ' (scroll for more)'))
+        try:
+            stripe_treeview(tree)
+        except Exception:
+            pass
+
+    def on_yscroll(first, last):
+        vsb.set(first, last)
+        # near the bottom: fetch the next page once the current one is drawn
+        if not page['done'] and not page['pending'] and float(last) >= 0.95:
+            page['pending'] = True
+            win.after_idle(load_page)
+
+    tree.configure(yscrollcommand=on_yscroll)
+
     def populate():
         tree.delete(*tree.get_children())
-        rows = db.get_audit_logs(
+        page.update(cursor=None, done=False, count=0, filters=dict(
             start_date=(start_var.get().strip() or None),
             end_date=(end_var.get().strip() or None),
             user=(user_var.get().strip() or None),
             action=(action_var.get().strip() or None),
             entity=(entity_var.get().strip() or None),
             q=(q_var.get().strip() or None),
-            limit=5000,
-        )
-        for r in rows:
-            tree.insert('', 0, values=[r.get(c, '') for c in cols])
-        try:
-            stripe_treeview(tree)
-        except Exception:
-            pass
+        ))
+        load_page()
+
+    verify_state = {'thread': None}
+
+    def verify_integrity():
+        import threading
+        from tkinter import messagebox
+        if verify_state['thread'] is not None and verify_state['thread'].is_alive():
+            return
+        result = {'progress': ''}
+
+        def _progress(done, last_id):
+            result['progress'] = f"Verifying audit chain... {done} entries checked (up to #{last_id})"
+
+        def _worker():
+            try:
+                result['stats'] = db.verify_audit_chain(progress=_progress)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        verify_state['thread'] = t
+        t.start()
+        status_var.set('Verifying audit chain...')
+
+        def _poll():
+            if t.is_alive():
+                if result['progress']:
+                    status_var.set(result['progress'])
+                win.after(200, _poll)
+                return
+            if 'error' in result:
+                status_var.set('Verification failed to run')
+                messagebox.showerror('Audit Log', f"Verification error: {result['error']}", parent=win)
+                return
+            st = result.get('stats') or {}
+            if st.get('ok'):
+                status_var.set(f"Audit chain intact: {st.get('verified', 0)} new entries verified "
+                               f"(through #{st.get('last_id')}) in {st.get('seconds', 0)}s")
+            else:
+                status_var.set(f"Audit chain BROKEN at entry #{st.get('broken_at')}")
+                messagebox.showerror('Audit Log', f"Tampering detected at entry #{st.get('broken_at')}: {st.get('reason')}", parent=win)
+
+        _poll()
 
     def reset_filters():
         start_var.set('')
@@ -61,6 +61,7 @@ def open_backup_window(root):
             BACKUP_DIR.mkdir(parents=True, exist_ok=True)
             stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
             dest = BACKUP_DIR / f"app-{stamp}.db"
+            db.flush_audit()
             shutil.copy2(db.DB_PATH, dest)
             with db.get_cursor() as (conn, cur):
                 db.write_audit('backup', 'database', str(dest), f"Backup created: {dest}", cur=cur)
@@ -87,6 +88,7 @@ def open_backup_window(root):
             stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
             current_backup = BACKUP_DIR / f"app-before-restore-{stamp}.db"
             if Path(db.DB_PATH).exists():
+                db.flush_audit()
                 shutil.copy2(db.DB_PATH, current_backup)
             # copy chosen file to DB path
             shutil.copy2(path, db.DB_PATH)
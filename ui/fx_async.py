@@ -0,0 +1,117 @@
+"""Background FX lookups for Tk entry windows.
+
+``db._get_rate_generic`` may go to the network (https, then http, 5 s
+timeout each), which freezes the Tk loop when called from an event
+handler. Lookups here run on a small shared thread pool; concurrent
+requests for the same (date, from, to) share one in-flight future, and
+results are handed back on the Tk main thread by polling with ``after()``.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import db as db
+
+_Key = Tuple[str, str, str]
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fx-lookup')
+_INFLIGHT: Dict[_Key, Future] = {}
+_WAITERS: Dict[_Key, int] = {}
+_LOCK = threading.Lock()
+_POLL_MS = 50
+
+
+def _key(date_str: str, from_ccy: str, to_ccy: str) -> _Key:
+    return ((date_str or '').strip(), (from_ccy or '').upper(), (to_ccy or '').upper())
+
+
+def _lookup(date_str: str, from_ccy: str, to_ccy: str) -> Optional[float]:
+    return db._get_rate_generic(date_str, from_ccy, to_ccy)
+
+
+def _acquire(k: _Key) -> Future:
+    """Return the in-flight future for ``k``, submitting a new lookup if needed."""
+    with _LOCK:
+        fut = _INFLIGHT.get(k)
+        if fut is None or fut.cancelled():
+            fut = _EXECUTOR.submit(_lookup, *k)
+            _INFLIGHT[k] = fut
+            _WAITERS[k] = 0
+        _WAITERS[k] = _WAITERS.get(k, 0) + 1
+        return fut
+
+
+def _release(k: _Key, fut: Future) -> None:
+    """Drop one waiter; the last one out cancels a lookup that has not started."""
+    with _LOCK:
+        if _INFLIGHT.get(k) is not fut:
+            return
+        _WAITERS[k] = _WAITERS.get(k, 1) - 1
+        if _WAITERS[k] <= 0 or fut.done():
+            fut.cancel()
+            _INFLIGHT.pop(k, None)
+            _WAITERS.pop(k, None)
+
+
+class FxRequester:
+    """Per-window handle for asynchronous FX lookups.
+
+    Holds at most one pending lookup: a new ``request`` (for example after
+    the date field changed again) cancels the previous one, so a stale
+    answer never overwrites a newer one. Rates delivered to the window are
+    remembered in ``resolved`` so save handlers can reuse them.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.resolved: Dict[_Key, float] = {}
+        self._pending: Optional[Tuple[_Key, Future, object]] = None
+
+    def request(self, date_str: str, from_ccy: str, to_ccy: str,
+                on_done: Callable[[Optional[float]], None]) -> None:
+        self.cancel()
+        k = _key(date_str, from_ccy, to_ccy)
+        token = object()
+        self._pending = (k, _acquire(k), token)
+        self._poll(token, on_done)
+
+    def cancel(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending:
+            _release(pending[0], pending[1])
+
+    def is_pending(self, date_str: Optional[str] = None, from_ccy: Optional[str] = None,
+                   to_ccy: Optional[str] = None) -> bool:
+        """True if a lookup is pending (optionally: for exactly this key)."""
+        if not self._pending:
+            return False
+        if date_str is None:
+            return True
+        return self._pending[0] == _key(date_str, from_ccy or '', to_ccy or '')
+
+    def get_resolved(self, date_str: str, from_ccy: str, to_ccy: str) -> Optional[float]:
+        return self.resolved.get(_key(date_str, from_ccy, to_ccy))
+
+    def _poll(self, token, on_done) -> None:
+        pending = self._pending
+        if not pending or pending[2] is not token:
+            return  # cancelled or superseded
+        k, fut, _ = pending
+        if not fut.done():
+            try:
+                self.widget.after(_POLL_MS, lambda: self._poll(token, on_done))
+            except Exception:
+                # Window destroyed while waiting
+                self.cancel()
+            return
+        self._pending = None
+        _release(k, fut)
+        try:
+            rate = fut.result()
+        except Exception:
+            rate = None
+        if rate is not None and rate > 0:
+            self.resolved[k] = float(rate)
+        on_done(rate)
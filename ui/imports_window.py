@@ -4,6 +4,7 @@ from datetime import datetime
 import db as db
 from .theme import apply_theme, maximize_window
 from .theme import ask_string, themed_button
+from .fx_async import FxRequester
 
 
 def ensure_db():
@@ -151,20 +152,30 @@ def open_imports_window(root):
     # Note: import-level expenses are captured via the Expenses screen now;
     # they are not requested on the Record Import window.
 
+    # Rate lookups may hit the network; run them off the Tk thread
+    fx_req = FxRequester(window)
+
     def fetch_and_show_fx(event=None):
         d = date_entry.get().strip()
         c = (currency_var.get() or '').strip().upper()
         try:
             if not d or not c:
+                fx_req.cancel()
                 suggested_fx_var.set('')
                 return
-            r = db.get_rate_to_base(d, c)
+            base = (db.get_base_currency() or '').upper()
+        except Exception:
+            suggested_fx_var.set('n/a')
+            return
+
+        def _show(r):
             if r is None:
                 suggested_fx_var.set('n/a')
             else:
-                suggested_fx_var.set(f"1 {c} = {r:.6f} {db.get_base_currency()}")
-        except Exception:
-            suggested_fx_var.set('n/a')
+                suggested_fx_var.set(f"1 {c} = {r:.6f} {base}")
+
+        suggested_fx_var.set('Fetching...')
+        fx_req.request(d, c, base, _show)
 
     # Fetch FX initially and when date/currency change
     fetch_and_show_fx()
@@ -633,12 +644,6 @@ def open_imports_window(root):
     themed_button(action_bar, text="Save Import", variant='primary', command=save_import).pack(side='right')
 
 
-def update_inventory(category, subcategory, quantity):
-    try:
-        db.update_inventory(category, subcategory, quantity)
-    except Exception:
-        pass
-
 def rebuild_inventory_from_imports():
     try:
         db.rebuild_inventory_from_imports()
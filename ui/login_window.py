@@ -14,9 +14,9 @@ def open_login_dialog(root) -> bool:
 
     dlg = tk.Toplevel(root)
     dlg.title('Login')
-    dlg.geometry('360x200')
+    dlg.geometry('360x230')
     try:
-        dlg.minsize(320, 180)
+        dlg.minsize(320, 210)
     except Exception:
         pass
     dlg.transient(root)
@@ -40,25 +40,64 @@ def open_login_dialog(root) -> bool:
     pass_e = ttk.Entry(frm, show='•')
     pass_e.pack(fill='x', pady=(0, 12))
 
+    # Password hashing is deliberately slow; it runs on a worker thread while this spins
+    progress = ttk.Progressbar(frm, mode='indeterminate')
+    status_var = tk.StringVar(value='')
+    ttk.Label(frm, textvariable=status_var, foreground='#666').pack(anchor='w')
+
     auth_ok = {'ok': False}
+    busy = {'thread': None}
 
-    def do_login():
+    def do_login(event=None):
+        import threading
+        if busy['thread'] is not None and busy['thread'].is_alive():
+            return
         u = user_e.get().strip()
         p = pass_e.get().strip()
         if not (u and p):
             messagebox.showwarning('Missing', 'Enter username and password', parent=dlg)
             return
-        if db.verify_user(u, p):
-            auth_ok['ok'] = True
-            dlg.destroy()
-        else:
-            messagebox.showerror('Login failed', 'Invalid credentials', parent=dlg)
+        result = {}
+
+        def _worker():
+            try:
+                result['ok'] = db.verify_user(u, p)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        busy['thread'] = t
+        login_btn.configure(state='disabled')
+        status_var.set('Verifying...')
+        progress.pack(fill='x', pady=(4, 8), before=btns)
+        progress.start(12)
+        t.start()
+
+        def _poll():
+            if t.is_alive():
+                dlg.after(50, _poll)
+                return
+            progress.stop()
+            progress.pack_forget()
+            status_var.set('')
+            login_btn.configure(state='normal')
+            if result.get('ok'):
+                auth_ok['ok'] = True
+                dlg.destroy()
+            elif 'error' in result:
+                messagebox.showerror('Login failed', f"Login error: {result['error']}", parent=dlg)
+            else:
+                messagebox.showerror('Login failed', 'Invalid credentials', parent=dlg)
+
+        _poll()
 
     btns = ttk.Frame(frm)
     btns.pack(fill='x')
     from .theme import themed_button
     themed_button(btns, text='Cancel', variant='secondary', command=lambda: dlg.destroy()).pack(side='left')
-    themed_button(btns, text='Login', variant='primary', command=do_login).pack(side='right')
+    login_btn = themed_button(btns, text='Login', variant='primary', command=do_login)
+    login_btn.pack(side='right')
+    pass_e.bind('<Return>', do_login)
 
     dlg.wait_window()
     return bool(auth_ok['ok'])
@@ -5,6 +5,7 @@ from pathlib import Path
 import db as db
 import core.fx_rates as fx_rates
 import core.fx_cache as fx_cache
+from .fx_async import FxRequester
 
 """Record Sale UI writing to CSV.
 CSV columns (canonical):
@@ -14,46 +15,6 @@ FXToBase, SellingPriceBase, SaleCurrency
 
 
 
-def append_sale(row_dict):
-    """Persist a sale using the DB helper (backwards-compatible signature)."""
-    # Normalize UI/titlecase keys to DAO snake_case keys
-    try:
-        normalized = {
-            'date': row_dict.get('date') or row_dict.get('Date'),
-            'category': row_dict.get('category') or row_dict.get('Category'),
-            'subcategory': row_dict.get('subcategory') or row_dict.get('Subcategory'),
-            'quantity': row_dict.get('quantity') or row_dict.get('Quantity'),
-            'selling_price': row_dict.get('selling_price') or row_dict.get('SellingPrice') or row_dict.get('price_per_item'),
-            'platform': row_dict.get('platform') or row_dict.get('Platform'),
-            'product_id': row_dict.get('product_id') or row_dict.get('ProductID'),
-            'customer_id': row_dict.get('customer_id') or row_dict.get('CustomerID'),
-            'document_path': row_dict.get('document_path') or row_dict.get('DocumentPath') or row_dict.get('document_path'),
-            'fx_to_base': row_dict.get('fx_to_base') or row_dict.get('FXToBase'),
-            'selling_price_base': row_dict.get('selling_price_base') or row_dict.get('SellingPriceBase') or row_dict.get('SellingPriceUSD'),
-            'sale_currency': row_dict.get('sale_currency') or row_dict.get('SaleCurrency') or row_dict.get('currency'),
-            'deleted': int(row_dict.get('deleted', 0) or 0),
-        }
-        # Prefer package-level add_sale; fallback to DAO module directly
-        try:
-            if hasattr(db, 'add_sale') and callable(getattr(db, 'add_sale')):
-                return db.add_sale(normalized)
-        except Exception:
-            # fall through to direct DAO
-            pass
-        try:
-            # direct import to avoid relying on db package exports
-            from db import sales_dao
-            return sales_dao.add_sale(normalized)
-        except Exception:
-            try:
-                import db.sales_dao as _sd
-                return _sd.add_sale(normalized)
-            except Exception:
-                return None
-    except Exception:
-        return None
-
-
 def open_sales_window(root):
     # Sales are persisted in the `sales` table (DB-first); the UI uses DB helpers.
 
@@ -113,9 +74,9 @@ def open_sales_window(root):
     # Options section
     options_frame = ttk.Frame(form_section)
     options_frame.pack(fill='x', pady=(0, 12))
-    reduce_var = tk.BooleanVar(value=True)
-    reduce_chk = ttk.Checkbutton(options_frame, text='✓ Reduce inventory by quantity', variable=reduce_var)
-    reduce_chk.pack(anchor='w')
+    check_stock_var = tk.BooleanVar(value=True)
+    check_stock_chk = ttk.Checkbutton(options_frame, text='✓ Warn when stock is insufficient', variable=check_stock_var)
+    check_stock_chk.pack(anchor='w')
 
 
     # Category row
@@ -219,31 +180,14 @@ def open_sales_window(root):
         except Exception:
             pass
 
-    def do_refresh_rate():
-        d = date_e.get().strip()
-        # If date is today, prefer fresh latest instead of cached
-        today = datetime.now().strftime('%Y-%m-%d')
-        if d == today:
-            # fetch live for selected pair
-            try:
-                from_ccy = (sale_ccy_var.get() or 'TRY').upper()
-                to_ccy = db.get_base_currency()
-                # If using our helper, fallback to fx_rates for USD/TRY pairs
-                r = db._get_rate_generic(d, from_ccy, to_ccy)
-            except Exception:
-                r = fx_rates.fetch_live_rate()
-            if r is not None:
-                # cache
-                try:
-                    if from_ccy == 'USD' and to_ccy == 'TRY':
-                        fx_rates.set_rate(d, r)
-                except Exception:
-                    pass
-                _set_fx_value(r, 'Live')
-                return
-        # Fallback to cached-or-fetch for other dates
-        from_ccy = (sale_ccy_var.get() or 'TRY').upper()
-        to_ccy = db.get_base_currency()
+    # Network lookups run off the Tk thread; see ui/fx_async.py
+    fx_req = FxRequester(win)
+
+    def _current_fx_key():
+        return (date_e.get().strip(), (sale_ccy_var.get() or 'TRY').upper(),
+                (db.get_base_currency() or '').upper())
+
+    def _fill_fx_from_cache(d, from_ccy, to_ccy) -> bool:
         # Prefer in-memory suggestion cache first
         try:
             sugg = fx_cache.get(d, from_ccy, to_ccy)
@@ -251,7 +195,7 @@ def open_sales_window(root):
             sugg = None
         if sugg:
             _set_fx_value(sugg, 'Suggested (cache)')
-            return
+            return True
         # Then DB cache
         try:
             db_cached = db.get_cached_rate(d, from_ccy, to_ccy)
@@ -259,60 +203,47 @@ def open_sales_window(root):
             db_cached = None
         if db_cached:
             _set_fx_value(db_cached, 'Cached')
-            return
-        # Finally try generic/get_or_fetch which may fetch live
-        try:
-            r = db._get_rate_generic(d, from_ccy, to_ccy)
-        except Exception:
-            r = fx_rates.get_or_fetch_rate(d)
+            return True
+        return False
+
+    def _on_fx_fetched(r):
         if r is not None:
-            # If neither sugg nor db_cached existed earlier, this likely came from a live fetch
             _set_fx_value(r, 'Live')
         else:
+            # Allow manual entry if fetch failed
             _set_fx_manual('Offline - enter rate')
 
+    def _fetch_fx_async(d, from_ccy, to_ccy):
+        try:
+            fx_status.config(text='Fetching...')
+        except Exception:
+            pass
+        fx_req.request(d, from_ccy, to_ccy, _on_fx_fetched)
+
+    def do_refresh_rate():
+        d, from_ccy, to_ccy = _current_fx_key()
+        # If date is today, prefer fresh latest instead of cached
+        today = datetime.now().strftime('%Y-%m-%d')
+        if d != today and _fill_fx_from_cache(d, from_ccy, to_ccy):
+            return
+        _fetch_fx_async(d, from_ccy, to_ccy)
+
     from .theme import themed_button
     refresh_btn = themed_button(right_fx, text='Refresh', variant='primary', command=do_refresh_rate)
     refresh_btn.pack(side='right')
 
     def auto_fill_fx():
-        d = date_e.get().strip()
-        today = datetime.now().strftime('%Y-%m-%d')
-        # For today, try to force fresh value before reading cache
-        if d == today:
-            live = fx_rates.fetch_live_rate()
-            if live is not None:
-                fx_rates.set_rate(d, live)
-                _set_fx_value(live, 'Live')
-                return
-        try:
-            from_ccy = (sale_ccy_var.get() or 'TRY').upper()
-            to_ccy = db.get_base_currency()
-            # Check in-memory suggestion cache first
-            try:
-                sugg = fx_cache.get(d, from_ccy, to_ccy)
-            except Exception:
-                sugg = None
-            if sugg:
-                _set_fx_value(sugg, 'Suggested (cache)')
-                return
-            # Then DB cache
-            try:
-                db_cached = db.get_cached_rate(d, from_ccy, to_ccy)
-            except Exception:
-                db_cached = None
-            if db_cached:
-                _set_fx_value(db_cached, 'Cached')
-                return
-            r = db._get_rate_generic(d, from_ccy, to_ccy)
-        except Exception:
-            r = fx_rates.get_or_fetch_rate(d)
-        if r is not None:
-            # If we reached here and db_cached/sugg were absent, it's likely live-or-generic
-            _set_fx_value(r, 'Live')
-        else:
-            # Allow manual entry if fetch failed
-            _set_fx_manual('Offline - enter rate')
+        d, from_ccy, to_ccy = _current_fx_key()
+        if _fill_fx_from_cache(d, from_ccy, to_ccy):
+            fx_req.cancel()
+            return
+        _fetch_fx_async(d, from_ccy, to_ccy)
+
+    def _on_date_edited(event=None):
+        # A lookup for a date the user has since changed is stale
+        if fx_req.is_pending() and not fx_req.is_pending(*_current_fx_key()):
+            fx_req.cancel()
+            _set_fx_manual('')
 
     # Auto-fetch when window opens and when date changes
     try:
@@ -321,6 +252,7 @@ def open_sales_window(root):
         pass
     date_e.bind('<FocusOut>', lambda e: auto_fill_fx())
     date_e.bind('<Return>', lambda e: auto_fill_fx())
+    date_e.bind('<KeyRelease>', _on_date_edited)
 
     # Platform row (Entry + auto-suggest dropdown)
     platform_frame = ttk.Frame(form_section)
@@ -578,20 +510,12 @@ def open_sales_window(root):
             messagebox.showerror('Invalid quantity', 'Quantity must be a number')
             return
 
-        # Optionally check inventory and reduce quantity
-        if reduce_var.get():
+        # Optionally check stock (the batch allocation reduces inventory on save)
+        if check_stock_var.get():
             try:
-                inv_rows = db.get_inventory() or []
+                match = db.get_inventory_item(cat, sub)
             except Exception:
-                inv_rows = []
-            # find matching inventory line
-            match = None
-            for r in inv_rows:
-                rc = (r.get('category') or '').strip()
-                rs = (r.get('subcategory') or '').strip()
-                if rc == (cat or '') and rs == (sub or ''):
-                    match = r
-                    break
+                match = None
             current_qty = match.get('quantity') if match else None
             try:
                 current_qty = float(current_qty) if current_qty is not None else None
@@ -600,7 +524,7 @@ def open_sales_window(root):
 
             # Confirm if resulting stock would be negative or if item not found
             if current_qty is None:
-                proceed = messagebox.askyesno('Inventory not found', 'No matching inventory item found for this category/subcategory. Proceed and create/update inventory with negative or zero quantity?')
+                proceed = messagebox.askyesno('Inventory not found', 'No matching inventory item found for this category/subcategory. Proceed anyway?')
                 if not proceed:
                     return
             else:
@@ -618,15 +542,18 @@ def open_sales_window(root):
             fx_text = (fx_e.get() or '').strip()
             fx = float(fx_text)
         except Exception:
-            # Try autofetch if not available
-            try:
-                from_ccy = (sale_ccy_var.get() or 'TRY').upper()
-                to_ccy = db.get_base_currency()
-                r = db._get_rate_generic(d, from_ccy, to_ccy)
-            except Exception:
-                r = fx_rates.get_or_fetch_rate(d)
+            # Reuse the rate already resolved for this window; never block on the network here
+            _, from_ccy, to_ccy = _current_fx_key()
+            r = fx_req.get_resolved(d, from_ccy, to_ccy)
+            if r is None:
+                try:
+                    r = db.get_cached_rate(d, from_ccy, to_ccy)
+                except Exception:
+                    r = None
             if r is None:
-                messagebox.showerror('FX unavailable', 'Could not fetch FX rate for this date. Please try again later or enter manually.')
+                if not fx_req.is_pending(d, from_ccy, to_ccy):
+                    _fetch_fx_async(d, from_ccy, to_ccy)
+                messagebox.showinfo('FX loading', 'The FX rate for this date is still being fetched. Save again once it appears, or enter it manually.')
                 return
             fx = float(r)
             fx_e.configure(state='normal')
@@ -666,23 +593,17 @@ def open_sales_window(root):
                     # As a last resort, proceed without linking the sale to a customer
                     messagebox.showwarning('Customer Warning', f"Customer couldn't be created automatically: {e}. The sale will be saved without linking to a customer.")
 
-        # Generate product IDs based on category/subcategory codes and quantity
-        product_ids = []
+        # Product IDs are reserved from the category/subcategory code when the order is saved
         # For ID generation, quantity must be a whole number
         if not float(qty).is_integer() or qty <= 0:
             messagebox.showerror('Invalid quantity', 'Quantity must be a positive whole number to generate product IDs.')
             return
         count = int(qty)
-        # Use sale date's year for 2-digit prefix
         try:
-            yy = datetime.strptime(d, '%Y-%m-%d').strftime('%y')
+            has_codes = db.get_product_code(cat, sub) is not None
         except Exception:
-            yy = datetime.now().strftime('%y')
-        try:
-            product_ids = db.generate_product_ids(cat, sub, count, year_prefix=yy)
-        except Exception:
-            product_ids = []
-        if not product_ids:
+            has_codes = False
+        if not has_codes:
             # No mapping exists; ask user to provide codes now
             if not messagebox.askyesno('Missing codes', 'No product code mapping exists for this category/subcategory. Define codes now?'):
                 return
@@ -709,72 +630,51 @@ def open_sales_window(root):
                 messagebox.showerror('Invalid code', 'Please enter 1-3 digits (will be zero-padded to 3).')
             try:
                 db.set_product_code(cat, sub, cat_code, sub_code, next_serial=1)
-                product_ids = db.generate_product_ids(cat, sub, count, year_prefix=yy)
             except Exception as e:
-                messagebox.showerror('Error', f'Failed to set/generate product codes: {e}')
+                messagebox.showerror('Error', f'Failed to set product codes: {e}')
                 return
         # =====================================================================================
         # BATCH TRACKING: Allocate each sold item to batches using FIFO for cost tracking
         # =====================================================================================
         batch_allocations = []
-        for pid in product_ids:
-            # Allocate this individual item (quantity=1) to batches
-            # Convert entered unit price to base currency using selected sale currency
-            from_ccy = (sale_ccy_var.get() or 'TRY').upper()
-            base_ccy = db.get_base_currency()
-            unit_in_base = unit
-            if from_ccy != (base_ccy or '').upper():
-                try:
-                    conv = db.convert_amount(d, unit, from_ccy, base_ccy)
-                    if conv is not None:
-                        unit_in_base = conv
-                except Exception:
-                    pass
-            allocations = db.allocate_sale_to_batches(pid, d, cat, sub, 1, unit_in_base)
-            batch_allocations.extend(allocations)
-            
-            # Write sale record (same as before)
-            # SellingPriceBase holds the unit price in base currency
-            try:
-                usd_unit = unit_in_base
-            except Exception:
-                usd_unit = unit / fx
-
-            # VAT (KDV) fields
-            try:
-                vat_rate = float(vat_rate_var.get().replace(',', '.')) if vat_rate_var.get().strip() else None
-            except Exception:
-                messagebox.showerror('Invalid VAT', 'KDV Oranı geçerli bir sayı olmalı (örn: 18)')
-                return
-            kdv_dahil = bool(kdv_dahil_var.get())
-            # Compute VAT amount for this unit
-            from core.vat_utils import compute_vat
-            net, vat_amt = compute_vat(unit, vat_rate, kdv_dahil)
-
-            append_sale({
-                'Date': d,
-                'Category': cat,
-                'Subcategory': sub,
-                'Quantity': 1,
-                'SellingPrice': unit,
-                'SaleCurrency': (sale_ccy_var.get() or ''),
-                'Platform': platform,
-                'ProductID': pid,
-                'CustomerID': customer_id or '',
-                'DocumentPath': '',
-                'FXToBase': fx,
-                'SellingPriceBase': usd_unit,
+        # Convert entered unit price to base currency once, using the already-resolved rate
+        from_ccy = (sale_ccy_var.get() or 'TRY').upper()
+        base_ccy = db.get_base_currency()
+        unit_in_base = unit if from_ccy == (base_ccy or '').upper() else unit * fx
+        # VAT (KDV) fields are the same for every unit
+        try:
+            vat_rate = float(vat_rate_var.get().replace(',', '.')) if vat_rate_var.get().strip() else None
+        except Exception:
+            messagebox.showerror('Invalid VAT', 'KDV Oranı geçerli bir sayı olmalı (örn: 18)')
+            return
+        kdv_dahil = bool(kdv_dahil_var.get())
+        from core.vat_utils import compute_vat
+        net, vat_amt = compute_vat(unit, vat_rate, kdv_dahil)
+        # One order with a single line covering every unit; allocations are per batch
+        try:
+            order = db.create_sale_order({
+                'date': d,
+                'customer_id': customer_id or '',
+                'platform': platform,
+                'sale_currency': (sale_ccy_var.get() or ''),
+                'fx_to_base': fx,
+                'document_path': '',
+            }, [{
+                'category': cat,
+                'subcategory': sub,
+                'quantity': count,
+                'selling_price': unit,
+                'selling_price_base': unit_in_base,
                 'vat_rate': vat_rate,
                 'vat_amount': vat_amt,
                 'is_vat_inclusive': 1 if kdv_dahil else 0,
-            })
-
-        # Apply inventory reduction after saving sale (batch system handles this automatically)
-        if reduce_var.get():
-            try:
-                db.update_inventory(cat, sub, -qty)
-            except Exception as e:
-                messagebox.showwarning('Inventory update failed', f'Failed to update inventory: {e}')
+            }])
+        except Exception as e:
+            messagebox.showerror('Error', f'Failed to save the sale records: {e}')
+            return
+        line = order['lines'][0]
+        first_id, last_id = line['product_id'], line['product_id_last']
+        batch_allocations.extend(line['allocations'])
         
         # Show batch allocation summary to user
         if batch_allocations:
@@ -793,22 +693,18 @@ def open_sales_window(root):
             if shortage_qty > 0:
                 summary_msg += f"\n⚠️  Inventory shortage: {shortage_qty} items (zero cost basis)"
             
-            if product_ids:
-                if len(product_ids) == 1:
-                    summary_msg += f"\n🏷️  Product ID: {product_ids[0]}"
-                else:
-                    summary_msg += f"\n🏷️  Product IDs: {product_ids[0]} to {product_ids[-1]}"
+            if count == 1:
+                summary_msg += f"\n🏷️  Product ID: {first_id}"
+            else:
+                summary_msg += f"\n🏷️  Product IDs: {first_id} to {last_id}"
             
             messagebox.showinfo('Sale Completed with Batch Tracking', summary_msg)
         else:
             # Fallback: show simple confirmation if no batch allocations
-            if product_ids:
-                if len(product_ids) == 1:
-                    msg = f"Sale recorded. Product ID: {product_ids[0]}"
-                else:
-                    msg = f"Sale recorded. First: {product_ids[0]}  Last: {product_ids[-1]}  (Total: {len(product_ids)})"
+            if count == 1:
+                msg = f"Sale recorded. Product ID: {first_id}"
             else:
-                msg = 'Sale recorded'
+                msg = f"Sale recorded. First: {first_id}  Last: {last_id}  (Total: {count})"
             messagebox.showinfo('Saved', msg)
         
         win.destroy()
@@ -6,7 +6,7 @@ import db as db
 def open_settings_window(root):
     win = tk.Toplevel(root)
     win.title('⚙️ Settings')
-    win.geometry('420x260')
+    win.geometry('460x360')
     try:
         win.minsize(380, 220)
     except Exception:
@@ -62,6 +62,192 @@ def open_settings_window(root):
     # Info
     ttk.Label(container, text='Note: Profits and analytics are computed in the base currency.', foreground='#666').pack(anchor='w', pady=(4, 12))
 
+    # FX network circuit breaker status
+    ttk.Label(container, text='FX Network', font=('', 11, 'bold')).pack(anchor='w', pady=(0, 4))
+    fx_net = ttk.Frame(container)
+    fx_net.pack(fill='x', pady=(0, 12))
+    breaker_var = tk.StringVar(value='')
+    ttk.Label(fx_net, textvariable=breaker_var).pack(side='left')
+
+    def refresh_breaker_status():
+        try:
+            from core.fx_breaker import BREAKER, OPEN, HALF_OPEN
+            st = BREAKER.status()
+            if st['state'] == OPEN:
+                txt = f"Offline (cache-only), retry in {st['retry_in_seconds']:.0f}s"
+            elif st['state'] == HALF_OPEN:
+                txt = 'Probing (next lookup tests the connection)'
+            else:
+                txt = 'Online'
+            if st['consecutive_failures']:
+                txt += f" - {st['consecutive_failures']} consecutive failure(s)"
+            breaker_var.set(txt)
+        except Exception:
+            breaker_var.set('n/a')
+
+    def reset_breaker():
+        try:
+            from core.fx_breaker import BREAKER
+            BREAKER.reset()
+        except Exception:
+            pass
+        refresh_breaker_status()
+
+    # Offline FX rates: bulk-load an ECB history file or a date,ccy,rate CSV
+    fx_load = ttk.Frame(container)
+    fx_load.pack(fill='x', pady=(0, 12))
+    fx_load_var = tk.StringVar(value='Load historical rates from a file (no internet needed).')
+    ttk.Label(fx_load, textvariable=fx_load_var, foreground='#666').pack(side='left')
+
+    def load_fx_rates_file():
+        from tkinter import filedialog
+        import threading
+        path = filedialog.askopenfilename(
+            parent=win, title='Select FX rates file',
+            filetypes=[('ECB / CSV rates', '*.zip *.csv *.xml'), ('All files', '*.*')])
+        if not path:
+            return
+        result = {}
+
+        def _worker():
+            try:
+                result['stats'] = db.load_fx_file(path)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        t.start()
+        fx_load_var.set('Loading rates...')
+
+        def _poll():
+            if t.is_alive():
+                win.after(200, _poll)
+                return
+            if 'error' in result:
+                fx_load_var.set('Load failed')
+                messagebox.showerror('FX Import', f"Failed to load rates: {result['error']}", parent=win)
+            else:
+                st = result.get('stats') or {}
+                fx_load_var.set(f"Loaded {st.get('rows', 0)} rates for {st.get('dates', 0)} dates in {st.get('seconds', 0)}s")
+
+        _poll()
+
+    # Encryption key rotation: re-encrypt stored notes after changing TRACKING_APP_SECRET_KEY
+    ttk.Label(container, text='Encryption', font=('', 11, 'bold')).pack(anchor='w', pady=(0, 4))
+    key_rot = ttk.Frame(container)
+    key_rot.pack(fill='x', pady=(0, 12))
+    key_rot_var = tk.StringVar(value='Re-encrypt notes with the current key (old keys stay readable until done).')
+    ttk.Label(key_rot, textvariable=key_rot_var, foreground='#666').pack(side='left')
+    key_rot_state = {'thread': None, 'cancel': None}
+
+    def rotate_keys():
+        import threading
+        try:
+            db.require_admin('rotate', 'encryption_key')
+        except Exception as e:
+            messagebox.showerror('Encryption', str(e), parent=win)
+            return
+        if key_rot_state['thread'] is not None and key_rot_state['thread'].is_alive():
+            # second click cancels; a later run resumes from the saved cursor
+            key_rot_state['cancel'].set()
+            key_rot_var.set('Stopping after the current chunk...')
+            return
+        cancel = threading.Event()
+        result = {'progress': ''}
+
+        def _progress(table, scanned, rotated):
+            result['progress'] = f'{table}: {scanned} scanned, {rotated} re-encrypted...'
+
+        def _worker():
+            try:
+                result['stats'] = db.rotate_encryption_keys(progress=_progress, cancel=cancel)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        key_rot_state.update(thread=t, cancel=cancel)
+        t.start()
+        key_rot_var.set('Rotating... (click again to stop)')
+
+        def _poll():
+            if t.is_alive():
+                if result['progress']:
+                    key_rot_var.set(result['progress'])
+                win.after(200, _poll)
+                return
+            if 'error' in result:
+                key_rot_var.set('Rotation failed')
+                messagebox.showerror('Encryption', f"Key rotation failed: {result['error']}", parent=win)
+                return
+            st = result.get('stats') or {}
+            rotated = sum((st.get(tb) or {}).get('rotated', 0) for tb in ('imports', 'expenses'))
+            unreadable = sum((st.get(tb) or {}).get('unreadable', 0) for tb in ('imports', 'expenses'))
+            txt = 'Stopped' if st.get('cancelled') else 'Done'
+            txt += f": {rotated} re-encrypted"
+            if unreadable:
+                txt += f", {unreadable} unreadable (missing old key?)"
+            key_rot_var.set(txt + f" in {st.get('seconds', 0)}s")
+            try:
+                db.write_audit('rotate', 'encryption_key', st.get('key_id'), txt)
+            except Exception:
+                pass
+
+        _poll()
+
+    # Audit retention: older entries move to data/audit_archive.db (still searchable)
+    ttk.Label(container, text='Audit Log', font=('', 11, 'bold')).pack(anchor='w', pady=(0, 4))
+    audit_ret = ttk.Frame(container)
+    audit_ret.pack(fill='x', pady=(0, 12))
+    ttk.Label(audit_ret, text='Keep in main database (months, 0 = forever):').pack(side='left')
+    retention_var = tk.StringVar(value=str(db.get_setting('audit_retention_months', '0') or '0'))
+    ttk.Spinbox(audit_ret, from_=0, to=120, textvariable=retention_var, width=5).pack(side='left', padx=(6, 12))
+    archive_var = tk.StringVar(value='')
+    ttk.Label(audit_ret, textvariable=archive_var, foreground='#666').pack(side='left')
+
+    def _retention_months():
+        try:
+            return max(0, int(retention_var.get() or 0))
+        except ValueError:
+            return 0
+
+    def archive_audit_now():
+        import threading
+        try:
+            db.require_admin('archive', 'audit_log')
+        except Exception as e:
+            messagebox.showerror('Audit Log', str(e), parent=win)
+            return
+        months = _retention_months()
+        if months <= 0:
+            messagebox.showinfo('Audit Log', 'Set a retention period (months) first.', parent=win)
+            return
+        result = {}
+
+        def _worker():
+            try:
+                result['stats'] = db.archive_audit_logs(months)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        t.start()
+        archive_var.set('Archiving...')
+
+        def _poll():
+            if t.is_alive():
+                win.after(200, _poll)
+                return
+            if 'error' in result:
+                archive_var.set('Archiving failed')
+                messagebox.showerror('Audit Log', f"Failed to archive: {result['error']}", parent=win)
+            else:
+                st = result.get('stats') or {}
+                archive_var.set(f"Moved {st.get('moved', 0)} entries older than {st.get('cutoff')}")
+
+        _poll()
+
+    refresh_breaker_status()
+
     # Actions
     btns = ttk.Frame(container)
     btns.pack(fill='x')
@@ -78,12 +264,18 @@ def open_settings_window(root):
             db.set_setting('default_import_currency', di)
             db.set_setting('default_sale_currency', ds)
             db.set_setting('default_expense_currency', (def_exp_var.get() or b).upper())
+            db.set_setting('audit_retention_months', str(_retention_months()))
             messagebox.showinfo('Saved', 'Settings saved. Newly opened windows will use updated defaults.')
             win.destroy()
         except Exception as e:
             messagebox.showerror('Error', f'Failed to save settings: {e}')
 
     from .theme import themed_button
+    themed_button(fx_load, text='Load FX file...', variant='secondary', command=load_fx_rates_file).pack(side='right')
+    themed_button(key_rot, text='Rotate encryption key', variant='secondary', command=rotate_keys).pack(side='right')
+    themed_button(audit_ret, text='Archive now', variant='secondary', command=archive_audit_now).pack(side='right')
+    themed_button(fx_net, text='Retry now', variant='secondary', command=reset_breaker).pack(side='right')
+    themed_button(fx_net, text='Refresh', variant='secondary', command=refresh_breaker_status).pack(side='right', padx=(0, 8))
     themed_button(btns, text='Save', variant='primary', command=on_save).pack(side='right')
     themed_button(btns, text='Cancel', variant='secondary', command=win.destroy).pack(side='right', padx=(0, 8))
 
@@ -2,6 +2,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import db as db
 
+# purged rows of these tables also leave the blind note index
+_NOTE_ENTITIES = {'imports': 'import', 'expenses': 'expense'}
+
 
 def _rows_for_table(table: str, extra_where: str = ''):
     try:
@@ -103,6 +106,8 @@ def open_trash_window(root):
                     return
                 with db.get_cursor() as (conn, cur):
                     cur.execute(f'DELETE FROM {t} WHERE id=?', (rid,))
+                    if t in _NOTE_ENTITIES and db.remove_note:
+                        db.remove_note(cur, _NOTE_ENTITIES[t], rid)
                     try:
                         db.write_audit('purge', t, str(rid), 'purged via trash UI', cur=cur)
                     except Exception:
@@ -135,9 +135,12 @@ def open_view_expenses_window(root):
     for c in cols:
         tree.heading(c, text=c, command=lambda cc=c: sort_by_column(cc))
 
-    def row_matches(r, q):
+    def row_matches(r, q, note_ids=None, hits=()):
         if not q:
             return True
+        # Indexed word matches first; ids, amounts and substrings are only found by the scan
+        if r.get('id') in hits:
+            return True
         ql = (q or '').lower()
         # Build a composite searchable string across key fields
         try:
@@ -157,7 +160,7 @@ def open_view_expenses_window(root):
             str(r.get('subcategory', '')),
             str(r.get('amount', '')),
             str(r.get('currency', '')),
-            str(r.get('notes', '')),
+            '' if note_ids is not None else str(r.get('notes', '')),
             str(r.get('import_id', '')),
             doc_disp,
             str(r.get('document_path', '')),
@@ -214,11 +217,9 @@ def open_view_expenses_window(root):
                 conn = db.get_conn()
                 cur = conn.cursor()
                 cur.execute('SELECT id, date, amount, is_import_related, import_id, category, notes, document_path, currency, deleted FROM expenses ORDER BY id DESC')
-                rows = [dict(r) for r in cur.fetchall()]
+                # notes decrypt lazily when displayed/searched
+                rows = [db.LazyDecryptRow(r) for r in cur.fetchall()]
                 conn.close()
-                # decrypt notes
-                for r in rows:
-                    r['notes'] = db.decrypt_str(r.get('notes')) if hasattr(db, 'decrypt_str') else r.get('notes')
                 return rows
             except Exception:
                 return []
@@ -232,8 +233,10 @@ def open_view_expenses_window(root):
         records_by_iid.clear()
         count = 0
         total_amount = 0.0
+        q = search_var.get().strip()
+        note_ids, hits = db.search_matches('expense', q)
         for row in _fetch_expenses(include_deleted=show_deleted_var.get()):
-            if row_matches(row, search_var.get().strip()):
+            if row_matches(row, q, note_ids, hits):
                 # Build display values in the friendly order
                 try:
                     doc_list = parse_docs(row.get('document_path', ''))
@@ -90,11 +90,16 @@ def open_view_imports_window(root):
         tree.heading(c, text=c)
     make_treeview_sortable(tree, cols)
 
-    def row_matches(r, q):
+    def row_matches(r, q, note_ids=None, hits=()):
         if not q:
             return True
+        # Indexed word matches first; ids, amounts and substrings are only found by the scan
+        if r.get('id') in hits:
+            return True
         ql = q.lower()
         for c in cols:
+            if c == 'notes' and note_ids is not None:
+                continue
             v = str(r.get(c, '')).lower()
             if ql in v:
                 return True
@@ -116,7 +121,7 @@ def open_view_imports_window(root):
                 conn = db.get_conn()
                 cur = conn.cursor()
                 cur.execute('SELECT id, date, ordered_price, quantity, supplier, notes, category, subcategory, currency, deleted FROM imports ORDER BY id DESC')
-                rows = [dict(r) for r in cur.fetchall()]
+                rows = [db.LazyDecryptRow(r) for r in cur.fetchall()]
                 conn.close()
                 return rows
             except Exception:
@@ -131,8 +136,10 @@ def open_view_imports_window(root):
         # Collect rows that match search, then sort newest->oldest for display
         fetched = list(_fetch_imports(show_deleted_var.get()))
         shown_rows = []
+        q = search_var.get().strip()
+        note_ids, hits = db.search_matches('import', q)
         for row in fetched:
-            if row_matches(row, search_var.get().strip()):
+            if row_matches(row, q, note_ids, hits):
                 shown_rows.append(row)
         # Sort by numeric id if available, otherwise by date string (YYYY-MM-DD) — newest first
         def _sort_key(r):
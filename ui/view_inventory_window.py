@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import db as db
-from .theme import stripe_treeview, maximize_window, apply_theme, themed_button
+from .theme import stripe_treeview, maximize_window, apply_theme, themed_button, ask_string
 
 
 def open_view_inventory_window(root):
@@ -105,20 +105,35 @@ def open_view_inventory_window(root):
     selected_var = tk.StringVar(value='Selected: 0')
     ttk.Label(totals_row, textvariable=selected_var, anchor='e').pack(side='right')
 
+    # Date shown when viewing a past point in time (None = live inventory)
+    as_of_state = {'date': None}
+
+    def _current_rows():
+        d = as_of_state['date']
+        if not d:
+            return db.get_inventory()
+        return [{'category': r['category'], 'subcategory': r['subcategory'],
+                 'quantity': round(r['on_hand'], 4), 'allocated': '',
+                 'value_at_cost': round(r['value_at_cost'], 2), 'last_updated': f'as of {d}'}
+                for r in db.get_inventory_as_of(d)]
+
     def populate():
         for r in tree.get_children():
             tree.delete(r)
         count = 0
         total_qty = 0.0
-        for row in db.get_inventory():
+        total_value = 0.0
+        for row in _current_rows():
             if row_matches(row, search_var.get().strip()):
                 tree.insert('', 0, values=[row.get(c, '') for c in cols])
                 count += 1
                 try:
                     total_qty += float(row.get('quantity') or 0)
+                    total_value += float(row.get('value_at_cost') or 0)
                 except Exception:
                     pass
-        totals_var.set(f"Rows: {count}    Total Qty: {total_qty:.2f}")
+        prefix = f"As of {as_of_state['date']}    " if as_of_state['date'] else ''
+        totals_var.set(f"{prefix}Rows: {count}    Total Qty: {total_qty:.2f}    Value at Cost: {total_value:.2f}")
         try:
             stripe_treeview(tree)
         except Exception:
@@ -133,6 +148,50 @@ def open_view_inventory_window(root):
     def refresh():
         populate()
 
+    def do_rebuild():
+        try:
+            stats = db.rebuild_inventory()
+        except Exception as e:
+            messagebox.showerror('Error', f'Failed to rebuild inventory: {e}', parent=window)
+            return
+        drift = stats.get('drift') or []
+        if not drift:
+            msg = f"Inventory matches the import batches ({stats.get('rows', 0)} rows)."
+        else:
+            lines = [f"{d['category']} / {d['subcategory']}: on hand {d['stored_on_hand']:g} → {d['on_hand']:g}, "
+                     f"value {d['stored_value_at_cost']:.2f} → {d['value_at_cost']:.2f}" for d in drift[:15]]
+            if len(drift) > 15:
+                lines.append(f"… and {len(drift) - 15} more")
+            msg = f"Rebuilt inventory; {len(drift)} row(s) had drifted:\n\n" + "\n".join(lines)
+        messagebox.showinfo('Rebuild Inventory', msg, parent=window)
+        populate()
+
+    def do_as_of():
+        d = ask_string(window, 'Inventory As Of', 'Date (YYYY-MM-DD, empty for current stock):',
+                       initialvalue=as_of_state['date'] or '')
+        if d is None:
+            return
+        d = d.strip()
+        if d:
+            from datetime import datetime as _dt
+            try:
+                _dt.strptime(d, '%Y-%m-%d')
+            except Exception:
+                messagebox.showerror('Invalid date', 'Use the YYYY-MM-DD format.', parent=window)
+                return
+        as_of_state['date'] = d or None
+        populate()
+
+    def do_snapshot():
+        try:
+            snap = db.take_inventory_snapshot(as_of_state['date'])
+        except Exception as e:
+            messagebox.showerror('Error', f'Failed to take snapshot: {e}', parent=window)
+            return
+        messagebox.showinfo('Inventory Snapshot',
+                            f"Snapshot of {snap['as_of']} saved: {snap['batches']} batches, "
+                            f"{snap['on_hand']:g} units, value {snap['value_at_cost']:.2f}.", parent=window)
+
     def on_search_change(event=None):
         populate()
 
@@ -158,4 +217,7 @@ def open_view_inventory_window(root):
         except Exception:
             pass
     themed_button(primary_frame, text='Deselect All', variant='primary', command=lambda: (deselect_all(), _update_selected_badge())).pack(side=tk.LEFT, padx=4)
+    themed_button(secondary_frame, text='Rebuild', variant='secondary', command=do_rebuild).pack(side=tk.RIGHT, padx=4)
+    themed_button(secondary_frame, text='Take Snapshot', variant='secondary', command=do_snapshot).pack(side=tk.RIGHT, padx=4)
+    themed_button(secondary_frame, text='As of…', variant='secondary', command=do_as_of).pack(side=tk.RIGHT, padx=4)
     btns.pack(fill='x', pady=8)
@@ -135,9 +135,19 @@ def open_view_returns_window(root):
                 return []
         return db_list_returns()
 
-    def row_matches(r, q):
+    def _search_hits(q):
+        # Ranked FTS lookup over the return's text columns; None means scan instead
+        try:
+            ids = db.search('return', q, limit=None) if q else None
+        except Exception:
+            ids = None
+        return set(ids) if ids is not None else None
+
+    def row_matches(r, q, hits=None):
         if not q:
             return True
+        if hits is not None:
+            return r.get('id') in hits
         ql = q.lower()
         for c in cols:
             v = str(r.get(c, '') if isinstance(r, dict) else r.get(c, '')).lower()
@@ -179,13 +189,15 @@ def open_view_returns_window(root):
         total_refund = 0.0
         last_rows.clear()
         show_deleted = show_deleted_var.get()
+        q = search_var.get().strip()
+        hits = _search_hits(q)
         for row in _fetch_returns(show_deleted):
             # Convert sqlite Row to dict if needed
             rowd = dict(row) if not isinstance(row, dict) else row
             # Hide deleted returns unless show_deleted is True
             if not show_deleted and int(rowd.get('deleted', 0)) == 1:
                 continue
-            if row_matches(rowd, search_var.get().strip()):
+            if row_matches(rowd, q, hits):
                 vals = [rowd.get(c, '') for c in cols]
                 try:
                     di = cols.index('doc_paths')
@@ -235,6 +247,80 @@ def open_view_returns_window(root):
     def refresh():
         populate()
 
+    import_busy = {'thread': None}
+
+    def do_import_csv():
+        import threading
+        if import_busy['thread'] is not None and import_busy['thread'].is_alive():
+            return
+        path = filedialog.askopenfilename(
+            parent=win,
+            filetypes=[('CSV files', '*.csv'), ('All files', '*.*')],
+            title='Import Returns from CSV'
+        )
+        if not path:
+            return
+        from db.returns_import import import_returns_csv, write_report
+        result = {'done': 0}
+
+        def _progress(done, inserted):
+            result['done'] = done
+
+        # Large files take a while; the import runs on a worker thread while this polls
+        def _worker():
+            try:
+                result['stats'] = import_returns_csv(path, progress=_progress)
+            except Exception as e:
+                result['error'] = e
+
+        t = threading.Thread(target=_worker, daemon=True)
+        import_busy['thread'] = t
+        import_btn.configure(state='disabled', text='Importing...')
+        t.start()
+
+        def _finish():
+            import_btn.configure(state='normal', text='Import CSV')
+            if 'error' in result:
+                messagebox.showerror('Error', f"Failed to import returns: {result['error']}", parent=win)
+                return
+            stats = result['stats']
+            failed = [e for e in stats['report'] if e['status'] == 'error']
+            msg = f"Recorded {stats['inserted']} of {stats['rows']} returns ({stats['restocked_units']:g} units restocked)."
+            if failed:
+                msg += f"\n\n{len(failed)} row(s) failed:\n"
+                msg += "\n".join(f"Row {e['row']} ({e['product_id'] or '-'}): {e['message']}" for e in failed[:10])
+                if len(failed) > 10:
+                    msg += f"\n… and {len(failed) - 10} more"
+                if messagebox.askyesno('Import Returns', msg + '\n\nSave the full report?', parent=win):
+                    report_path = filedialog.asksaveasfilename(
+                        parent=win,
+                        defaultextension='.csv',
+                        filetypes=[('CSV files', '*.csv'), ('All files', '*.*')],
+                        title='Save Import Report'
+                    )
+                    if report_path:
+                        write_report(stats['report'], report_path)
+            else:
+                messagebox.showinfo('Import Returns', msg, parent=win)
+            if stats['inserted']:
+                refresh()
+                try:
+                    win.event_generate('<<ReturnRecorded>>')
+                except Exception:
+                    pass
+
+        def _poll():
+            if not win.winfo_exists():
+                return
+            if t.is_alive():
+                if result['done']:
+                    import_btn.configure(text=f"Importing... {result['done']} rows")
+                win.after(50, _poll)
+                return
+            _finish()
+
+        _poll()
+
     def do_undelete():
         sel = tree.selection()
         if not sel:
@@ -640,6 +726,8 @@ def open_view_returns_window(root):
     btn_frame = ttk.Frame(win)
     btn_frame.pack(fill='x', pady=8)
     themed_button(btn_frame, text='Export CSV', command=do_export_csv).pack(side=tk.LEFT, padx=4)
+    import_btn = themed_button(btn_frame, text='Import CSV', command=do_import_csv)
+    import_btn.pack(side=tk.LEFT, padx=4)
     themed_button(btn_frame, text='Edit', command=do_edit).pack(side=tk.LEFT, padx=4)
     themed_button(btn_frame, text='Delete', command=do_delete).pack(side=tk.LEFT, padx=4)
     themed_button(btn_frame, text='Undelete', command=do_undelete).pack(side=tk.LEFT, padx=4)
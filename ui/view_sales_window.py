@@ -6,11 +6,11 @@ import json
 import sys
 import subprocess
 from .theme import stripe_treeview, maximize_window, themed_button
-import core.fx_rates as fx_rates
+import db as db
 
 # DAO imports
-from db.sales_dao import list_sales, overwrite_sales, mark_sale_deleted, update_sale
-from db.returns_dao import list_returns, insert_return
+from db.sales_dao import mark_sale_deleted, update_sale
+from db.returns_dao import insert_return
 from db.imports_dao import get_sale_batch_info
 
 # Column headers for Treeview / CSV
@@ -21,50 +21,7 @@ DESIRED_COLS = [
     'FXToBase', 'SellingPriceBase', 'SaleCurrency', 'Deleted'
 ]
 
-# ────────────────────────────────
-# Data access wrappers
-# ────────────────────────────────
-
-def read_sales(include_deleted: bool = False):
-    return [_normalize_row_for_ui(r) for r in list_sales(include_deleted=include_deleted)]
-
-def write_sales(rows):
-    return overwrite_sales(rows)
-
-def read_returns():
-    """Fetch returns using DAO."""
-    try:
-        return [ _normalize_row_for_ui(r) for r in list_returns() ]
-    except Exception:
-        try:
-            return list_returns()
-        except Exception:
-            return []
-
-
 def _normalize_row_for_ui(row):
-    # Add VAT analytics fields for display
-    try:
-        vat_rate = float(r.get('vat_rate', 18.0) or 18.0)
-        is_incl = int(r.get('is_vat_inclusive', 1) or 1)
-        amt = float(r.get('selling_price', 0) or 0)
-        if is_incl:
-            net = amt / (1 + vat_rate/100)
-            vat_amt = amt - net
-            gross = amt
-        else:
-            net = amt
-            vat_amt = amt * vat_rate/100
-            gross = amt + vat_amt
-        r['VAT Rate'] = f"{vat_rate:.2f}"
-        r['VAT Amount'] = f"{vat_amt:.2f}"
-        r['Net'] = f"{net:.2f}"
-        r['Gross'] = f"{gross:.2f}"
-    except Exception:
-        r['VAT Rate'] = ''
-        r['VAT Amount'] = ''
-        r['Net'] = ''
-        r['Gross'] = ''
     """Return a copy of the DB row that contains both snake_case and TitleCase keys
     so the legacy UI can read either shape."""
     try:
@@ -100,6 +57,28 @@ def _normalize_row_for_ui(row):
                 r[db_k] = r.get(ui_k)
             except Exception:
                 r[db_k] = r.get(ui_k)
+    # Add VAT analytics fields for display
+    try:
+        vat_rate = float(r.get('vat_rate') if r.get('vat_rate') is not None else 18.0)
+        is_incl = int(r.get('is_vat_inclusive') if r.get('is_vat_inclusive') is not None else 1)
+        amt = float(r.get('selling_price', 0) or 0)
+        if is_incl:
+            net = amt / (1 + vat_rate/100)
+            vat_amt = amt - net
+            gross = amt
+        else:
+            net = amt
+            vat_amt = amt * vat_rate/100
+            gross = amt + vat_amt
+        r['VAT Rate'] = f"{vat_rate:.2f}"
+        r['VAT Amount'] = f"{vat_amt:.2f}"
+        r['Net'] = f"{net:.2f}"
+        r['Gross'] = f"{gross:.2f}"
+    except Exception:
+        r['VAT Rate'] = ''
+        r['VAT Amount'] = ''
+        r['Net'] = ''
+        r['Gross'] = ''
     return r
 
 
@@ -162,7 +141,8 @@ def open_view_sales_window(root):
     return_combo.pack(side='left', padx=(0, 8))
 
     show_deleted_var = tk.BooleanVar(value=False)
-    show_deleted_cb = ttk.Checkbutton(filter_frame, text='Show Deleted', variable=show_deleted_var)
+    show_deleted_cb = ttk.Checkbutton(filter_frame, text='Show Deleted', variable=show_deleted_var,
+                                      command=lambda: refresh())
     show_deleted_cb.pack(side='left', padx=(0, 8))
 
     # Table
@@ -172,11 +152,15 @@ def open_view_sales_window(root):
         'Platform', 'ProductID', 'CustomerID', 'DocumentPath',
         'FXToBase', 'SellingPriceBase', 'SaleCurrency', 'Deleted'
     ]
-    tree = ttk.Treeview(main_container, columns=cols, show='headings', height=20, selectmode='extended')
+    table_frame = ttk.Frame(main_container)
+    table_frame.pack(fill='both', expand=True)
+    tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=20, selectmode='extended')
     for col in cols:
         tree.heading(col, text=col)
         tree.column(col, width=90, minwidth=60)
-    tree.pack(fill='both', expand=True)
+    vsb = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+    vsb.pack(side='right', fill='y')
+    tree.pack(side='left', fill='both', expand=True)
 
     # Totals and status
     totals_var = tk.StringVar(value='')
@@ -187,64 +171,7 @@ def open_view_sales_window(root):
     selected_label = ttk.Label(main_container, textvariable=selected_var, font=('', 9))
     selected_label.pack(anchor='w', pady=(0, 8))
 
-    # Initial data
-    rows = [ _normalize_row_for_ui(r) for r in read_sales(include_deleted=show_deleted_var.get()) ]
-
-    # Helper filter functions for analytics
-    def compute_year_options(rows):
-        years = set()
-        for r in rows:
-            try:
-                y = str(r.get('Date', '')).split('-')[0]
-                if y and y.isdigit():
-                    years.add(y)
-            except Exception:
-                pass
-        years = sorted(years, reverse=True)
-        return ['All'] + years
-
-    def row_matches_year(r, yy):
-        if yy == 'All':
-            return True
-        try:
-            return str(r.get('Date', '')).startswith(str(yy))
-        except Exception:
-            return False
-
-    def row_matches_search(r, q):
-        if not q:
-            return True
-        q = q.lower()
-        for v in r.values():
-            try:
-                if q in str(v).lower():
-                    return True
-            except Exception:
-                pass
-        return False
-
-    def row_matches_returned(r, return_filter, returned_ids):
-        pid = (r.get('ProductID') or '').strip()
-        if return_filter == 'All':
-            return True
-        elif return_filter == 'Returned':
-            return pid in returned_ids
-        elif return_filter == 'Not Returned':
-            return pid not in returned_ids
-        return True
-
     # --- Helper functions section (now after all variables/widgets are defined) ---
-    def get_customer_name_mapping():
-        """Create mapping from customer ID to customer name."""
-        try:
-            import db as db
-            customers = db.read_customers()
-            return {c.get('customer_id', ''): c.get('name', '') for c in customers}
-        except Exception:
-            return {}
-
-    customer_names = get_customer_name_mapping()
-
     def parse_docs(val):
         """Parse DocumentPath value into a list of paths (supports JSON array or single string)."""
         if val is None:
@@ -271,128 +198,117 @@ def open_view_sales_window(root):
                 cleaned.append(s)
         return json.dumps(cleaned, ensure_ascii=False)
 
-    def populate_tree(all_rows, yy, q=''):
-        for r in tree.get_children():
-            tree.delete(r)
-        # Insert rows using original indices as iids so edits/deletes map correctly
-        shown = 0
-        total_sell = 0.0
-        total_sell_usd = 0.0
-        computed_usd_count = 0
-        total_vat = 0.0
-        total_net = 0.0
-        total_gross = 0.0
-        returned_ids = set()
-        try:
-            for rr in read_returns():
-                pid = (rr.get('ProductID') or '').strip()
-                if pid:
-                    returned_ids.add(pid)
-        except Exception:
-            returned_ids = set()
-        for idx, r in enumerate(all_rows):
-            is_returned = (r.get('ProductID') or '').strip() in returned_ids
-            if row_matches_year(r, yy) and row_matches_search(r, q) and row_matches_returned(r, return_var.get(), returned_ids):
-                vals = [r.get(c, '') for c in cols]
-                # Mark returned items visually
-                try:
-                    pid_idx = cols.index('ProductID')
-                    pidv = str(vals[pid_idx])
-                    if pidv in returned_ids:
-                        vals[pid_idx] = pidv + ' (Returned)'
-                except Exception:
-                    pass
-                try:
-                    customer_idx = cols.index('CustomerID')
-                    customer_id = str(vals[customer_idx])
-                    if customer_id and customer_id in customer_names:
-                        vals[customer_idx] = f"{customer_names[customer_id]}"
-                    elif customer_id and customer_id.strip():
-                        vals[customer_idx] = f"{customer_id} (Unknown)"
-                    else:
-                        vals[customer_idx] = ""
-                except Exception:
-                    pass
-                try:
-                    doc_idx = cols.index('DocumentPath')
-                    doc_raw = r.get('DocumentPath', '')
-                    doc_list = parse_docs(doc_raw)
-                    if len(doc_list) == 0:
-                        vals[doc_idx] = ''
-                    elif len(doc_list) == 1:
-                        vals[doc_idx] = doc_list[0]
-                    else:
-                        vals[doc_idx] = f"{len(doc_list)} docs"
-                except Exception:
-                    pass
-                # Insert row and apply tag for returned
-                tag = 'returned' if is_returned else ''
-                # If the row has an 'id' field (from DB), use it as iid so actions map to DB ids.
-                iid_val = str(r.get('id')) if r.get('id') is not None else str(idx)
-                tree.insert('', 0, iid=iid_val, values=vals, tags=(tag,))
-                shown += 1
-                # Only count non-returned sales in totals
-                if not is_returned:
-                    try:
-                        total_sell += float(r.get('SellingPrice') or 0)
-                        total_vat += float(r.get('VAT Amount') or 0)
-                        total_net += float(r.get('Net') or 0)
-                        total_gross += float(r.get('Gross') or 0)
-                    except Exception:
-                        pass
-                    usd_val = None
-                    try:
-                        usd_val = float(r.get('SellingPriceUSD')) if r.get('SellingPriceUSD') not in (None, '') else None
-                    except Exception:
-                        usd_val = None
-                    if usd_val is None:
-                        try:
-                            rate = fx_rates.get_rate_for_date(str(r.get('Date') or '').strip())
-                            if rate and rate > 0:
-                                usd_val = float(r.get('SellingPrice') or 0) / float(rate)
-                                computed_usd_count += 1
-                        except Exception:
-                            usd_val = None
-                    if usd_val is not None:
-                        try:
-                            total_sell_usd += float(usd_val)
-                        except Exception:
-                            pass
-        suffix = f" (computed {computed_usd_count} from rates)" if computed_usd_count else ""
-        totals_var.set(f"Items: {shown}    Net: {total_net:.2f}    KDV: {total_vat:.2f}    Gross: {total_gross:.2f}    Total Selling (TRY): {total_sell:.2f}    Total Selling (USD): {total_sell_usd:.2f}{suffix}")
+    # Newest first; filtering, totals and paging happen in SQL (db.query_sales)
+    PAGE_SIZE = 200
+    page = {'filters': {}, 'cursor': None, 'done': False, 'count': 0, 'pending': False, 'search_job': None}
+
+    def current_filters():
+        yy = year_var.get()
+        ret = return_var.get()
+        return {
+            'year': yy if yy and yy != 'All' else None,
+            'search': search_var.get().strip() or None,
+            'returned': {'Returned': 'returned', 'Not Returned': 'not_returned'}.get(ret),
+            'include_deleted': bool(show_deleted_var.get()),
+        }
+
+    def row_values(r):
+        vals = [r.get(c, '') for c in cols]
+        # Order lines show their product-ID range
+        pid = r.get('ProductID') or ''
+        if r.get('product_id_last') and r.get('product_id_last') != pid:
+            pid = f"{pid} … {r.get('product_id_last')}"
+        vals[cols.index('ProductID')] = pid
+        # Mark returned items visually
+        returned_units = int(r.get('returned_units') or 0)
+        if r.get('order_id') and 0 < returned_units < float(r.get('Quantity') or 0):
+            vals[cols.index('ProductID')] = f"{pid} ({returned_units} returned)"
+        elif r.get('is_returned'):
+            vals[cols.index('ProductID')] = f"{pid} (Returned)"
+        customer_id = str(r.get('CustomerID') or '').strip()
+        if r.get('customer_name'):
+            vals[cols.index('CustomerID')] = r.get('customer_name')
+        elif customer_id:
+            vals[cols.index('CustomerID')] = f"{customer_id} (Unknown)"
+        else:
+            vals[cols.index('CustomerID')] = ''
+        doc_list = parse_docs(r.get('DocumentPath', ''))
+        if len(doc_list) == 0:
+            vals[cols.index('DocumentPath')] = ''
+        elif len(doc_list) == 1:
+            vals[cols.index('DocumentPath')] = doc_list[0]
+        else:
+            vals[cols.index('DocumentPath')] = f"{len(doc_list)} docs"
+        return vals
+
+    def show_totals(t):
+        # Totals cover every matching sale (not just loaded pages); returned sales are excluded
+        suffix = f" ({t['usd_missing']} without a cached USD rate)" if t.get('usd_missing') else ""
+        totals_var.set(f"Items: {t['units']:g}    Net: {t['net']:.2f}    KDV: {t['vat_amount']:.2f}    "
+                       f"Gross: {t['gross']:.2f}    Total Selling (TRY): {t['selling_price']:.2f}    "
+                       f"Total Selling (USD): {t['selling_price_usd']:.2f}{suffix}")
+
+    def load_page():
+        page['pending'] = False
+        if page['done']:
+            return
+        res = db.query_sales(page['filters'], page_size=PAGE_SIZE, cursor=page['cursor'])
+        for r in res['rows']:
+            r = _normalize_row_for_ui(r)
+            tag = 'returned' if r.get('is_returned') else ''
+            tree.insert('', 'end', iid=str(r.get('id')), values=row_values(r), tags=(tag,))
+        if res['totals'] is not None:
+            show_totals(res['totals'])
+        page['cursor'] = res['next_cursor']
+        page['done'] = res['next_cursor'] is None
+        page['count'] += len(res['rows'])
         # Highlight returned rows — make them more visually noticeable
         try:
             # Apply striping first, then override returned tag so it stands out
             stripe_treeview(tree)
             # Stronger background and amber text, bold font for emphasis (distinct from error red)
             tree.tag_configure('returned', background='#fff9e6', foreground='#8a6d00', font=('', 9, 'bold'))
-            # Also configure a visible border-like highlight when possible
-            # (Some themes may ignore font or foreground on Treeview tags; this still helps on most platforms)
         except Exception:
             try:
                 tree.tag_configure('returned', background='#fff4cc')
             except Exception:
                 pass
 
+    def on_yscroll(first, last):
+        vsb.set(first, last)
+        # near the bottom: fetch the next page once the current one is drawn
+        if not page['done'] and not page['pending'] and float(last) >= 0.95:
+            page['pending'] = True
+            win.after_idle(load_page)
+
+    tree.configure(yscrollcommand=on_yscroll)
+
     def refresh():
-        new_rows = [ _normalize_row_for_ui(r) for r in read_sales(include_deleted=show_deleted_var.get()) ]
-        # Refresh year options (in case new prefixes were added)
-        vals = compute_year_options(new_rows)
+        # Refresh year options (in case new years were added)
+        vals = ['All'] + db.get_sale_years(include_deleted=show_deleted_var.get())
         year_combo['values'] = vals
         if year_var.get() not in vals:
             year_combo.set('All')
-        populate_tree(new_rows, year_var.get(), search_var.get().strip())
+        tree.delete(*tree.get_children())
+        page.update(filters=current_filters(), cursor=None, done=False, count=0)
+        load_page()
         try:
             selected_var.set('Selected: 0')
         except Exception:
             pass
 
     def on_year_change(event=None):
-        # Re-populate using current file content and selected filter
         refresh()
 
     def on_search_change(event=None):
-        refresh()
+        # Debounce keystrokes: query once typing pauses
+        if page['search_job'] is not None:
+            win.after_cancel(page['search_job'])
+        def _run():
+            page['search_job'] = None
+            refresh()
+        page['search_job'] = win.after(250, _run)
+
     def on_return_change(event=None):
         refresh()
 
@@ -405,6 +321,20 @@ def open_view_sales_window(root):
         except Exception:
             return None
 
+    def fetch_sale(sale_id):
+        """One sale (with is_returned/return_id) by id, normalized for the UI, or None."""
+        try:
+            r = db.get_sale(sale_id)
+        except Exception:
+            r = None
+        return _normalize_row_for_ui(r) if r else None
+
+    def sale_id_for_product(pidv):
+        """Sale id of the line holding a ProductID cell value (suffixes stripped), or None."""
+        pid = str(pidv or '').split(' ')[0].strip()
+        line = db.find_sale_line(pid) if pid else None
+        return int(line['id']) if line else None
+
     def _update_selected_badge(event=None):
         try:
             selected_var.set(f"Selected: {len(tree.selection())}")
@@ -439,11 +369,9 @@ def open_view_sales_window(root):
                     vals = tree.item(iid).get('values', ())
                     pid_idx = cols.index('ProductID') if 'ProductID' in cols else 0
                     pidv = vals[pid_idx] if pid_idx < len(vals) else None
-                    if pidv:
-                        all_rows = read_sales(include_deleted=True)
-                        found = next((r for r in all_rows if str(r.get('ProductID','')) == str(pidv)), None)
-                        if found and found.get('id'):
-                            ids.append(int(found.get('id')))
+                    found = sale_id_for_product(pidv)
+                    if found:
+                        ids.append(found)
                 except Exception:
                     pass
         if not ids:
@@ -483,35 +411,15 @@ def open_view_sales_window(root):
             if any_done:
                 refresh()
             return
-        except Exception:
-            # Fall back to CSV editing when DB path not available
-            rows = read_sales()
-            changed = False
-            for r in rows:
-                try:
-                    if str(r.get('id')) in [str(x) for x in ids] or (r.get('ProductID') and str(r.get('ProductID')) in [str(x) for x in ids]):
-                        r['Deleted'] = '1'
-                        changed = True
-                except Exception:
-                    pass
-            if changed:
-                try:
-                    write_sales(rows)
-                except Exception:
-                    pass
-                refresh()
+        except Exception as e:
+            messagebox.showerror('Error', f'Failed to delete: {e}')
 
     def do_mark_returned():
         idx = get_selected_index()
         if idx is None:
             messagebox.showwarning('Select', 'Select a row first')
             return
-        try:
-            import db as db
-            rows = [ _normalize_row_for_ui(r) for r in db.list_sales(include_deleted=True) ]
-            rec = next((r for r in rows if r.get('id') == idx), None)
-        except Exception:
-            rec = None
+        rec = fetch_sale(idx)
         if not rec:
             messagebox.showerror('Error', 'Invalid selection or sale not found')
             return
@@ -531,13 +439,21 @@ def open_view_sales_window(root):
                     return str(v).strip()
             return ''
 
-        # Prevent duplicate returns for same product id
-        existing = { (r.get('ProductID') or '').strip() for r in read_returns() }
-        try:
-            print(f"[DEBUG] existing returns PIDs count={len(existing)} sample={list(existing)[:5]}")
-        except Exception:
-            pass
+        # Prevent duplicate returns for same product id (only this sale's returns are read)
+        existing = { (r.get('product_id') or '').strip() for r in db.list_returns_for_sale(idx) } if rec.get('return_id') else set()
         pid = _pick('product_id', 'ProductID')
+        if rec.get('order_id') and float(rec.get('quantity') or 0) > 1:
+            # An order line covers several units; ask which one came back
+            open_ids = [p for p in db.expand_product_ids(rec) if p not in existing]
+            pid = simpledialog.askstring('Product ID', 'Product ID of the returned unit:',
+                                         initialvalue=open_ids[0] if open_ids else pid, parent=win)
+            if not pid:
+                return
+            pid = pid.strip()
+            line = db.find_sale_line(pid)
+            if not line or line.get('id') != rec.get('id'):
+                messagebox.showerror('Invalid Product ID', f'{pid} is not part of this sale.')
+                return
         if pid in existing:
             if not messagebox.askyesno('Already returned', 'This Product ID already has a return recorded. Record another return anyway?'):
                 return
@@ -715,22 +631,12 @@ def open_view_sales_window(root):
         if idx is None:
             messagebox.showwarning('Select', 'Select a row first')
             return
-        try:
-            import db as db
-            rows = [ _normalize_row_for_ui(r) for r in db.list_sales(include_deleted=True) ]
-            rec = next((r for r in rows if r.get('id') == idx), None)
-        except Exception:
-            rec = None
+        rec = fetch_sale(idx)
         if not rec:
             messagebox.showerror('Error', 'Invalid selection index')
             return
         # Prevent editing core sale if returned
-        try:
-            returned = { (r.get('ProductID') or '').strip() for r in read_returns() }
-        except Exception:
-            returned = set()
-        pid = (rec.get('ProductID') or '').strip()
-        if pid in returned:
+        if rec.get('is_returned'):
             messagebox.showinfo('Not allowed', 'This sale has a recorded return and cannot be edited. You can delete the return first if needed.')
             return
 
@@ -752,11 +658,13 @@ def open_view_sales_window(root):
         add_field('Date (YYYY-MM-DD):', 'Date')
         add_field('Category:', 'Category')
         add_field('Subcategory (optional):', 'Subcategory')
-        add_field('Quantity:', 'Quantity')
+        # an order line's quantity and product IDs are its serial range and allocations
+        is_line = rec.get('order_id') is not None
+        add_field('Quantity:', 'Quantity', disabled=is_line)
         # SellingPrice is stored per-unit; allow editing SellingPrice directly
         add_field('Selling Price (per unit):', 'SellingPrice')
         add_field('Platform:', 'Platform')
-        add_field('Product ID:', 'ProductID')
+        add_field('Product ID:', 'ProductID', disabled=is_line)
         add_field('Customer ID:', 'CustomerID')
         # DocumentPath with Browse button
         ttk.Label(dlg, text='Related Document (path):').pack(pady=4)
@@ -808,40 +716,20 @@ def open_view_sales_window(root):
             customer_id = entries['CustomerID'].get().strip()
             docp = entries['DocumentPath'].get().strip()
 
-            # Persist changes via DB helper
-            try:
-                import db as db
-                db.update_sale(idx, {
-                    'date': d,
-                    'category': cat,
-                    'subcategory': sub,
-                    'quantity': qty,
-                    'selling_price': selling_price,
-                    'platform': platform,
-                    'product_id': pid,
-                    'customer_id': customer_id,
-                    'document_path': docp,
-                })
-            except Exception:
-                # Fallback to CSV overwrite
-                rows = read_sales()
-                try:
-                    found_i = next((i for i, r in enumerate(rows) if r.get('id') == idx), None)
-                    if found_i is not None:
-                        rows[found_i] = {
-                            'Date': d,
-                            'Category': cat,
-                            'Subcategory': sub,
-                            'Quantity': qty,
-                            'SellingPrice': selling_price,
-                            'Platform': platform,
-                            'ProductID': pid,
-                            'CustomerID': customer_id,
-                            'DocumentPath': docp,
-                        }
-                        write_sales(rows)
-                except Exception:
-                    pass
+            # Persist changes via DB helper (it logs the error and returns False)
+            if not db.update_sale(idx, {
+                'date': d,
+                'category': cat,
+                'subcategory': sub,
+                'quantity': qty,
+                'selling_price': selling_price,
+                'platform': platform,
+                'product_id': pid,
+                'customer_id': customer_id,
+                'document_path': docp,
+            }):
+                messagebox.showerror('Error', 'Failed to save sale; nothing was changed.', parent=dlg)
+                return
             dlg.destroy()
             refresh()
 
@@ -872,8 +760,7 @@ def open_view_sales_window(root):
         if idx is None:
             messagebox.showwarning('Select', 'Select a row first')
             return
-        rows = read_sales()
-        rec = next((r for r in rows if r.get('id') == idx), None)
+        rec = fetch_sale(idx)
         if not rec:
             messagebox.showerror('Error', 'Invalid selection index', parent=win)
             return
@@ -952,19 +839,9 @@ def open_view_sales_window(root):
                     pass
 
         def save_and_close():
-            # Prefer DB update
-            try:
-                import db as db
-                db.update_sale(idx, {'document_path': format_docs(docs)})
-            except Exception:
-                rows2 = read_sales()
-                # fallback to index-based update for CSV
-                try:
-                    if 0 <= idx < len(rows2):
-                        rows2[idx]['DocumentPath'] = format_docs(docs)
-                        write_sales(rows2)
-                except Exception:
-                    pass
+            if not db.update_sale(idx, {'document_path': format_docs(docs)}):
+                messagebox.showerror('Error', 'Failed to save documents; nothing was changed.', parent=dlg)
+                return
             dlg.destroy()
             refresh()
 
@@ -1004,12 +881,7 @@ def open_view_sales_window(root):
             messagebox.showwarning('Select', 'Select a row first')
             return
         
-        try:
-            import db as db
-            rows = [ _normalize_row_for_ui(r) for r in db.list_sales(include_deleted=True) ]
-            rec = next((r for r in rows if r.get('id') == idx), None)
-        except Exception:
-            rec = None
+        rec = fetch_sale(idx)
         if not rec:
             messagebox.showerror('Error', 'Invalid selection or sale not found')
             return
@@ -1018,7 +890,6 @@ def open_view_sales_window(root):
             messagebox.showwarning('No Product ID', 'This sale has no Product ID')
             return
         try:
-            import db as db
             allocations = get_sale_batch_info(product_id)
             show_batch_info_dialog(product_id, allocations)
         except Exception as e:
@@ -1132,11 +1003,9 @@ def open_view_sales_window(root):
                     vals = tree.item(iid).get('values', ())
                     pid_idx = cols.index('ProductID') if 'ProductID' in cols else 0
                     pidv = vals[pid_idx] if pid_idx < len(vals) else None
-                    if pidv:
-                        all_rows = read_sales(include_deleted=True)
-                        found = next((r for r in all_rows if str(r.get('ProductID','')) == str(pidv)), None)
-                        if found and found.get('id'):
-                            ids.append(int(found.get('id')))
+                    found = sale_id_for_product(pidv)
+                    if found:
+                        ids.append(found)
                 except Exception:
                     pass
         if not ids:
@@ -1161,3 +1030,5 @@ def open_view_sales_window(root):
     def on_return_undone(event=None):
         refresh()
     win.bind('<<ReturnUndone>>', on_return_undone)
+
+    refresh()